@@ -2,9 +2,16 @@
 A package that holds the abstract classes of the Agent.
 """
 
-__all__ = ["Agent", "MemoryAgent"]
+__all__ = [
+    "Agent",
+    "KernelPool",
+    "MemoryAgent",
+    "WarmKernel",
+    "kernel_pool",
+]
 __author__ = "Ricardo Cataldi"
 __version__ = "0.1.0"
 __status__ = "In Development"
 
-from .agents import Agent, MemoryAgent
\ No newline at end of file
+from .agents import Agent, MemoryAgent
+from .pool import KernelPool, WarmKernel, kernel_pool
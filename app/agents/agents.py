@@ -1,17 +1,34 @@
 from __future__ import annotations
 
+import time
 import uuid
 from abc import ABC, abstractmethod
-from typing import Dict, Callable, Coroutine, Any, Optional, List, Type
+from typing import (
+    Dict, Callable, Coroutine, Any, Optional, List, Type, AsyncIterator
+)
 
-import tiktoken
 import semantic_kernel as sk
 from semantic_kernel.kernel import KernelFunction
 from semantic_kernel.connectors.ai.open_ai import AzureChatCompletion
 
+from app.monitoring import registry, span
 from app.schemas.agents import ChatSchema
+from app.agents.pool import KernelPool, WarmKernel, kernel_pool
 from app.tools.memories import CosmosAbstractMemory
-from app.tools.embeddings import GPTEmbeddingGenerator
+from app.tools.caches import (
+    CompletionCache,
+    CompletionProbe,
+    Versions,
+    embedding_generator,
+)
+from app.tools.limits import DeploymentLimiter, rate_limiter, throttled
+from app.tools.packing import ContextPacker
+from app.tools.retrievers import (
+    MemoryRetriever,
+    Retriever,
+    fan_out_passages,
+)
+from app.utils.tokens import count_tokens, encode
 
 
 ASYNC_CALLABLE = Coroutine[Any, Callable[..., str], str]
@@ -19,21 +36,40 @@ ASYNC_CALLABLE = Coroutine[Any, Callable[..., str], str]
 
 class Agent(ABC):
 
+    completions: Optional[CompletionCache] = None
+    priority: int = 0
+    queue_deadline: Optional[float] = 60.0
+
     def __init__(
         self,
         *args,
         chat_id: Optional[uuid.UUID] = None,
+        pooled: bool = True,
         **kwargs
     ) -> None:
         """
         Initializes the Agent class.
 
+        Args:
+            chat_id (Optional[uuid.UUID]): The chat the agent answers in.
+            pooled (bool): Whether to reuse the warm kernels of the process
+                pool. Agents given kernel arguments always build their own.
+
         Returns:
             None
         """
 
         self._id: uuid.UUID = chat_id or uuid.uuid4()
-        self.kernel = sk.Kernel(*args, **kwargs)
+        self.pool: Optional[KernelPool] = (
+            kernel_pool() if pooled and not args and not kwargs else None
+        )
+        self._warm: Optional[WarmKernel] = None
+        self._memory: Optional[CosmosAbstractMemory] = None
+        self._deployment: str = ''
+        self._limiter: Optional[DeploymentLimiter] = None
+        self.kernel = (
+            self.pool.bare() if self.pool else sk.Kernel(*args, **kwargs)
+        )
         self.context = self.kernel.create_new_context()
         self.response: Dict[str, Any] = {'chat_id': str(self._id)}
 
@@ -58,12 +94,252 @@ class Agent(ABC):
         """
 
         self._config_service(chat_name, *args)
+        probe = await self._probe_cache(chat_name, prompt, kwargs)
+        if probe is not None and probe.payload is not None:
+            return self.response
         semantic_function: KernelFunction = await self.prompt(prompt, **kwargs)
-        chat_answer = await semantic_function(context=self.context)
-        self.response['completion_tokens'] = len(self._encode(chat_answer.result))
+        with span('llm'):
+            chat_answer = await self._invoke(
+                semantic_function, prompt, kwargs
+            )
+        with span('tokens'):
+            self.response['completion_tokens'] = count_tokens(
+                chat_answer.result
+            )
         self.response.update({'response': chat_answer.result})
+        self._fill_cache(probe)
         return self.response
 
+    async def stream(
+        self,
+        chat_name: str,
+        prompt: str,
+        *args,
+        **kwargs
+    ) -> AsyncIterator[str]:
+        """
+        Streaming counterpart of `__call__`: yields the completion as it is
+        generated and counts its tokens incrementally. Once exhausted,
+        `self.response` holds the same payload `__call__` returns.
+
+        Args:
+            chat_name (str): Name of the chat service to configure.
+            prompt (str): The user prompt.
+            *args: Variable length argument list.
+            **kwargs: Arbitrary keyword arguments.
+
+        Yields:
+            str: The completion chunks, in order.
+        """
+
+        self._config_service(chat_name, *args)
+        probe = await self._probe_cache(chat_name, prompt, kwargs)
+        if probe is not None and probe.payload is not None:
+            yield self.response['response']
+            return
+        semantic_function: KernelFunction = await self.prompt(
+            prompt, **kwargs
+        )
+        chunks: List[str] = []
+        completion_tokens = 0
+        started = time.perf_counter_ns()
+        if self._limiter is not None:
+            await self._limiter.acquire(
+                self._estimated_tokens(prompt, kwargs),
+                self.priority,
+                self.queue_deadline,
+            )
+        with span('llm.stream'):
+            try:
+                async for chunk in semantic_function.invoke_stream(
+                    context=self.context
+                ):
+                    text = self._chunk_text(chunk)
+                    if not text:
+                        continue
+                    if not chunks:
+                        registry().observe(
+                            'llm.first_token',
+                            time.perf_counter_ns() - started,
+                        )
+                    chunks.append(text)
+                    completion_tokens += len(self._encode(text))
+                    yield text
+            except Exception as error:
+                retry_after = throttled(error)
+                if self._limiter is not None and retry_after is not None:
+                    self._limiter.throttle(retry_after)
+                raise
+        if self._limiter is not None:
+            self._limiter.succeeded()
+        self.response['completion_tokens'] = completion_tokens
+        self.response.update({'response': ''.join(chunks)})
+        self._fill_cache(probe)
+
+    def _estimated_tokens(
+        self, prompt: str, settings: Dict[str, Any]
+    ) -> int:
+        """
+        The tokens the deployment charges the request against its quota:
+        the template, the prompt, the packed context and the max_tokens
+        reserved for the completion.
+        """
+        context = self.response.get('context')
+        return (
+            count_tokens(getattr(self, 'prompt_template', ''))
+            + count_tokens(prompt)
+            + (context['tokens'] if isinstance(context, dict) else 0)
+            + settings.get('max_tokens', 0)
+        )
+
+    async def _invoke(
+        self,
+        semantic_function: KernelFunction,
+        prompt: str,
+        settings: Dict[str, Any]
+    ) -> Any:
+        """
+        Invokes the semantic function once the deployment's rate limiter
+        admits it, retrying it when the deployment answers with a 429.
+
+        Args:
+            semantic_function (KernelFunction): The function to invoke.
+            prompt (str): The user prompt.
+            settings (Dict[str, Any]): The request settings of the
+                function.
+
+        Returns:
+            Any: The context holding the completion.
+        """
+        async def invoke() -> Any:
+            answer = await semantic_function(context=self.context)
+            error = getattr(answer, 'last_exception', None)
+            if answer.error_occurred and throttled(error) is not None:
+                raise error
+            return answer
+
+        if self._limiter is None:
+            return await invoke()
+        return await self._limiter.run(
+            invoke,
+            self._estimated_tokens(prompt, settings),
+            self.priority,
+            self.queue_deadline,
+        )
+
+    def _cache_versions(self) -> Versions:
+        """
+        The versions of the data the agent's answers depend on. A cached
+        answer is only served while they are unchanged.
+        """
+        return ()
+
+    async def _probe_cache(
+        self,
+        chat_name: str,
+        prompt: str,
+        settings: Dict[str, Any]
+    ) -> Optional[CompletionProbe]:
+        """
+        Looks the prompt up in the completion cache, if the agent has one.
+        On a hit the cached completion is copied into the response.
+        """
+        if self.completions is None:
+            return None
+        scope = '\x00'.join((
+            type(self).__qualname__,
+            getattr(self._memory, 'store_id', ''),
+            self._deployment or chat_name,
+            getattr(self, 'prompt_template', ''),
+            repr(sorted(settings.items())),
+        ))
+        with span('cache'):
+            probe = await self.completions.probe(
+                scope, prompt, self._cache_versions()
+            )
+        if probe.payload is not None:
+            self.response.update(probe.payload)
+            self.response['cache'] = probe.tier
+        return probe
+
+    def _fill_cache(self, probe: Optional[CompletionProbe]) -> None:
+        if probe is not None and self.completions is not None:
+            self.completions.put(probe, {
+                'response': self.response['response'],
+                'completion_tokens': self.response['completion_tokens'],
+            })
+
+    @staticmethod
+    def _chunk_text(chunk: Any) -> str:
+        """
+        Extracts the text of a streamed chunk, whatever shape the connector
+        yields it in.
+        """
+        if isinstance(chunk, (list, tuple)):
+            return ''.join(Agent._chunk_text(item) for item in chunk)
+        if chunk is None:
+            return ''
+        return chunk if isinstance(chunk, str) else str(chunk)
+
+    def _use_services(
+        self,
+        chat_name: Optional[str] = None,
+        completion: Type[AzureChatCompletion] = AzureChatCompletion,
+        schema: Optional[ChatSchema] = None
+    ) -> None:
+        """
+        Gives the agent a kernel with the chat service, and the memory set
+        by `_chat_history`, registered. Pooled agents switch to the warm
+        kernel of the pool, keeping the variables of their own context.
+
+        Args:
+            chat_name (Optional[str]): Name of the chat service to
+                configure.
+            completion (Type[AzureChatCompletion]): The chat completion
+                connector.
+            schema (Optional[ChatSchema]): The deployment of the chat
+                service.
+        """
+        schema = schema if schema is not None else ChatSchema()
+        if chat_name is not None:
+            self._deployment = f"{chat_name}:{schema.deployment_name}"
+            self._limiter = rate_limiter(schema)
+        if self.pool is None:
+            if chat_name is not None:
+                self.kernel.add_chat_service(
+                    chat_name, completion(**schema.model_dump())
+                )
+            return
+        self._warm = self.pool.acquire(
+            chat_name,
+            completion,
+            schema if chat_name is not None else None,
+            self._memory,
+            embedding_generator() if self._memory is not None else None,
+        )
+        self.kernel = self._warm.kernel
+        self.context = self.kernel.create_new_context(
+            variables=self.context.variables
+        )
+
+    def _semantic_function(
+        self, template: str, **kwargs
+    ) -> KernelFunction:
+        """
+        Returns the semantic function of the template, compiled once per
+        warm kernel when the agent is pooled.
+
+        Args:
+            template (str): The prompt template.
+            **kwargs: The request settings of the function.
+
+        Returns:
+            KernelFunction: The semantic function.
+        """
+        if self._warm is not None:
+            return self._warm.function(template, **kwargs)
+        return self.kernel.create_semantic_function(template, **kwargs)
+
     @abstractmethod
     def _config_service(
             self, chat_name: str,
@@ -109,12 +385,17 @@ class Agent(ABC):
         Returns:
             List[int]: The encoded input.
         """
-        encoder = tiktoken.get_encoding("cl100k_base")
-        return encoder.encode(input)
+        return encode(input)
 
 
 class MemoryAgent(Agent):
 
+    memory_collection: str = 'ragMemory'
+    retrieval_timeout: float = 5.0
+    retrieval_deadline: float = 10.0
+    context_window: int = 8_192
+    packer: Optional[ContextPacker] = None
+
     def _chat_history(self, memory: CosmosAbstractMemory) -> None:
         """
         Adds a AI service to the kernel.
@@ -126,4 +407,109 @@ class MemoryAgent(Agent):
         Returns:
             None
         """
-        self.kernel.use_memory(memory, embeddings_generator=GPTEmbeddingGenerator())
+        self._memory = memory
+        if self.pool is None:
+            self.kernel.use_memory(
+                memory, embeddings_generator=embedding_generator()
+            )
+
+
+    def _cache_versions(self) -> Versions:
+        version = getattr(self._memory, 'collection_version', None)
+        if version is None:
+            return ()
+        return ((self.memory_collection, version(self.memory_collection)),)
+
+    def retrievers(self) -> Dict[str, Retriever]:
+        """
+        The retrieval sources of the agent, by the template variable they
+        fill.
+
+        Returns:
+            Dict[str, Retriever]: The retrievers queried before each
+                prompt.
+        """
+        return {
+            'chat_history': MemoryRetriever(
+                self.kernel.memory,
+                self.memory_collection,
+                limit=10,
+                timeout=self.retrieval_timeout,
+            ),
+        }
+
+    async def retrieve(
+        self, prompt: str, budget: Optional[int] = None
+    ) -> Dict[str, str]:
+        """
+        Queries every retriever concurrently and stores the results in the
+        context. Sources that miss their timeout or the retrieval deadline
+        are left empty.
+
+        Args:
+            prompt (str): The user prompt.
+            budget (Optional[int]): The tokens the retrieved context may
+                use.
+
+        Returns:
+            Dict[str, str]: The retrieved context, by template variable.
+        """
+        with span('retrieval'):
+            passages = await fan_out_passages(
+                self.retrievers(), prompt, deadline=self.retrieval_deadline
+            )
+        return self.fill_context(passages, budget)
+
+    def fill_context(
+        self,
+        passages: Dict[str, List[str]],
+        budget: Optional[int] = None
+    ) -> Dict[str, str]:
+        """
+        Places the retrieved passages in the context. With a packer, only
+        the passages that fit the token budget are kept, and the tokens
+        used by each section are reported in the response.
+
+        Args:
+            passages (Dict[str, List[str]]): The passages of each template
+                variable, best first.
+            budget (Optional[int]): The tokens the retrieved context may
+                use.
+
+        Returns:
+            Dict[str, str]: The retrieved context, by template variable.
+        """
+        if self.packer is None:
+            sections = {
+                name: '\n'.join(texts) for name, texts in passages.items()
+            }
+        else:
+            with span('packing'):
+                packed = self.packer.pack(passages, budget)
+            sections = packed.sections
+            self.response['context'] = packed.as_dict()
+        for name, value in sections.items():
+            self.context[name] = value
+        return sections
+
+    def context_budget(
+        self, template: str, prompt: str, max_tokens: int = 0
+    ) -> int:
+        """
+        The tokens left for the retrieved context once the template, the
+        prompt and the completion are accounted for.
+
+        Args:
+            template (str): The prompt template.
+            prompt (str): The user prompt.
+            max_tokens (int): The tokens reserved for the completion.
+
+        Returns:
+            int: The token budget of the retrieved context.
+        """
+        return (
+            self.context_window
+            - max_tokens
+            - count_tokens(template)
+            - count_tokens(prompt)
+        )
@@ -0,0 +1,147 @@
+from __future__ import annotations
+
+from functools import lru_cache
+from typing import Any, Dict, Hashable, Optional, Tuple, Type
+
+import semantic_kernel as sk
+from semantic_kernel.connectors.ai import EmbeddingGeneratorBase
+from semantic_kernel.connectors.ai.open_ai import AzureChatCompletion
+from semantic_kernel.kernel import KernelFunction
+
+from app.schemas.agents import ChatSchema
+from app.tools.caches import CacheStats, LRUCache
+from app.tools.memories import CosmosAbstractMemory
+
+
+class WarmKernel:
+    """
+    A kernel with its services registered, and the semantic functions
+    already compiled on it, by template and request settings.
+    """
+
+    def __init__(self, kernel: sk.Kernel, stats: CacheStats) -> None:
+        self.kernel: sk.Kernel = kernel
+        self.stats: CacheStats = stats
+        self._functions: Dict[Tuple[str, Tuple], KernelFunction] = {}
+
+    def function(self, template: str, **settings: Any) -> KernelFunction:
+        """
+        Returns the semantic function of the template, compiling it on
+        first use.
+
+        Args:
+            template (str): The prompt template.
+            **settings: The request settings of the function, such as
+                max_tokens.
+
+        Returns:
+            KernelFunction: The compiled semantic function.
+        """
+        key = (template, tuple(sorted(settings.items())))
+        function = self._functions.get(key)
+        if function is None:
+            self.stats.misses += 1
+            function = self._functions[key] = (
+                self.kernel.create_semantic_function(template, **settings)
+            )
+        else:
+            self.stats.hits += 1
+        return function
+
+
+class KernelPool:
+    """
+    Warm kernels shared by the agents of every request, keyed by the chat
+    service and the memory they use.
+
+    Building a kernel, an Azure OpenAI client and a semantic function on
+    every request is pure overhead: the kernel and its functions hold no
+    per-request state, since every invocation runs on the agent's own
+    context. Agents keep their own context and response, and reuse the
+    kernel, its HTTP client and its compiled templates.
+    """
+
+    def __init__(self, maxsize: int = 32) -> None:
+        self.kernel_stats: CacheStats = CacheStats()
+        self.function_stats: CacheStats = CacheStats()
+        self._kernels: LRUCache[Hashable, WarmKernel] = LRUCache(
+            maxsize, self.kernel_stats
+        )
+        self._bare: Optional[sk.Kernel] = None
+
+    def bare(self) -> sk.Kernel:
+        """
+        Returns a kernel without services, which agents use until they
+        configure theirs. It must not be modified.
+        """
+        if self._bare is None:
+            self._bare = sk.Kernel()
+        return self._bare
+
+    def acquire(
+        self,
+        chat_name: Optional[str] = None,
+        completion: Type[AzureChatCompletion] = AzureChatCompletion,
+        schema: Optional[ChatSchema] = None,
+        memory: Optional[CosmosAbstractMemory] = None,
+        embeddings_generator: Optional[EmbeddingGeneratorBase] = None,
+    ) -> WarmKernel:
+        """
+        Returns the warm kernel for the chat service and memory, building
+        it on first use.
+
+        Args:
+            chat_name (Optional[str]): Name of the chat service, if any.
+            completion (Type[AzureChatCompletion]): The chat completion
+                connector.
+            schema (Optional[ChatSchema]): The deployment of the chat
+                service.
+            memory (Optional[CosmosAbstractMemory]): The memory store, if
+                any.
+            embeddings_generator (Optional[EmbeddingGeneratorBase]): The
+                memory's embeddings.
+
+        Returns:
+            WarmKernel: The kernel and its compiled functions.
+        """
+        settings = schema.model_dump() if schema is not None else {}
+        key = (
+            chat_name,
+            completion,
+            tuple(sorted(settings.items())),
+            id(memory),
+            id(embeddings_generator),
+        )
+        warm = self._kernels.get(key)
+        if warm is not None:
+            self.kernel_stats.hits += 1
+            return warm
+        self.kernel_stats.misses += 1
+        kernel = sk.Kernel()
+        if chat_name is not None:
+            kernel.add_chat_service(chat_name, completion(**settings))
+        if memory is not None:
+            kernel.use_memory(
+                memory, embeddings_generator=embeddings_generator
+            )
+        warm = WarmKernel(kernel, self.function_stats)
+        self._kernels.put(key, warm)
+        return warm
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        return {
+            "kernels": self.kernel_stats.as_dict(),
+            "functions": self.function_stats.as_dict(),
+        }
+
+    def clear(self) -> None:
+        self._kernels.clear()
+        self._bare = None
+
+
+@lru_cache(maxsize=None)
+def kernel_pool() -> KernelPool:
+    """
+    Returns the process-wide kernel pool.
+    """
+    return KernelPool()
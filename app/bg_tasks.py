@@ -1,27 +1,299 @@
+"""
+Shipping of the agents' responses to the log storage.
+
+Responses are buffered in memory and written as gzip compressed JSONL
+batches, flushed when a batch is full or has waited long enough, so a busy
+instance writes a few large blobs instead of one tiny blob per request.
+"""
+from __future__ import annotations
+
 import os
+import json
 import time
-from typing import Dict
+import uuid
+import gzip
+import asyncio
+import logging
+from abc import ABC, abstractmethod
+from dataclasses import dataclass, asdict
+from functools import lru_cache
+from typing import Any, Dict, List, Optional
 
-import json
 from dotenv import load_dotenv
 
-from azure.storage.blob import BlobServiceClient, BlobClient
+from azure.storage.blob import ContentSettings
+from azure.storage.blob.aio import BlobServiceClient
 
 
 load_dotenv()
 
+logger: logging.Logger = logging.getLogger(__name__)
+
+_CLOSE = object()
+
+
+class LogSink(ABC):
+    """
+    A store of compressed log batches.
+    """
+
+    @abstractmethod
+    async def write(self, name: str, payload: bytes) -> None:
+        """
+        Writes one batch.
+
+        Args:
+            name (str): The path of the batch, relative to the sink.
+            payload (bytes): The gzip compressed JSONL batch.
+        """
+
+    async def close(self) -> None:
+        """
+        Releases the connections held by the sink.
+        """
+
+
+class BlobLogSink(LogSink):
+    """
+    Writes the batches to a blob container through one long-lived client.
+    """
+
+    def __init__(self, connection_string: str, container: str) -> None:
+        self.client: BlobServiceClient = (
+            BlobServiceClient.from_connection_string(connection_string)
+        )
+        self.container = self.client.get_container_client(container)
+
+    async def write(self, name: str, payload: bytes) -> None:
+        await self.container.upload_blob(
+            name,
+            payload,
+            overwrite=True,
+            content_settings=ContentSettings(
+                content_type="application/x-ndjson",
+                content_encoding="gzip",
+            ),
+        )
+
+    async def close(self) -> None:
+        await self.client.close()
+
+
+class FileSystemLogSink(LogSink):
+    """
+    Writes the batches below a local directory, for tests and local runs.
+    """
+
+    def __init__(self, directory: str) -> None:
+        self.directory: str = directory
+
+    def _write(self, name: str, payload: bytes) -> None:
+        path = os.path.join(self.directory, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as file:
+            file.write(payload)
+
+    async def write(self, name: str, payload: bytes) -> None:
+        await asyncio.to_thread(self._write, name, payload)
+
+
+@dataclass
+class ShipperStats:
+    submitted: int = 0
+    dropped: int = 0
+    shipped: int = 0
+    failed: int = 0
+    batches: int = 0
+
+    def as_dict(self) -> Dict[str, int]:
+        return asdict(self)
+
+
+class LogShipper:
+    """
+    Buffers records in a bounded queue and ships them in batches of at most
+    `max_records` records or `max_bytes` uncompressed bytes, or whatever
+    has accumulated `flush_interval` seconds after the first record of a
+    batch.
+
+    `submit` never waits: when the queue is full the record is dropped and
+    counted. `put` waits for room instead, for callers that prefer
+    backpressure. `close` ships everything still buffered.
+
+    The queue and the worker belong to the event loop they were started on.
+    When the shipper is used from another loop, as the process-wide shipper
+    is by test clients and by reloads, they are started again on that loop
+    and carry on with the records still buffered.
+    """
+
+    def __init__(
+        self,
+        sink: LogSink,
+        max_records: int = 500,
+        max_bytes: int = 4 << 20,
+        flush_interval: float = 5.0,
+        max_pending: int = 10_000,
+        retries: int = 3,
+        prefix: str = "logs",
+    ) -> None:
+        self.sink: LogSink = sink
+        self.max_records: int = max_records
+        self.max_bytes: int = max_bytes
+        self.flush_interval: float = flush_interval
+        self.retries: int = retries
+        self.prefix: str = prefix
+        self.max_pending: int = max_pending
+        self.stats: ShipperStats = ShipperStats()
+        self._queue: asyncio.Queue = asyncio.Queue(max_pending)
+        self._worker: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._batch: List[bytes] = []
+        self._size: int = 0
+
+    def _start(self) -> None:
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            stale = self._queue
+            self._queue = asyncio.Queue(self.max_pending)
+            while not stale.empty():
+                record = stale.get_nowait()
+                if record is not _CLOSE:
+                    self._queue.put_nowait(record)
+            self._loop, self._worker = loop, None
+        if self._worker is None or self._worker.done():
+            self._worker = loop.create_task(self._run())
+
+    def submit(self, record: Dict[str, Any]) -> bool:
+        """
+        Buffers a record without waiting. Must be called from the event
+        loop.
+
+        Args:
+            record (Dict[str, Any]): The JSON serializable record.
+
+        Returns:
+            bool: Whether the record was buffered, rather than dropped.
+        """
+        self._start()
+        try:
+            self._queue.put_nowait(record)
+        except asyncio.QueueFull:
+            self.stats.dropped += 1
+            return False
+        self.stats.submitted += 1
+        return True
+
+    async def put(self, record: Dict[str, Any]) -> None:
+        """
+        Buffers a record, waiting for room when the buffer is full.
+
+        Args:
+            record (Dict[str, Any]): The JSON serializable record.
+        """
+        self._start()
+        await self._queue.put(record)
+        self.stats.submitted += 1
+
+    async def _run(self) -> None:
+        loop, queue = asyncio.get_running_loop(), self._queue
+        deadline = loop.time() + self.flush_interval
+        while True:
+            timeout = (
+                max(0.0, deadline - loop.time()) if self._batch else None
+            )
+            try:
+                record = await asyncio.wait_for(queue.get(), timeout)
+            except asyncio.TimeoutError:
+                record = None
+            if record is _CLOSE:
+                if self._batch:
+                    await self._flush(self._batch)
+                    self._batch, self._size = [], 0
+                return
+            if record is not None:
+                line = json.dumps(record, default=str).encode() + b"\n"
+                if not self._batch:
+                    deadline = loop.time() + self.flush_interval
+                self._batch.append(line)
+                self._size += len(line)
+            if self._batch and (
+                record is None
+                or len(self._batch) >= self.max_records
+                or self._size >= self.max_bytes
+            ):
+                await self._flush(self._batch)
+                self._batch, self._size = [], 0
+
+    def _name(self) -> str:
+        return (
+            f"{self.prefix}/{time.strftime('%Y/%m/%d/%H', time.gmtime())}/"
+            f"{time.time_ns()}-{uuid.uuid4().hex[:8]}.jsonl.gz"
+        )
+
+    async def _flush(self, batch: List[bytes]) -> None:
+        payload = await asyncio.to_thread(gzip.compress, b"".join(batch))
+        name = self._name()
+        for attempt in range(self.retries + 1):
+            try:
+                await self.sink.write(name, payload)
+            except Exception:  # pylint: disable=broad-except
+                if attempt == self.retries:
+                    self.stats.failed += len(batch)
+                    logger.exception(
+                        "Dropped a log batch of %s records", len(batch)
+                    )
+                    return
+                await asyncio.sleep(0.5 * 2 ** attempt)
+            else:
+                self.stats.shipped += len(batch)
+                self.stats.batches += 1
+                return
+
+    async def close(self) -> None:
+        """
+        Ships every buffered record and releases the sink.
+        """
+        if self._worker is not None:
+            self._start()
+            await self._queue.put(_CLOSE)
+            await self._worker
+        await self.sink.close()
+
 
-def load_data(generated_data: Dict):
-    container_name = os.environ.get('BLOB_STORAGE_STORAGE_ACCOUNT', '')
-    connect_str = os.environ.get('BLOB_STORAGE_CONNECTION_STRING', '')
-    try:
-        blob_service_client: BlobServiceClient = BlobServiceClient.from_connection_string(connect_str)
-        blob_client: BlobClient = blob_service_client.get_blob_client(
-            container=container_name,
-            blob=f'log-{time.time()}-{generated_data.get("_id", None)}.json'
+@lru_cache(maxsize=None)
+def log_shipper() -> LogShipper:
+    """
+    Returns the process-wide log shipper. Batches go to the LOG_SINK_DIR
+    directory when it is set or no blob storage is configured, and to the
+    blob container otherwise.
+    """
+    directory = os.environ.get('LOG_SINK_DIR')
+    connection_string = os.environ.get(
+        'BLOB_STORAGE_CONNECTION_STRING', ''
+    )
+    if directory or not connection_string:
+        if not directory:
+            logger.warning(
+                "BLOB_STORAGE_CONNECTION_STRING is not set, shipping the "
+                "logs to the local 'logs' directory"
+            )
+        sink: LogSink = FileSystemLogSink(directory or 'logs')
+    else:
+        sink = BlobLogSink(
+            connection_string,
+            os.environ.get('BLOB_STORAGE_STORAGE_ACCOUNT', ''),
         )
-        blob_client.upload_blob(json.dumps(generated_data))
+    return LogShipper(
+        sink,
+        max_records=int(os.environ.get('LOG_BATCH_RECORDS', '500')),
+        flush_interval=float(os.environ.get('LOG_FLUSH_INTERVAL', '5.0')),
+        max_pending=int(os.environ.get('LOG_MAX_PENDING', '10000')),
+    )
 
-    except Exception as ex:
-        print('Exception: \n', ex)
 
+async def load_data(generated_data: Dict) -> None:
+    """
+    Buffers a response for shipping. Being a coroutine, it runs on the
+    event loop as a background task instead of holding a threadpool worker.
+    """
+    log_shipper().submit(generated_data)
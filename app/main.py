@@ -1,16 +1,33 @@
 """
 The configuration for the web api.
 """
+import os
+import json
+import time
+import asyncio
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, Optional, Union
+
 from fastapi import FastAPI, Request, status, BackgroundTasks
 from fastapi.encoders import jsonable_encoder
 from fastapi.exceptions import RequestValidationError
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
 
 from app.schemas import RESPONSES, BodyMessage, ChatEndpoint, ChatEndpointWithMemory
+from app.agents import Agent, kernel_pool
 from app.patterns.simple.simple import SimpleRAG
+from app.patterns.multiplexor import MultiplexorRAG
+from app.patterns.swarm import SwarmScheduler, research_swarm
 from app.tools.memories import CosmosMongoMemory
-from app.bg_tasks import load_data
+from app.bg_tasks import load_data, log_shipper
+from app.monitoring import registry
+from app.settings import MongoSettings, PostgresSettings
+from app.tools.caches import completion_cache, embedding_generator
+from app.tools.limits import limiter_stats
+from app.tools.search import search_engine
+from app.utils.tokens import counter
 
 
 tags_metadata: list[dict] = [
@@ -26,6 +43,124 @@ description: str = """
     A web API to serve as a web app for Semantic Kernell testing and understanding.
 """
 
+CHAT_MEMORIES: int = int(os.environ.get("CHAT_MEMORIES", "32"))
+
+@asynccontextmanager
+async def lifespan(application: FastAPI) -> AsyncIterator[None]:
+    """
+    lifespan holds the process-wide connections used by the routes and
+    releases them on shutdown.
+    """
+    application.state.memories = OrderedDict()
+    application.state.search = search_engine()
+    application.state.logs = log_shipper()
+    yield
+    for memory in application.state.memories.values():
+        await memory.close()
+    await application.state.logs.close()
+    log_shipper.cache_clear()
+    await application.state.search.close()
+    search_engine.cache_clear()
+    await MongoSettings().close()
+    await PostgresSettings().close()
+
+
+async def chat_memory(connection_string: str) -> CosmosMongoMemory:
+    """
+    chat_memory reuses one memory store, and so one pooled client, per
+    connection string. The connection strings come from the requests, so
+    only the CHAT_MEMORIES most recently used stores are kept, the others
+    being closed.
+    """
+    memories: OrderedDict[str, CosmosMongoMemory] = app.state.memories
+    if connection_string in memories:
+        memories.move_to_end(connection_string)
+        return memories[connection_string]
+    memory = memories[connection_string] = CosmosMongoMemory(
+        'ragMemory', connection_string
+    )
+    while len(memories) > CHAT_MEMORIES:
+        await memories.popitem(last=False)[1].close()
+    return memory
+
+
+async def server_sent_events(
+    agent: Agent,
+    prompt: Union[ChatEndpoint, ChatEndpointWithMemory]
+) -> AsyncIterator[str]:
+    """
+    server_sent_events relays the agent's completion chunks as SSE
+    messages, closing with a `done` event that carries the full response.
+    """
+    async for chunk in agent.stream(
+        chat_name=prompt.chat_name,
+        prompt=prompt.prompt,
+        max_tokens=prompt.max_tokens
+    ):
+        yield f"data: {json.dumps({'delta': chunk})}\n\n"
+    response = json.dumps(jsonable_encoder(agent.response))
+    yield f"event: done\ndata: {response}\n\n"
+
+
+async def swarm_events(
+    scheduler: SwarmScheduler,
+    response: Dict
+) -> AsyncIterator[str]:
+    """
+    swarm_events runs the swarm and relays the synthesis as SSE messages,
+    closing with a `done` event that carries the full response and the
+    swarm report, or an `error` event when the synthesis did not run.
+    """
+    chunks: asyncio.Queue = asyncio.Queue()
+    run = asyncio.create_task(scheduler.run('synthesis', chunks))
+    try:
+        while (chunk := await chunks.get()) is not None:
+            yield f"data: {json.dumps({'delta': chunk})}\n\n"
+        swarm = await run
+    finally:
+        run.cancel()
+    report = swarm.report()
+    if 'synthesis' not in swarm.results:
+        yield f"event: error\ndata: {json.dumps({'swarm': report})}\n\n"
+        return
+    response.update({**swarm.results['synthesis'], 'swarm': report})
+    payload = json.dumps(jsonable_encoder(response))
+    yield f"event: done\ndata: {payload}\n\n"
+
+
+async def respond(
+    agent: Agent,
+    prompt: Union[ChatEndpoint, ChatEndpointWithMemory],
+    bg_tasks: Optional[BackgroundTasks] = None
+) -> Union[JSONResponse, StreamingResponse]:
+    """
+    respond runs the agent, streaming the completion when the request asks
+    for it, and ships the final response to the log sink in the background.
+    """
+    if prompt.stream:
+        if bg_tasks is not None:
+            bg_tasks.add_task(load_data, agent.response)
+        return StreamingResponse(
+            server_sent_events(agent, prompt),
+            media_type="text/event-stream",
+            headers={
+                "Cache-Control": "no-cache",
+                "X-Accel-Buffering": "no",
+            },
+        )
+    response = await agent(
+        chat_name=prompt.chat_name,
+        prompt=prompt.prompt,
+        max_tokens=prompt.max_tokens
+    )
+    if bg_tasks is not None:
+        bg_tasks.add_task(load_data, response)
+    return JSONResponse(
+        status_code=status.HTTP_200_OK,
+        content=jsonable_encoder(response)
+    )
+
+
 app: FastAPI = FastAPI(
     title="Semantic Kernell Study API",
     version="0.0.1a",
@@ -33,6 +168,7 @@ app: FastAPI = FastAPI(
     openapi_tags=tags_metadata,
     openapi_url="/api/v1/openapi.json",
     responses=RESPONSES,  # type: ignore
+    lifespan=lifespan,
 )
 
 app.add_middleware(
@@ -44,6 +180,59 @@ app.add_middleware(
 )
 
 
+@app.middleware("http")
+async def record_latency(request: Request, call_next):
+    """
+    record_latency records the time to the response headers of every route,
+    under the route's template so unknown paths share one histogram.
+    """
+    started = time.perf_counter_ns()
+    error = True
+    try:
+        response = await call_next(request)
+        error = response.status_code >= 500
+        return response
+    finally:
+        route = request.scope.get("route")
+        registry().observe(
+            f"http {request.method} {getattr(route, 'path', 'unmatched')}",
+            time.perf_counter_ns() - started,
+            error,
+        )
+
+
+@app.get("/metrics")
+async def metrics() -> JSONResponse:
+    """
+    metrics reports the latency histograms of every instrumented stage, the
+    hit rates of the process-wide caches, the state of the rate limiters
+    and the sizes of the micro-batches.
+    """
+    batcher = embedding_generator().batcher
+    return JSONResponse(
+        status_code=status.HTTP_200_OK,
+        content=jsonable_encoder({
+            'latency': registry().snapshot(),
+            'caches': {
+                'search': app.state.search.stats.as_dict(),
+                'token_counts': counter().cache_info(),
+                'completions': completion_cache().stats.as_dict(),
+                **kernel_pool().stats(),
+            },
+            'logs': app.state.logs.stats.as_dict(),
+            'limits': limiter_stats(),
+            'batching': {
+                'embeddings': batcher.stats.as_dict() if batcher else None,
+                'searches': [
+                    memory.searches.stats.as_dict()
+                    for memory in app.state.memories.values()
+                    if memory.searches is not None
+                ],
+            },
+        }),
+    )
+
+
 @app.exception_handler(RequestValidationError)
 async def validation_exception_handler(
     request: Request,
@@ -71,85 +260,79 @@ async def validation_exception_handler(
     )
 
 
-@app.post("/simple-rag/")
+@app.post("/simple-rag/", response_model=None)
 async def chat_with_simple_rag(
     prompt: ChatEndpoint,
     bg_tasks: BackgroundTasks
-) -> JSONResponse:
+) -> Union[JSONResponse, StreamingResponse]:
     """
     load_data loads the data into the Context
     """
     agent = SimpleRAG(chat_id=prompt._id)
-    response = await agent(
-        chat_name=prompt.chat_name,
-        prompt=prompt.prompt,
-        max_tokens=prompt.max_tokens
-    )
-    bg_tasks.add_task(load_data, response)
-    return JSONResponse(
-        status_code=status.HTTP_200_OK,
-        content=jsonable_encoder(response)
-    )
+    return await respond(agent, prompt, bg_tasks)
 
 
-@app.post("/simple-rag-with-memory/")
+@app.post("/simple-rag-with-memory/", response_model=None)
 async def chat_with_simple_rag_with_memory(
     prompt: ChatEndpointWithMemory,
     bg_tasks: BackgroundTasks
-) -> JSONResponse:
+) -> Union[JSONResponse, StreamingResponse]:
     """
     load_data loads the data into the Context
     """
-    print(prompt.connection_string)
-    memory = CosmosMongoMemory('ragMemory', prompt.connection_string)
+    memory = await chat_memory(prompt.connection_string)
     agent = SimpleRAG(chat_id=prompt._id)
     agent._chat_history(memory)
-    response = await agent(
-        chat_name=prompt.chat_name,
-        prompt=prompt.prompt,
-        max_tokens=prompt.max_tokens
-    )
-    return JSONResponse(
-        status_code=status.HTTP_200_OK,
-        content=jsonable_encoder(response)
-    )
+    return await respond(agent, prompt)
 
 
-@app.post("/multiplexor-rag/")
+@app.post("/multiplexor-rag/", response_model=None)
 async def chat_with_multiplexor_rag(
     prompt: ChatEndpoint,
     bg_tasks: BackgroundTasks
-) -> JSONResponse:
+) -> Union[JSONResponse, StreamingResponse]:
     """
     load_data loads the data into the Context
     """
-    agent = SimpleRAG(chat_id=prompt._id)
-    response = await agent(
-        chat_name=prompt.chat_name,
-        prompt=prompt.prompt,
-        max_tokens=prompt.max_tokens
-    )
-    bg_tasks.add_task(load_data, response)
-    return JSONResponse(
-        status_code=status.HTTP_200_OK,
-        content=jsonable_encoder(response)
-    )
+    agent = MultiplexorRAG(chat_id=prompt._id)
+    return await respond(agent, prompt, bg_tasks)
 
 
-@app.post("/agent-swarm/")
+@app.post("/agent-swarm/", response_model=None)
 async def chat_with_agent_swarm(
     prompt: ChatEndpoint,
     bg_tasks: BackgroundTasks
-) -> JSONResponse:
+) -> Union[JSONResponse, StreamingResponse]:
     """
-    load_data loads the data into the Context
+    Runs the research swarm: two RAG agents answer concurrently from shared
+    retrieval results and a synthesis agent merges their answers. With
+    `stream`, the synthesis is relayed as server-sent events.
     """
-    agent = SimpleRAG(chat_id=prompt._id)
-    response = await agent(
+    scheduler = research_swarm(
+        prompt.prompt,
+        chat_id=prompt._id,
         chat_name=prompt.chat_name,
-        prompt=prompt.prompt,
-        max_tokens=prompt.max_tokens
+        max_tokens=prompt.max_tokens,
     )
+    if prompt.stream:
+        response: Dict = {}
+        bg_tasks.add_task(load_data, response)
+        return StreamingResponse(
+            swarm_events(scheduler, response),
+            media_type="text/event-stream",
+            headers={
+                "Cache-Control": "no-cache",
+                "X-Accel-Buffering": "no",
+            },
+        )
+    swarm = await scheduler.run()
+    report = swarm.report()
+    if 'synthesis' not in swarm.results:
+        return JSONResponse(
+            status_code=status.HTTP_502_BAD_GATEWAY,
+            content=jsonable_encoder({'swarm': report}),
+        )
+    response = {**swarm.results['synthesis'], 'swarm': report}
     bg_tasks.add_task(load_data, response)
     return JSONResponse(
         status_code=status.HTTP_200_OK,
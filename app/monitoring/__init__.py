@@ -0,0 +1,17 @@
+"""
+A package that measures the latency of each stage of a request in process.
+"""
+
+__all__ = [
+    "Histogram",
+    "MetricsRegistry",
+    "instrument",
+    "registry",
+    "span",
+]
+__author__ = "Ricardo Cataldi"
+__version__ = "0.1.0"
+__status__ = "In Development"
+
+from .metrics import Histogram, MetricsRegistry, registry
+from .tracing import instrument, span
@@ -0,0 +1,109 @@
+"""
+In-process latency histograms.
+"""
+from __future__ import annotations
+
+import threading
+from array import array
+from functools import lru_cache
+from typing import Dict, List
+
+
+class Histogram:
+    """
+    Latency distribution of one stage. Count, total and maximum cover every
+    sample, while the percentiles are computed over a ring buffer of the
+    most recent `window` samples, so they follow the current behaviour of
+    the app.
+    """
+
+    def __init__(self, window: int = 4_096) -> None:
+        self.window: int = window
+        self.count: int = 0
+        self.errors: int = 0
+        self.total_ns: int = 0
+        self.max_ns: int = 0
+        self._samples: array = array("q")
+        self._lock: threading.Lock = threading.Lock()
+
+    def observe(self, nanoseconds: int, error: bool = False) -> None:
+        with self._lock:
+            if len(self._samples) < self.window:
+                self._samples.append(nanoseconds)
+            else:
+                self._samples[self.count % self.window] = nanoseconds
+            self.count += 1
+            self.errors += error
+            self.total_ns += nanoseconds
+            self.max_ns = max(self.max_ns, nanoseconds)
+
+    @staticmethod
+    def _percentile(ordered: List[int], quantile: float) -> float:
+        if not ordered:
+            return 0.0
+        return (
+            ordered[min(len(ordered) - 1, int(quantile * len(ordered)))]
+            / 1e6
+        )
+
+    def snapshot(self) -> Dict[str, float]:
+        """
+        Summarizes the histogram, in milliseconds.
+        """
+        with self._lock:
+            ordered = sorted(self._samples)
+            count, errors, total, maximum = (
+                self.count, self.errors, self.total_ns, self.max_ns
+            )
+        return {
+            "count": count,
+            "errors": errors,
+            "mean_ms": total / count / 1e6 if count else 0.0,
+            "p50_ms": self._percentile(ordered, 0.50),
+            "p95_ms": self._percentile(ordered, 0.95),
+            "p99_ms": self._percentile(ordered, 0.99),
+            "max_ms": maximum / 1e6,
+        }
+
+
+class MetricsRegistry:
+    """
+    The histograms of every instrumented stage, by name.
+    """
+
+    def __init__(self, window: int = 4_096) -> None:
+        self.window: int = window
+        self._histograms: Dict[str, Histogram] = {}
+        self._lock: threading.Lock = threading.Lock()
+
+    def histogram(self, name: str) -> Histogram:
+        histogram = self._histograms.get(name)
+        if histogram is None:
+            with self._lock:
+                histogram = self._histograms.setdefault(
+                    name, Histogram(self.window)
+                )
+        return histogram
+
+    def observe(
+        self, name: str, nanoseconds: int, error: bool = False
+    ) -> None:
+        self.histogram(name).observe(nanoseconds, error)
+
+    def snapshot(self) -> Dict[str, Dict[str, float]]:
+        return {
+            name: histogram.snapshot()
+            for name, histogram in sorted(self._histograms.items())
+        }
+
+    def clear(self) -> None:
+        with self._lock:
+            self._histograms.clear()
+
+
+@lru_cache(maxsize=None)
+def registry() -> MetricsRegistry:
+    """
+    Returns the process-wide metrics registry.
+    """
+    return MetricsRegistry()
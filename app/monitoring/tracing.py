@@ -0,0 +1,101 @@
+"""
+Spans and the decorator that records them.
+"""
+from __future__ import annotations
+
+import time
+import inspect
+import functools
+from contextlib import contextmanager
+from typing import (
+    Any,
+    Callable,
+    Iterator,
+    Optional,
+    TypeVar,
+    Union,
+    overload,
+)
+
+from .metrics import MetricsRegistry, registry
+
+
+F = TypeVar("F", bound=Callable[..., Any])
+
+
+@contextmanager
+def span(
+    name: str, metrics: Optional[MetricsRegistry] = None
+) -> Iterator[None]:
+    """
+    Records the time spent in the block under `name`. It works the same in
+    sync and async code, since it only reads the clock on entry and exit.
+
+    Args:
+        name (str): The stage being measured.
+        metrics (Optional[MetricsRegistry]): The registry to record into.
+    """
+    started = time.perf_counter_ns()
+    error = False
+    try:
+        yield
+    except BaseException:
+        error = True
+        raise
+    finally:
+        (metrics or registry()).observe(
+            name, time.perf_counter_ns() - started, error
+        )
+
+
+@overload
+def instrument(name: F) -> F: ...
+
+
+@overload
+def instrument(name: Optional[str] = None) -> Callable[[F], F]: ...
+
+
+def instrument(
+    name: Union[str, Callable, None] = None
+) -> Union[F, Callable[[F], F]]:
+    """
+    Records every call of the decorated function as a span. Coroutine
+    functions are measured until they return, not until the coroutine is
+    created, and async generators until they are exhausted.
+
+    Args:
+        name (Optional[str]): The span name, the function's qualified name
+            by default.
+
+    Returns:
+        Callable: The decorator, or the decorated function when used bare.
+    """
+    if callable(name):
+        return instrument(None)(name)
+
+    def decorator(func: F) -> F:
+        label = name or func.__qualname__
+
+        if inspect.isasyncgenfunction(func):
+            @functools.wraps(func)
+            async def generator_wrapper(*args, **kwargs):
+                with span(label):
+                    async for item in func(*args, **kwargs):
+                        yield item
+            return generator_wrapper  # type: ignore[return-value]
+
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with span(label):
+                    return await func(*args, **kwargs)
+            return async_wrapper  # type: ignore[return-value]
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(label):
+                return func(*args, **kwargs)
+        return wrapper  # type: ignore[return-value]
+
+    return decorator
@@ -0,0 +1,29 @@
+"""
+A package that splits document corpora into token bounded chunks.
+"""
+
+__all__ = [
+    "Checkpoint",
+    "Chunk",
+    "Chunker",
+    "Document",
+    "DocumentReader",
+    "FileSystemReader",
+    "IngestionOrchestrator",
+    "IngestionReport",
+    "SentenceChunker",
+    "TokenChunker",
+    "chunk_corpus",
+]
+__author__ = "Ricardo Cataldi"
+__version__ = "0.1.0"
+__status__ = "In Development"
+
+from ._abstract import Chunk, Chunker, Document, DocumentReader
+from .agents import FileSystemReader, SentenceChunker, TokenChunker
+from .orchestrators import (
+    Checkpoint,
+    IngestionOrchestrator,
+    IngestionReport,
+    chunk_corpus,
+)
@@ -0,0 +1,95 @@
+from __future__ import annotations
+
+from abc import ABC, abstractmethod
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, Iterator
+
+import tiktoken
+
+from app.utils.tokens import encoder
+
+
+@dataclass(frozen=True)
+class Document:
+    """
+    A reference to a document. The content is only read when it is chunked.
+    """
+    id: str
+    source: str
+    metadata: Dict[str, Any] = field(default_factory=dict)
+
+
+@dataclass(frozen=True)
+class Chunk:
+    """
+    A piece of a document small enough to be embedded.
+    """
+    document_id: str
+    index: int
+    text: str
+    token_count: int
+
+    @property
+    def key(self) -> str:
+        return f"{self.document_id}:{self.index}"
+
+
+class DocumentReader(ABC):
+    """
+    The DocumentReader lists documents and streams their content lazily, so
+    a corpus never needs to fit in memory.
+    """
+
+    @abstractmethod
+    def documents(self) -> Iterator[Document]:
+        """
+        Lists the documents of the corpus.
+
+        Returns:
+            Iterator[Document]: The documents, without their content.
+        """
+
+    @abstractmethod
+    def read(self, document: Document) -> Iterator[str]:
+        """
+        Streams the content of a document.
+
+        Args:
+            document (Document): The document to read.
+
+        Returns:
+            Iterator[str]: Consecutive blocks of the document's text.
+        """
+
+
+class Chunker(ABC):
+    """
+    The Chunker splits a stream of text blocks into chunks bounded by a
+    token budget, with `overlap` tokens repeated between consecutive
+    chunks.
+    """
+
+    def __init__(self, max_tokens: int = 512, overlap: int = 64) -> None:
+        if not 0 <= overlap < max_tokens:
+            raise ValueError("overlap must be smaller than max_tokens")
+        self.max_tokens: int = max_tokens
+        self.overlap: int = overlap
+
+    @property
+    def encoder(self) -> tiktoken.Encoding:
+        return encoder()
+
+    @abstractmethod
+    def chunk(
+        self, document: Document, blocks: Iterable[str]
+    ) -> Iterator[Chunk]:
+        """
+        Splits a document into chunks as its blocks arrive.
+
+        Args:
+            document (Document): The document being chunked.
+            blocks (Iterable[str]): The document's text, block by block.
+
+        Returns:
+            Iterator[Chunk]: The chunks, in document order.
+        """
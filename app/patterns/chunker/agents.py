@@ -0,0 +1,204 @@
+from __future__ import annotations
+
+import os
+import glob
+import logging
+from collections import deque
+from functools import lru_cache
+from typing import Deque, Iterable, Iterator, List, Tuple
+
+import nltk
+
+from ._abstract import Chunk, Chunker, Document, DocumentReader
+
+
+logger: logging.Logger = logging.getLogger(__name__)
+
+
+@lru_cache(maxsize=None)
+def punkt(
+    language: str = "english",
+) -> nltk.tokenize.PunktSentenceTokenizer:
+    """
+    Loads the punkt sentence tokenizer of a language once per process,
+    downloading the punkt models first when they are not installed.
+    """
+    try:
+        nltk.data.find("tokenizers/punkt")
+    except LookupError:
+        logger.warning("The punkt models are missing, downloading them")
+        nltk.download("punkt", quiet=True, raise_on_error=True)
+    return nltk.data.load(f"tokenizers/punkt/{language}.pickle")
+
+
+class FileSystemReader(DocumentReader):
+    """
+    Reads the text files below a directory in fixed size blocks.
+    """
+
+    def __init__(
+        self,
+        root: str,
+        pattern: str = "**/*.txt",
+        block_size: int = 1 << 20,
+        encoding: str = "utf-8",
+    ) -> None:
+        self.root: str = root
+        self.pattern: str = pattern
+        self.block_size: int = block_size
+        self.encoding: str = encoding
+
+    def documents(self) -> Iterator[Document]:
+        for path in sorted(
+            glob.iglob(
+                os.path.join(self.root, self.pattern), recursive=True
+            )
+        ):
+            if os.path.isfile(path):
+                yield Document(
+                    id=os.path.relpath(path, self.root),
+                    source=path,
+                    metadata={"size": os.path.getsize(path)},
+                )
+
+    def read(self, document: Document) -> Iterator[str]:
+        with open(
+            document.source, encoding=self.encoding, errors="replace"
+        ) as file:
+            while block := file.read(self.block_size):
+                yield block
+
+
+def _split_complete(text: str) -> Tuple[str, str]:
+    """
+    Splits off the trailing, possibly incomplete word of a block so it is
+    tokenized together with the next block.
+    """
+    cut = max(text.rfind(" "), text.rfind("\n"))
+    if cut <= 0:
+        return "", text
+    return text[:cut], text[cut:]
+
+
+class TokenChunker(Chunker):
+    """
+    Splits text into windows of `max_tokens` tokens, regardless of sentence
+    boundaries. Only the current window is ever held in memory.
+    """
+
+    def chunk(
+        self, document: Document, blocks: Iterable[str]
+    ) -> Iterator[Chunk]:
+        tokens: List[int] = []
+        carry, index, emitted = "", 0, 0
+        step = self.max_tokens - self.overlap
+
+        def window() -> Chunk:
+            size = min(len(tokens), self.max_tokens)
+            return Chunk(
+                document_id=document.id,
+                index=index,
+                text=self.encoder.decode(tokens[:size]),
+                token_count=size,
+            )
+
+        for block in blocks:
+            complete, carry = _split_complete(carry + block)
+            if complete:
+                tokens.extend(self.encoder.encode_ordinary(complete))
+            while len(tokens) >= self.max_tokens:
+                yield window()
+                index, emitted = index + 1, self.overlap
+                del tokens[:step]
+        if carry:
+            tokens.extend(self.encoder.encode_ordinary(carry))
+        while len(tokens) > emitted:
+            yield window()
+            index, emitted = index + 1, self.overlap
+            if len(tokens) <= self.max_tokens:
+                break
+            del tokens[:step]
+
+
+class SentenceChunker(Chunker):
+    """
+    Packs whole sentences, found with nltk's punkt tokenizer, into chunks
+    of at most `max_tokens` tokens. Trailing sentences of up to `overlap`
+    tokens are repeated at the start of the next chunk. Sentences longer
+    than the budget are split by tokens.
+
+    The unfinished sentence at the end of a block is tokenized again with
+    the next block. Once it grows past `max_carry` characters, as text
+    without sentence boundaries does, it is split by tokens instead of
+    being carried on, which keeps both memory and the work per block
+    bounded.
+    """
+
+    def __init__(
+        self,
+        max_tokens: int = 512,
+        overlap: int = 64,
+        language: str = "english",
+        max_carry: int = 0,
+    ) -> None:
+        super().__init__(max_tokens, overlap)
+        self.language: str = language
+        self.max_carry: int = max_carry or 8 * max_tokens
+        self._fallback: TokenChunker = TokenChunker(max_tokens, 0)
+
+    def _sentences(self, blocks: Iterable[str]) -> Iterator[str]:
+        tokenizer = punkt(self.language)
+        carry = ""
+        for block in blocks:
+            sentences = tokenizer.tokenize(carry + block)
+            if not sentences:
+                continue
+            carry = sentences.pop()
+            yield from sentences
+            if len(carry) > self.max_carry:
+                head, carry = _split_complete(carry)
+                if not head or len(carry) > self.max_carry:
+                    head, carry = head + carry, ""
+                yield head
+        if carry:
+            yield carry
+
+    def _pieces(
+        self, document: Document, sentence: str
+    ) -> Iterator[Tuple[str, int]]:
+        count = len(self.encoder.encode_ordinary(sentence))
+        if count <= self.max_tokens:
+            yield sentence, count
+            return
+        for piece in self._fallback.chunk(document, [sentence]):
+            yield piece.text, piece.token_count
+
+    def chunk(
+        self, document: Document, blocks: Iterable[str]
+    ) -> Iterator[Chunk]:
+        window: Deque[Tuple[str, int]] = deque()
+        tokens, index, fresh = 0, 0, False
+
+        def emit() -> Chunk:
+            return Chunk(
+                document_id=document.id,
+                index=index,
+                text=" ".join(sentence for sentence, _ in window),
+                token_count=tokens,
+            )
+
+        for sentence in self._sentences(blocks):
+            for piece, count in self._pieces(document, sentence):
+                if window and tokens + count > self.max_tokens:
+                    yield emit()
+                    index, fresh = index + 1, False
+                    while window and (
+                        tokens > self.overlap
+                        or tokens + count > self.max_tokens
+                    ):
+                        tokens -= window.popleft()[1]
+                window.append((piece, count))
+                tokens += count
+                fresh = True
+        if window and fresh:
+            yield emit()
@@ -0,0 +1,320 @@
+from __future__ import annotations
+
+import os
+import json
+import time
+import asyncio
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from multiprocessing import Manager
+from queue import Queue
+from typing import Dict, Iterator, List, Optional, Set
+
+from numpy import ndarray
+from semantic_kernel.connectors.ai import EmbeddingGeneratorBase
+from semantic_kernel.memory.memory_record import MemoryRecord
+from semantic_kernel.memory.memory_store_base import MemoryStoreBase
+
+from ._abstract import Chunk, Chunker, Document, DocumentReader
+from .agents import TokenChunker
+
+
+logger: logging.Logger = logging.getLogger(__name__)
+
+
+def chunk_corpus(
+    reader: DocumentReader,
+    chunker: Optional[Chunker] = None
+) -> Iterator[Chunk]:
+    """
+    Chains reading and chunking into one lazy pipeline over the whole
+    corpus.
+
+    Args:
+        reader (DocumentReader): The corpus to chunk.
+        chunker (Optional[Chunker]): The chunking strategy, by tokens by
+            default.
+
+    Returns:
+        Iterator[Chunk]: The chunks of every document, document by
+            document.
+    """
+    chunker = chunker or TokenChunker()
+    for document in reader.documents():
+        yield from chunker.chunk(document, reader.read(document))
+
+
+def _chunk_document(
+    reader: DocumentReader,
+    chunker: Chunker,
+    document: Document,
+    batches: Queue,
+    batch_size: int,
+) -> None:
+    """
+    Chunks a document in a worker process, sending the chunks back through
+    `batches` `batch_size` at a time as they are made, followed by None, so
+    neither process ever holds all the chunks of a large document.
+    """
+    batch: List[Chunk] = []
+    for chunk in chunker.chunk(document, reader.read(document)):
+        batch.append(chunk)
+        if len(batch) >= batch_size:
+            batches.put((document.id, batch))
+            batch = []
+    if batch:
+        batches.put((document.id, batch))
+    batches.put((document.id, None))
+
+
+class Checkpoint:
+    """
+    Append-only record of the documents that were fully ingested, so an
+    interrupted run resumes where it stopped.
+    """
+
+    def __init__(self, path: Optional[str] = None) -> None:
+        self.path: Optional[str] = path
+        self.done: Set[str] = set()
+        if path and os.path.exists(path):
+            with open(path, encoding="utf-8") as file:
+                self.done = {
+                    line.rstrip("\n") for line in file if line.strip()
+                }
+
+    def __contains__(self, document_id: str) -> bool:
+        return document_id in self.done
+
+    def add(self, document_id: str) -> None:
+        self.done.add(document_id)
+        if self.path:
+            with open(self.path, "a", encoding="utf-8") as file:
+                file.write(f"{document_id}\n")
+
+
+@dataclass
+class IngestionReport:
+    documents: int = 0
+    skipped: int = 0
+    chunks: int = 0
+    seconds: float = 0.0
+
+    @property
+    def chunks_per_second(self) -> float:
+        return self.chunks / self.seconds if self.seconds else 0.0
+
+
+@dataclass
+class _Batch:
+    document: Document
+    chunks: List[Chunk]
+    embeddings: Optional[ndarray] = None
+
+
+class IngestionOrchestrator:
+    """
+    Runs chunking, embedding and storage as pipeline stages connected by
+    bounded queues, so a slow stage applies backpressure to the ones before
+    it.
+
+    Chunking is CPU bound and runs in a process pool, whose workers send
+    their chunks back in batches through a bounded queue as they make them;
+    embedding and memory writes are IO bound and run as concurrent
+    coroutines. A document is checkpointed once all of its chunks are
+    stored.
+    """
+
+    def __init__(
+        self,
+        reader: DocumentReader,
+        memory: MemoryStoreBase,
+        collection: str,
+        embeddings: EmbeddingGeneratorBase,
+        chunker: Optional[Chunker] = None,
+        checkpoint_path: Optional[str] = None,
+        processes: Optional[int] = None,
+        batch_size: int = 256,
+        queue_size: int = 8,
+        embed_concurrency: int = 4,
+        write_concurrency: int = 2,
+    ) -> None:
+        self.reader: DocumentReader = reader
+        self.memory: MemoryStoreBase = memory
+        self.collection: str = collection
+        self.embeddings: EmbeddingGeneratorBase = embeddings
+        self.chunker: Chunker = chunker or TokenChunker()
+        self.checkpoint: Checkpoint = Checkpoint(checkpoint_path)
+        self.processes: int = processes or os.cpu_count() or 1
+        self.batch_size: int = batch_size
+        self.queue_size: int = queue_size
+        self.embed_concurrency: int = embed_concurrency
+        self.write_concurrency: int = write_concurrency
+        self._pending: Dict[str, int] = {}
+        self._chunking: Dict[str, Document] = {}
+        self.report: IngestionReport = IngestionReport()
+
+    async def run(self) -> IngestionReport:
+        """
+        Ingests every document of the reader that is not checkpointed yet.
+
+        Returns:
+            IngestionReport: Counts and throughput of the run.
+        """
+        started = time.perf_counter()
+        if not await self.memory.does_collection_exist(self.collection):
+            await self.memory.create_collection(self.collection)
+        to_embed: asyncio.Queue = asyncio.Queue(self.queue_size)
+        to_write: asyncio.Queue = asyncio.Queue(self.queue_size)
+        with ProcessPoolExecutor(self.processes) as pool:
+            chunking = asyncio.create_task(self._chunk(pool, to_embed))
+            embedding = [
+                asyncio.create_task(self._embed(to_embed, to_write))
+                for _ in range(self.embed_concurrency)
+            ]
+            writing = [
+                asyncio.create_task(self._write(to_write))
+                for _ in range(self.write_concurrency)
+            ]
+
+            async def drain() -> None:
+                await chunking
+                for _ in embedding:
+                    await to_embed.put(None)
+                await asyncio.gather(*embedding)
+                for _ in writing:
+                    await to_write.put(None)
+                await asyncio.gather(*writing)
+
+            stages = [
+                chunking,
+                *embedding,
+                *writing,
+                asyncio.create_task(drain()),
+            ]
+            try:
+                done, _ = await asyncio.wait(
+                    stages, return_when=asyncio.FIRST_EXCEPTION
+                )
+                for stage in done:
+                    if not stage.cancelled() and stage.exception():
+                        raise stage.exception()
+            finally:
+                for stage in stages:
+                    stage.cancel()
+                await asyncio.gather(*stages, return_exceptions=True)
+        self.report.seconds = time.perf_counter() - started
+        logger.info(
+            "Ingested %s documents, %s chunks in %.1fs (%.1f chunks/s)",
+            self.report.documents,
+            self.report.chunks,
+            self.report.seconds,
+            self.report.chunks_per_second,
+        )
+        return self.report
+
+    async def _chunk(
+        self, pool: ProcessPoolExecutor, to_embed: asyncio.Queue
+    ) -> None:
+        loop = asyncio.get_running_loop()
+        with Manager() as manager:
+            batches: Queue = manager.Queue(self.queue_size)
+            relay = asyncio.create_task(self._relay(batches, to_embed))
+            in_flight: Set[asyncio.Future] = set()
+
+            async def drain(until: int) -> None:
+                nonlocal in_flight
+                while len(in_flight) > until:
+                    done, in_flight = await asyncio.wait(
+                        in_flight | {relay},
+                        return_when=asyncio.FIRST_COMPLETED,
+                    )
+                    in_flight.discard(relay)
+                    for future in done:
+                        future.result()
+
+            try:
+                for document in self.reader.documents():
+                    if document.id in self.checkpoint:
+                        self.report.skipped += 1
+                        continue
+                    self._chunking[document.id] = document
+                    in_flight.add(loop.run_in_executor(
+                        pool,
+                        _chunk_document,
+                        self.reader,
+                        self.chunker,
+                        document,
+                        batches,
+                        self.batch_size,
+                    ))
+                    await drain(2 * self.processes - 1)
+                await drain(0)
+                await asyncio.to_thread(batches.put, None)
+                await relay
+            finally:
+                relay.cancel()
+
+    async def _relay(
+        self, batches: Queue, to_embed: asyncio.Queue
+    ) -> None:
+        while (item := await asyncio.to_thread(batches.get)) is not None:
+            document_id, chunks = item
+            document = self._chunking[document_id]
+            if chunks is None:
+                del self._chunking[document_id]
+                self._settle(document)
+                continue
+            self._pending[document_id] = (
+                self._pending.get(document_id, 0) + 1
+            )
+            await to_embed.put(_Batch(document, chunks))
+
+    async def _embed(
+        self, to_embed: asyncio.Queue, to_write: asyncio.Queue
+    ) -> None:
+        while (batch := await to_embed.get()) is not None:
+            batch.embeddings = await self.embeddings.generate_embeddings(
+                [chunk.text for chunk in batch.chunks]
+            )
+            await to_write.put(batch)
+
+    async def _write(self, to_write: asyncio.Queue) -> None:
+        while (batch := await to_write.get()) is not None:
+            records = [
+                MemoryRecord(
+                    key=chunk.key,
+                    is_reference=False,
+                    external_source_name=batch.document.source,
+                    id=chunk.key,
+                    description=batch.document.id,
+                    text=chunk.text,
+                    additional_metadata=json.dumps(
+                        {
+                            "document_id": chunk.document_id,
+                            "index": chunk.index,
+                        }
+                    ),
+                    embedding=embedding,
+                )
+                for chunk, embedding in zip(batch.chunks, batch.embeddings)
+            ]
+            await self.memory.upsert_batch(self.collection, records)
+            self.report.chunks += len(records)
+            self._pending[batch.document.id] -= 1
+            self._settle(batch.document)
+
+    def _settle(self, document: Document) -> None:
+        """
+        Checkpoints a document once it is fully chunked and all of its
+        batches are stored.
+        """
+        if self._pending.get(document.id) == 0:
+            del self._pending[document.id]
+        if document.id in self._pending or document.id in self._chunking:
+            return
+        self._complete(document)
+
+    def _complete(self, document: Document) -> None:
+        self.checkpoint.add(document.id)
+        self.report.documents += 1
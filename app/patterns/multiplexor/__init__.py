@@ -0,0 +1,27 @@
+"""
+A package that multiplexes a prompt over several model deployments.
+"""
+
+__all__ = [
+    "AzureDeploymentBackend",
+    "CompletionBackend",
+    "FakeCompletionBackend",
+    "LatencyStats",
+    "Multiplexor",
+    "MultiplexorRAG",
+    "MultiplexResult",
+    "NoValidAnswerError",
+    "multiplexor",
+]
+__author__ = "Ricardo Cataldi"
+__version__ = "0.1.0"
+__status__ = "In Development"
+
+from ._abstract import CompletionBackend, LatencyStats, NoValidAnswerError
+from .agents import AzureDeploymentBackend, FakeCompletionBackend
+from .orchestrators import (
+    Multiplexor,
+    MultiplexorRAG,
+    MultiplexResult,
+    multiplexor,
+)
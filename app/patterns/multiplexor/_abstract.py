@@ -0,0 +1,89 @@
+from __future__ import annotations
+
+import math
+import statistics
+from abc import ABC, abstractmethod
+from collections import deque
+from typing import Deque
+
+
+class LatencyStats:
+    """
+    Rolling latency and failure statistics of a deployment, used to route
+    requests towards the fastest healthy deployments.
+    """
+
+    def __init__(self, window: int = 256, prior: float = 1.0) -> None:
+        self.samples: Deque[float] = deque(maxlen=window)
+        self.failures: Deque[bool] = deque(maxlen=window)
+        self.prior: float = prior
+
+    def observe(self, seconds: float, failed: bool = False) -> None:
+        self.failures.append(failed)
+        if not failed:
+            self.samples.append(seconds)
+
+    @property
+    def failure_rate(self) -> float:
+        return (
+            sum(self.failures) / len(self.failures)
+            if self.failures
+            else 0.0
+        )
+
+    def quantile(self, q: float) -> float:
+        if not self.samples:
+            return self.prior
+        ordered = sorted(self.samples)
+        return ordered[
+            min(len(ordered) - 1, math.ceil(q * len(ordered)) - 1)
+        ]
+
+    @property
+    def p50(self) -> float:
+        return (
+            statistics.median(self.samples) if self.samples else self.prior
+        )
+
+    @property
+    def p95(self) -> float:
+        return self.quantile(0.95)
+
+    @property
+    def expected(self) -> float:
+        """
+        Median latency inflated by the failure rate: the expected time to
+        get a usable answer from this deployment.
+        """
+        return self.p50 / max(1.0 - self.failure_rate, 0.05)
+
+
+class CompletionBackend(ABC):
+    """
+    A chat or text deployment that the multiplexor can send a prompt to.
+    """
+
+    def __init__(self, name: str, cost_per_1k_tokens: float = 0.0) -> None:
+        self.name: str = name
+        self.cost_per_1k_tokens: float = cost_per_1k_tokens
+        self.stats: LatencyStats = LatencyStats()
+
+    @abstractmethod
+    async def complete(self, prompt: str, max_tokens: int = 1024) -> str:
+        """
+        Completes an already rendered prompt.
+
+        Args:
+            prompt (str): The prompt, with every template variable filled
+                in.
+            max_tokens (int): The maximum number of tokens to generate.
+
+        Returns:
+            str: The completion.
+        """
+
+
+class NoValidAnswerError(RuntimeError):
+    """
+    Raised when none of the deployments produced a valid answer.
+    """
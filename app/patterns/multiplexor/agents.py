@@ -0,0 +1,126 @@
+from __future__ import annotations
+
+import random
+import asyncio
+from typing import Dict, List, Optional, Type, Union
+
+import semantic_kernel as sk
+from semantic_kernel.kernel import KernelFunction
+from semantic_kernel.connectors.ai.open_ai import (
+    AzureChatCompletion,
+    AzureTextCompletion,
+)
+
+from app.schemas.agents import ChatSchema, TextSchema
+from app.tools.limits import DeploymentLimiter, rate_limiter, throttled
+from app.utils.tokens import count_tokens
+from ._abstract import CompletionBackend
+
+
+class AzureDeploymentBackend(CompletionBackend):
+    """
+    An Azure OpenAI chat or text deployment, with its own kernel so the
+    multiplexor can address each deployment independently. Its requests go
+    through the deployment's shared rate limiter.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        schema: Union[ChatSchema, TextSchema],
+        completion: Type[
+            Union[AzureChatCompletion, AzureTextCompletion]
+        ] = AzureChatCompletion,
+        cost_per_1k_tokens: float = 0.0,
+    ) -> None:
+        super().__init__(name, cost_per_1k_tokens)
+        self.kernel = sk.Kernel()
+        service = completion(**schema.model_dump())
+        if completion is AzureTextCompletion:
+            self.kernel.add_text_completion_service(name, service)
+        else:
+            self.kernel.add_chat_service(name, service)
+        self._functions: Dict[int, KernelFunction] = {}
+        self.limiter: DeploymentLimiter = rate_limiter(schema)
+
+    def _function(self, max_tokens: int) -> KernelFunction:
+        if max_tokens not in self._functions:
+            self._functions[max_tokens] = (
+                self.kernel.create_semantic_function(
+                    "{{$input}}", max_tokens=max_tokens
+                )
+            )
+        return self._functions[max_tokens]
+
+    async def _complete(self, prompt: str, max_tokens: int) -> str:
+        answer = await self._function(max_tokens)(input=prompt)
+        if answer.error_occurred:
+            error = getattr(answer, 'last_exception', None)
+            if throttled(error) is not None:
+                raise error
+            raise RuntimeError(answer.last_error_description)
+        return answer.result
+
+    async def complete(self, prompt: str, max_tokens: int = 1024) -> str:
+        return await self.limiter.run(
+            lambda: self._complete(prompt, max_tokens),
+            count_tokens(prompt) + max_tokens,
+        )
+
+
+class FakeCompletionBackend(CompletionBackend):
+    """
+    Simulated deployment for tests and benchmarks. Latency follows a
+    log-normal distribution around `median` seconds, and a `failure_rate`
+    fraction of the calls raise or, with `invalid_rate`, answer empty.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        median: float = 0.5,
+        sigma: float = 0.5,
+        failure_rate: float = 0.0,
+        invalid_rate: float = 0.0,
+        cost_per_1k_tokens: float = 0.0,
+        answer: Optional[str] = None,
+        seed: Optional[int] = None,
+    ) -> None:
+        super().__init__(name, cost_per_1k_tokens)
+        self.median: float = median
+        self.sigma: float = sigma
+        self.failure_rate: float = failure_rate
+        self.invalid_rate: float = invalid_rate
+        self.answer: Optional[str] = answer
+        self.calls: int = 0
+        self._random: random.Random = random.Random(seed)
+
+    async def complete(self, prompt: str, max_tokens: int = 1024) -> str:
+        self.calls += 1
+        await asyncio.sleep(
+            self.median * self._random.lognormvariate(0.0, self.sigma)
+        )
+        draw = self._random.random()
+        if draw < self.failure_rate:
+            raise RuntimeError(f"{self.name} failed")
+        if draw < self.failure_rate + self.invalid_rate:
+            return ""
+        return self.answer or f"{self.name} answer to: {prompt[:80]}"
+
+
+def default_backends() -> List[CompletionBackend]:
+    """
+    Builds a backend for each deployment configured through ChatSchema and
+    TextSchema.
+    """
+    backends: List[CompletionBackend] = []
+    chat, text = ChatSchema(), TextSchema()
+    if chat.deployment_name:
+        backends.append(AzureDeploymentBackend(chat.deployment_name, chat))
+    if text.deployment_name:
+        backends.append(
+            AzureDeploymentBackend(
+                text.deployment_name, text, AzureTextCompletion
+            )
+        )
+    return backends
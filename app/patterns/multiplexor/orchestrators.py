@@ -0,0 +1,314 @@
+from __future__ import annotations
+
+import re
+import time
+import asyncio
+import logging
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import AsyncIterator, Callable, Dict, List, Optional
+
+from app.monitoring import span
+from app.patterns.simple.simple import SimpleRAG
+from app.utils.tokens import count_tokens
+from ._abstract import CompletionBackend, NoValidAnswerError
+from .agents import default_backends
+
+
+logger: logging.Logger = logging.getLogger(__name__)
+
+Validator = Callable[[str], bool]
+
+
+def non_empty(answer: str) -> bool:
+    return bool(answer and answer.strip())
+
+
+def _similarity(first: str, second: str) -> float:
+    a = set(re.findall(r"\w+", first.lower()))
+    b = set(re.findall(r"\w+", second.lower()))
+    return len(a & b) / len(a | b) if a | b else 1.0
+
+
+@dataclass
+class MultiplexResult:
+    backend: str
+    answer: str
+    seconds: float
+    consulted: List[str] = field(default_factory=list)
+
+
+class Multiplexor:
+    """
+    Sends one prompt to several deployments at once and settles on an
+    answer with one of three strategies:
+
+    - race: the first valid answer wins and the other requests are
+      cancelled.
+    - quorum: waits for `quorum` valid answers and keeps the one that
+      agrees most with the others.
+    - escalate: tries the deployments from the cheapest up, moving on
+      when an answer is invalid or slower than the deployment usually is.
+
+    Every attempt feeds the deployment's latency statistics, which decide
+    the order deployments are tried in and which of them join a race.
+    """
+
+    def __init__(
+        self,
+        backends: List[CompletionBackend],
+        validator: Validator = non_empty,
+        fanout: Optional[int] = None,
+        timeout: float = 120.0,
+        escalation_factor: float = 2.0,
+    ) -> None:
+        if not backends:
+            raise ValueError("The multiplexor needs at least one backend")
+        self.backends: List[CompletionBackend] = backends
+        self.validator: Validator = validator
+        self.fanout: int = fanout or len(backends)
+        self.timeout: float = timeout
+        self.escalation_factor: float = escalation_factor
+
+    def ranked(self) -> List[CompletionBackend]:
+        """
+        The backends ordered by the expected time to a usable answer.
+        """
+        return sorted(
+            self.backends, key=lambda backend: backend.stats.expected
+        )
+
+    async def _attempt(
+        self,
+        backend: CompletionBackend,
+        prompt: str,
+        max_tokens: int,
+        timeout: Optional[float] = None,
+    ) -> Optional[str]:
+        started = time.perf_counter()
+        try:
+            answer = await asyncio.wait_for(
+                backend.complete(prompt, max_tokens),
+                timeout or self.timeout,
+            )
+        except asyncio.CancelledError:
+            raise
+        except Exception:  # pylint: disable=broad-except
+            backend.stats.observe(
+                time.perf_counter() - started, failed=True
+            )
+            logger.warning(
+                "Deployment %s failed", backend.name, exc_info=True
+            )
+            return None
+        valid = self.validator(answer)
+        backend.stats.observe(
+            time.perf_counter() - started, failed=not valid
+        )
+        return answer if valid else None
+
+    async def _gather_valid(
+        self,
+        backends: List[CompletionBackend],
+        prompt: str,
+        max_tokens: int,
+        needed: int,
+    ) -> Dict[str, str]:
+        tasks: Dict[asyncio.Task, str] = {
+            asyncio.create_task(
+                self._attempt(backend, prompt, max_tokens)
+            ): backend.name
+            for backend in backends
+        }
+        answers: Dict[str, str] = {}
+        pending = set(tasks)
+        try:
+            while pending and len(answers) < needed:
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    if task.result() is not None:
+                        answers[tasks[task]] = task.result()
+        finally:
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+        return answers
+
+    async def race(
+        self, prompt: str, max_tokens: int = 1024
+    ) -> MultiplexResult:
+        started = time.perf_counter()
+        answers = await self._gather_valid(
+            self.ranked()[:self.fanout], prompt, max_tokens, needed=1
+        )
+        if not answers:
+            raise NoValidAnswerError(
+                "No deployment produced a valid answer"
+            )
+        name, answer = next(iter(answers.items()))
+        return MultiplexResult(
+            name, answer, time.perf_counter() - started, [name]
+        )
+
+    async def quorum(
+        self,
+        prompt: str,
+        max_tokens: int = 1024,
+        quorum: int = 2,
+    ) -> MultiplexResult:
+        started = time.perf_counter()
+        answers = await self._gather_valid(
+            self.ranked(), prompt, max_tokens, needed=quorum
+        )
+        if len(answers) < quorum:
+            raise NoValidAnswerError(
+                f"Only {len(answers)} of the {quorum} required answers "
+                "were valid"
+            )
+        name = max(
+            answers,
+            key=lambda candidate: sum(
+                _similarity(answers[candidate], answers[other])
+                for other in answers if other != candidate
+            ),
+        )
+        return MultiplexResult(
+            name,
+            answers[name],
+            time.perf_counter() - started,
+            list(answers),
+        )
+
+    async def escalate(
+        self, prompt: str, max_tokens: int = 1024
+    ) -> MultiplexResult:
+        started = time.perf_counter()
+        tried: List[str] = []
+        cheapest_first = sorted(
+            self.ranked(), key=lambda backend: backend.cost_per_1k_tokens
+        )
+        for position, backend in enumerate(cheapest_first):
+            last = position == len(cheapest_first) - 1
+            timeout = None
+            if backend.stats.samples and not last:
+                timeout = min(
+                    self.timeout,
+                    self.escalation_factor * backend.stats.p95,
+                )
+            tried.append(backend.name)
+            answer = await self._attempt(
+                backend, prompt, max_tokens, timeout
+            )
+            if answer is not None:
+                return MultiplexResult(
+                    backend.name,
+                    answer,
+                    time.perf_counter() - started,
+                    tried,
+                )
+        raise NoValidAnswerError(f"Every deployment failed: {tried}")
+
+    async def run(
+        self,
+        prompt: str,
+        strategy: str = "race",
+        max_tokens: int = 1024,
+    ) -> MultiplexResult:
+        """
+        Completes the prompt with the given strategy.
+
+        Args:
+            prompt (str): The rendered prompt.
+            strategy (str): One of 'race', 'quorum' or 'escalate'.
+            max_tokens (int): The maximum number of tokens to generate.
+
+        Returns:
+            MultiplexResult: The chosen answer and where it came from.
+        """
+        strategies = {
+            "race": self.race,
+            "quorum": self.quorum,
+            "escalate": self.escalate,
+        }
+        if strategy not in strategies:
+            raise ValueError(f"Unknown multiplexing strategy {strategy}")
+        return await strategies[strategy](prompt, max_tokens)
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        return {
+            backend.name: {
+                "p50": backend.stats.p50,
+                "p95": backend.stats.p95,
+                "failure_rate": backend.stats.failure_rate,
+            }
+            for backend in self.backends
+        }
+
+
+@lru_cache(maxsize=None)
+def multiplexor() -> Multiplexor:
+    """
+    Returns the process-wide multiplexor over the configured deployments,
+    so latency statistics accumulate across requests.
+    """
+    return Multiplexor(default_backends())
+
+
+class MultiplexorRAG(SimpleRAG):
+    """
+    SimpleRAG whose completion is multiplexed over several deployments. The
+    retrieval runs once; the rendered prompt is then sent to the
+    deployments according to `strategy`.
+    """
+
+    def __init__(
+        self,
+        *args,
+        multiplexor: Optional[Multiplexor] = None,
+        strategy: str = "race",
+        **kwargs
+    ) -> None:
+        super().__init__(*args, **kwargs)
+        self.multiplexor: Optional[Multiplexor] = multiplexor
+        self.strategy: str = strategy
+
+    async def __call__(
+        self,
+        chat_name: str,
+        prompt: str,
+        *args,
+        max_tokens: int = 1024,
+        **kwargs
+    ) -> Dict:
+        self._use_services()
+        await self.retrieve(
+            prompt,
+            self.context_budget(self.prompt_template, prompt, max_tokens),
+        )
+        self.context['input'] = prompt
+        rendered = await self.kernel.prompt_template_engine.render(
+            self.prompt_template, self.context
+        )
+        with span('llm'):
+            result = await (self.multiplexor or multiplexor()).run(
+                rendered, self.strategy, max_tokens
+            )
+        self.response['completion_tokens'] = count_tokens(result.answer)
+        self.response.update({
+            'response': result.answer,
+            'deployment': result.backend,
+            'consulted': result.consulted,
+        })
+        return self.response
+
+    async def stream(
+        self,
+        chat_name: str,
+        prompt: str,
+        *args,
+        **kwargs
+    ) -> AsyncIterator[str]:
+        response = await self(chat_name, prompt, *args, **kwargs)
+        yield response['response']
@@ -1,34 +1,95 @@
 from __future__ import annotations
+import asyncio
 from abc import ABC, abstractmethod
-from typing import Dict, Any
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache, partial
+from typing import Dict, Any, Optional
 from pydantic import BaseModel
 
 from app.agents import Agent
 
 
+@lru_cache(maxsize=None)
+def blocking_executor() -> ThreadPoolExecutor:
+    """
+    Returns the process-wide thread pool that runs the blocking data source
+    drivers.
+    """
+    return ThreadPoolExecutor(thread_name_prefix="researcher")
+
+
 class DataSource(ABC):
     """
     The DataSource interface represents a data source from which information
     can be retrieved. Each data source is a component that the Researcher can
-    visit.
+    visit. A source that exceeds its timeout is left out of the research.
     """
 
+    def __init__(self, timeout: Optional[float] = None) -> None:
+        self.timeout: Optional[float] = timeout
+
+    @property
+    def name(self) -> str:
+        return type(self).__name__
+
     @abstractmethod
-    def provide_data(self, query: str, params: BaseModel) -> Dict[str, Any]:
+    async def provide_data(
+        self, query: str, params: Optional[BaseModel] = None
+    ) -> Dict[str, Any]:
         """
         The provide data method returns data from the data source.
 
         Args:
             query (str): Query to be executed to get the data from the data source.
-            params (BaseModel): Parameters to be used to conect to the data source.
+            params (Optional[BaseModel]): Parameters to be used to conect
+                to the data source.
 
         Returns:
             Dict[str, Any]: a set of retrieved information, described as a dictionary.
         """
 
+    async def accept(
+        self,
+        researcher: AbstractResearcher,
+        query: str,
+        params: Optional[BaseModel] = None
+    ) -> None:
+        await researcher.visit_data_source(self, query, params)
+
+
+class BlockingDataSource(DataSource):
+    """
+    A data source whose driver only offers blocking calls. The call runs in
+    the shared thread pool so it does not stall the event loop. A call that
+    times out stops being awaited, but its thread runs until the driver
+    returns.
+    """
+
     @abstractmethod
-    def accept(self, researcher: AbstractResearcher) -> None:
-        pass
+    def fetch(
+        self, query: str, params: Optional[BaseModel] = None
+    ) -> Dict[str, Any]:
+        """
+        Runs the query with the blocking driver.
+
+        Args:
+            query (str): Query to be executed to get the data from the data
+                source.
+            params (Optional[BaseModel]): Parameters to be used to conect
+                to the data source.
+
+        Returns:
+            Dict[str, Any]: a set of retrieved information, described as a
+                dictionary.
+        """
+
+    async def provide_data(
+        self, query: str, params: Optional[BaseModel] = None
+    ) -> Dict[str, Any]:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            blocking_executor(), partial(self.fetch, query, params)
+        )
 
 
 class AbstractResearcher(Agent):
@@ -40,5 +101,10 @@ class AbstractResearcher(Agent):
         pass
 
     @abstractmethod
-    def visit_data_source(self, source: DataSource) -> None:
+    async def visit_data_source(
+        self,
+        source: DataSource,
+        query: str,
+        params: Optional[BaseModel] = None
+    ) -> None:
         pass
@@ -1,3 +1,5 @@
+import time
+import asyncio
 from typing import List
 
 from ._abstract import AbstractResearcher, DataSource
@@ -5,24 +7,37 @@ from .researchers import ConcreteResearcher
 from .sources import CosmosDataSource, SQLDataSource, DatabricksDataSource, BlobDataSource
 
 
-def client_code(data_sources: List[DataSource], researcher: AbstractResearcher) -> None:
-    for source in data_sources:
-        source.accept(researcher)
-    synthesized_info = researcher.synthesize_information()
-    print(f"Synthesized Information: {synthesized_info}")
+async def client_code(
+    data_sources: List[DataSource],
+    researcher: AbstractResearcher,
+    query: str,
+) -> None:
+    started = time.perf_counter()
+    synthesized_info = await researcher.research(data_sources, query)
+    elapsed = time.perf_counter() - started
+    print(f"Synthesized Information ({elapsed:.3f}s): {synthesized_info}")
 
 
-def main():
-    components = [CosmosDataSource(), SQLDataSource(), DatabricksDataSource(), BlobDataSource()]
+async def main():
+    components = [
+        CosmosDataSource(timeout=5.0),
+        SQLDataSource(timeout=5.0),
+        DatabricksDataSource(timeout=10.0),
+        BlobDataSource(timeout=5.0),
+    ]
 
     print("The client code works with all visitors via the base Visitor interface:")
-    visitor1 = ConcreteResearcher()
-    client_code(components, visitor1)
+    visitor1 = ConcreteResearcher(deadline=15.0)
+    await client_code(
+        components, visitor1, "What were last quarter's sales?"
+    )
 
     print("It allows the same client code to work with different types of visitors:")
-    visitor2 = ConcreteResearcher()
-    client_code(components, visitor2)
+    visitor2 = ConcreteResearcher(deadline=15.0)
+    await client_code(
+        components, visitor2, "Which products are out of stock?"
+    )
 
 
 if __name__ == "__main__":
-    main()
+    asyncio.run(main())
@@ -1,22 +1,149 @@
-from typing import Optional
+from typing import Any, Dict, List, Optional, Type
 import uuid
+import asyncio
+import logging
+
+from pydantic import BaseModel
+from semantic_kernel.connectors.ai.open_ai import AzureChatCompletion
+from semantic_kernel.kernel import KernelFunction
 
 from app.patterns.researcher._abstract import AbstractResearcher, DataSource
+from app.schemas.agents import ChatSchema
+
+
+logger: logging.Logger = logging.getLogger(__name__)
 
 
 class ConcreteResearcher(AbstractResearcher):
+    """
+    Visits every data source concurrently, so the research takes as long as
+    the slowest source rather than the sum of all of them. Each result is
+    digested as soon as its source answers, while the slower sources are
+    still running.
+    """
+
+    prompt_template: str = """
+        You are a research assistant.\n
+        Answer the question using only the research notes below, collected
+        from different data sources.\n
+        \n------------------------------\n
+        {{$research}}
+        \n------------------------------\n
+        Question: {{$input}}
+        """
 
-    def __init__(self, *args, chat_id: Optional[uuid.UUID] = None, **kwargs) -> None:
-        super().__init__(*args, chat_id, **kwargs)
-        self.collected_data = []
+    def __init__(
+        self,
+        *args,
+        chat_id: Optional[uuid.UUID] = None,
+        sources: Optional[List[DataSource]] = None,
+        deadline: Optional[float] = None,
+        **kwargs
+    ) -> None:
+        super().__init__(*args, chat_id=chat_id, **kwargs)
+        self.sources: List[DataSource] = sources or []
+        self.deadline: Optional[float] = deadline
+        self.collected_data: Dict[str, Dict[str, Any]] = {}
+        self.failures: Dict[str, str] = {}
+        self.digests: List[str] = []
+
+    def _config_service(
+        self,
+        chat_name: str,
+        completion: Type[AzureChatCompletion] = AzureChatCompletion,
+        schema: ChatSchema = ChatSchema()
+    ) -> None:
+        self._use_services(chat_name, completion, schema)
+
+    async def visit_data_source(
+        self,
+        source: DataSource,
+        query: str,
+        params: Optional[BaseModel] = None
+    ) -> None:
+        try:
+            data = await asyncio.wait_for(
+                source.provide_data(query, params), timeout=source.timeout
+            )
+        except asyncio.TimeoutError:
+            self.failures[source.name] = (
+                f"timed out after {source.timeout}s"
+            )
+            logger.warning(
+                "Data source %s timed out after %ss",
+                source.name,
+                source.timeout,
+            )
+            return
+        except Exception as error:  # pylint: disable=broad-except
+            self.failures[source.name] = repr(error)
+            logger.exception("Data source %s failed", source.name)
+            return
+        self.collected_data[source.name] = data
+        self.digests.append(await self.digest(source.name, data))
+
+    async def digest(self, name: str, data: Dict[str, Any]) -> str:
+        """
+        Turns the data of one source into research notes. It runs as soon
+        as the source answers; override it to summarize large results with
+        a model.
 
-    def visit_data_source(self, source: DataSource, *args, **kwargs) -> None:
-        data = source.provide_data(*args, **kwargs)
-        self.collected_data.append(data)
-        print(f"Collected data: {data}")
+        Args:
+            name (str): The name of the data source.
+            data (Dict[str, Any]): The data the source provided.
+
+        Returns:
+            str: The research notes of the source.
+        """
+        details = "\n".join(
+            f"{key}: {value}" for key, value in data.items()
+        )
+        return f"{name}:\n{details}"
+
+    async def research(
+        self,
+        sources: List[DataSource],
+        query: str,
+        params: Optional[BaseModel] = None
+    ) -> str:
+        """
+        Visits the sources concurrently and synthesizes what they provided.
+        Sources still running when the deadline expires are cancelled.
+
+        Args:
+            sources (List[DataSource]): The data sources to visit.
+            query (str): The query sent to every source.
+            params (Optional[BaseModel]): Parameters to be used to conect
+                to the data sources.
+
+        Returns:
+            str: The synthesized information.
+        """
+        tasks = {
+            asyncio.create_task(source.accept(self, query, params)): source
+            for source in sources
+        }
+        if tasks:
+            _, pending = await asyncio.wait(tasks, timeout=self.deadline)
+            for task in pending:
+                task.cancel()
+                self.failures[tasks[task].name] = (
+                    f"cancelled at the {self.deadline}s deadline"
+                )
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
+        return self.synthesize_information()
 
     def synthesize_information(self) -> str:
         """
-        Synthesize information from all collected data.
+        Synthesize information from all collected data, in the order it
+        arrived.
         """
-        return " ".join(self.collected_data)
+        return "\n\n".join(self.digests)
+
+    async def prompt(self, prompt: str, **kwargs) -> KernelFunction:
+        if self.sources and not self.collected_data:
+            await self.research(self.sources, prompt)
+        self.context['input'] = prompt
+        self.context['research'] = self.synthesize_information()
+        return self._semantic_function(self.prompt_template, **kwargs)
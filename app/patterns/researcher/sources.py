@@ -1,48 +1,45 @@
-from typing import Any, Dict
+from typing import Any, Dict, Optional
 
 from pydantic import BaseModel
-from ._abstract import DataSource, AbstractResearcher
+from ._abstract import BlockingDataSource, DataSource
 
 
 class CosmosDataSource(DataSource):
     """
-    Extracts data from a CosmosDB instance.
+    Extracts data from a CosmosDB instance through its async driver.
     """
-    def provide_data(self, query: str, params: BaseModel) -> Dict[str, Any]:
-        pass
+    async def provide_data(
+        self, query: str, params: Optional[BaseModel] = None
+    ) -> Dict[str, Any]:
+        return {"source": self.name, "data": "Data from Source A"}
 
-    def accept(self, researcher: AbstractResearcher) -> None:
-        researcher.visit_data_source(self)
 
-
-class SQLDataSource(DataSource):
+class SQLDataSource(BlockingDataSource):
     """
-    Extracts data from a Azure SQL instance.
+    Extracts data from a Azure SQL instance. The ODBC driver is blocking.
     """
-    def provide_data(self, query: str, params: BaseModel) -> Dict[str, Any]:
-        return "Data from Source B"
-
-    def accept(self, researcher: AbstractResearcher) -> None:
-        researcher.visit_data_source(self)
+    def fetch(
+        self, query: str, params: Optional[BaseModel] = None
+    ) -> Dict[str, Any]:
+        return {"source": self.name, "data": "Data from Source B"}
 
 
-class DatabricksDataSource(DataSource):
+class DatabricksDataSource(BlockingDataSource):
     """
-    Extracts data from a Azure Databricks instance.
+    Extracts data from a Azure Databricks instance. The SQL connector is
+    blocking.
     """
-    def provide_data(self, query: str, params: BaseModel) -> Dict[str, Any]:
-        return "Data from Source B"
-
-    def accept(self, researcher: AbstractResearcher) -> None:
-        researcher.visit_data_source(self)
+    def fetch(
+        self, query: str, params: Optional[BaseModel] = None
+    ) -> Dict[str, Any]:
+        return {"source": self.name, "data": "Data from Source C"}
 
 
 class BlobDataSource(DataSource):
     """
-    Extracts data from a BlobStorage instance.
+    Extracts data from a BlobStorage instance through its async client.
     """
-    def provide_data(self, query: str, params: BaseModel) -> Dict[str, Any]:
-        return "Data from Source B"
-
-    def accept(self, researcher: AbstractResearcher) -> None:
-        researcher.visit_data_source(self)
+    async def provide_data(
+        self, query: str, params: Optional[BaseModel] = None
+    ) -> Dict[str, Any]:
+        return {"source": self.name, "data": "Data from Source D"}
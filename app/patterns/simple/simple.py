@@ -2,18 +2,19 @@ from __future__ import annotations
 
 import uuid
 import logging
-from typing import Type, Optional
+from typing import Dict, List, Type, Optional
 
 from semantic_kernel.connectors.ai.open_ai import AzureChatCompletion
 from semantic_kernel.kernel import KernelFunction
 
-from azure.core.credentials import AzureKeyCredential
-from azure.search.documents.aio import SearchClient
-
 from app.agents.agents import MemoryAgent
-from app.schemas.agents import ChatSchema, SearchEngineSchema
+from app.schemas.agents import ChatSchema
+from app.tools.caches import CompletionCache, completion_cache
 from app.tools.memories import CosmosMongoMemory
-from app.utils.tracker import evaluate_performance
+from app.tools.packing import ContextPacker
+from app.tools.retrievers import CallableRetriever, Retriever
+from app.tools.search import search_engine
+from app.monitoring import instrument
 
 
 logger: logging.Logger = logging.getLogger(__name__)
@@ -21,42 +22,12 @@ logger: logging.Logger = logging.getLogger(__name__)
 
 class SimpleRAG(MemoryAgent):
 
-    def _config_service(
-        self,
-        chat_name: str,
-        completion: Type[AzureChatCompletion] = AzureChatCompletion,
-        schema: ChatSchema = ChatSchema(),
-        memory: Optional[CosmosMongoMemory] = None
-    ) -> None:
-        """
-        Configures and adds a chat service to the kernel.
-
-        Args:
-            chat_name (str): Name of the chat service to configure.
-            *args: Variable length argument list for the chat service.
-            **kwargs: Arbitrary keyword arguments for the chat service.
-        """
-        self.kernel.add_chat_service(
-            chat_name,
-            completion(**schema.model_dump())
-        )
-        if memory:
-            self._chat_history(memory)
-
-    @evaluate_performance
-    async def prompt(self, prompt: str, **kwargs) -> KernelFunction:
-        """
-        Creates and returns a semantic function based on the given prompt and tool mappings.
-
-        Args:
-            prompt (str): The prompt to use for creating the semantic function.
-            **kwargs: Arbitrary keyword arguments for the semantic function.
-
-        Returns:
-            KernelFunctionBase: The created semantic function.
-        """
-
-        prompt_template = """
+    packer: ContextPacker = ContextPacker(budget=4_000)
+    completions: CompletionCache = completion_cache()
+    research: Optional[Retriever] = None
+    min_search_score: float = 20.0
+    # pylint: disable=line-too-long
+    prompt_template: str = """
         You are a research assistant.\n
         You will write a summary of the research, with a brief introduction and a review of the topic.\n
         Your answer should be structured in topics, based on the content of the chat history and the presaved terms of the research.\n
@@ -71,38 +42,7 @@ class SimpleRAG(MemoryAgent):
         Provide a summary to a research based on the following question:\n
         {{$input}}
         """
-    
-        self.context['chat_history'] = await self.kernel.memory.search('ragMemory', prompt, 10)
-        self.context['RESEARCH_TOPICS'] = await self.augmented_retrieve(prompt)
-        self.context['input'] = prompt
-        return self.kernel.create_semantic_function(prompt_template, **kwargs)
-
-    async def augmented_retrieve(self, prompt: str) -> str:
-        """
-        Performs an augmented retrieval of research documents based on the provided prompt.
-
-        Args:
-            prompt (str): The prompt to use for the retrieval.
-
-        Returns:
-            str: Aggregated content of the top relevant research documents.
-        """
-        schema = SearchEngineSchema()
-        search_engine = SearchClient(
-            endpoint=schema.endpoint,
-            index_name=schema.index_name,
-            credential=AzureKeyCredential(schema.search_key)
-        )
-        research_docs = ''
-        async with search_engine:
-            results = await search_engine.search(search_text=prompt, top=10)
-            async for result in results:
-                if result.get('@search.score', 0) > 20:
-                    research_docs += result['content'] + '\n'
-        return research_docs
-
-
-class OneShotRAG(MemoryAgent):
+    # pylint: enable=line-too-long
 
     def _config_service(
         self,
@@ -119,14 +59,11 @@ class OneShotRAG(MemoryAgent):
             *args: Variable length argument list for the chat service.
             **kwargs: Arbitrary keyword arguments for the chat service.
         """
-        self.kernel.add_chat_service(
-            chat_name,
-            completion(**schema.model_dump())
-        )
         if memory:
             self._chat_history(memory)
+        self._use_services(chat_name, completion, schema)
 
-    @evaluate_performance
+    @instrument
     async def prompt(self, prompt: str, **kwargs) -> KernelFunction:
         """
         Creates and returns a semantic function based on the given prompt and tool mappings.
@@ -139,7 +76,55 @@ class OneShotRAG(MemoryAgent):
             KernelFunctionBase: The created semantic function.
         """
 
-        prompt_template = """
+        await self.retrieve(
+            prompt,
+            self.context_budget(
+                self.prompt_template, prompt, kwargs.get('max_tokens', 0)
+            ),
+        )
+        self.context['input'] = prompt
+        return self._semantic_function(self.prompt_template, **kwargs)
+
+    def retrievers(self) -> Dict[str, Retriever]:
+        """
+        The chat history and the research documents. The research documents
+        come from the `research` retriever when one is set, such as a local
+        HybridRetriever, and from Azure AI Search otherwise.
+        """
+        return {
+            **super().retrievers(),
+            'RESEARCH_TOPICS': self.research or CallableRetriever(
+                self.augmented_retrieve, timeout=self.retrieval_timeout
+            ),
+        }
+
+    async def augmented_retrieve(self, prompt: str) -> List[str]:
+        """
+        Performs an augmented retrieval of research documents based on the provided prompt.
+
+        Args:
+            prompt (str): The prompt to use for the retrieval.
+
+        Returns:
+            List[str]: The content of the top relevant research documents,
+                best first.
+        """
+        results = await search_engine().search(prompt, top=10)
+        return [
+            result['content']
+            for result in results
+            if result.get('@search.score', 0) > self.min_search_score
+        ]
+
+
+class OneShotRAG(MemoryAgent):
+
+    packer: ContextPacker = ContextPacker(budget=3_000)
+    completions: CompletionCache = completion_cache()
+    research: Optional[Retriever] = None
+    min_search_score: float = 20.0
+    # pylint: disable=line-too-long
+    prompt_template: str = """
         You are a research assistant.\n
         You will write a summary of the research, with a brief introduction and a review of the topic.\n
         Your answer should be structured in topics, based on the content of the chat history and the presaved terms of the research.\n
@@ -194,13 +179,66 @@ class OneShotRAG(MemoryAgent):
         Provide a summary to a research based on the following question:\n
         {{$input}}
         """
-    
-        self.context['chat_history'] = await self.kernel.memory.search('ragMemory', prompt, 10)
-        self.context['RESEARCH_TOPICS'] = await self.augmented_retrieve(prompt)
+    # pylint: enable=line-too-long
+
+    def _config_service(
+        self,
+        chat_name: str,
+        completion: Type[AzureChatCompletion] = AzureChatCompletion,
+        schema: ChatSchema = ChatSchema(),
+        memory: Optional[CosmosMongoMemory] = None
+    ) -> None:
+        """
+        Configures and adds a chat service to the kernel.
+
+        Args:
+            chat_name (str): Name of the chat service to configure.
+            *args: Variable length argument list for the chat service.
+            **kwargs: Arbitrary keyword arguments for the chat service.
+        """
+        if memory:
+            self._chat_history(memory)
+        self._use_services(chat_name, completion, schema)
+
+    @instrument
+    async def prompt(self, prompt: str, **kwargs) -> KernelFunction:
+        """
+        Creates and returns a semantic function based on the given prompt
+        and tool mappings.
+
+        Args:
+            prompt (str): The prompt to use for creating the semantic
+                function.
+            **kwargs: Arbitrary keyword arguments for the semantic
+                function.
+
+        Returns:
+            KernelFunctionBase: The created semantic function.
+        """
+
+        await self.retrieve(
+            prompt,
+            self.context_budget(
+                self.prompt_template, prompt, kwargs.get('max_tokens', 0)
+            ),
+        )
         self.context['input'] = prompt
-        return self.kernel.create_semantic_function(prompt_template, **kwargs)
+        return self._semantic_function(self.prompt_template, **kwargs)
+
+    def retrievers(self) -> Dict[str, Retriever]:
+        """
+        The chat history and the research documents. The research documents
+        come from the `research` retriever when one is set, such as a local
+        HybridRetriever, and from Azure AI Search otherwise.
+        """
+        return {
+            **super().retrievers(),
+            'RESEARCH_TOPICS': self.research or CallableRetriever(
+                self.augmented_retrieve, timeout=self.retrieval_timeout
+            ),
+        }
 
-    async def augmented_retrieve(self, prompt: str) -> str:
+    async def augmented_retrieve(self, prompt: str) -> List[str]:
         """
         Performs an augmented retrieval of research documents based on the provided prompt.
 
@@ -208,18 +246,12 @@ class OneShotRAG(MemoryAgent):
             prompt (str): The prompt to use for the retrieval.
 
         Returns:
-            str: Aggregated content of the top relevant research documents.
+            List[str]: The content of the top relevant research documents,
+                best first.
         """
-        schema = SearchEngineSchema()
-        search_engine = SearchClient(
-            endpoint=schema.endpoint,
-            index_name=schema.index_name,
-            credential=AzureKeyCredential(schema.search_key)
-        )
-        research_docs = ''
-        async with search_engine:
-            results = await search_engine.search(search_text=prompt, top=10)
-            async for result in results:
-                if result.get('@search.score', 0) > 20:
-                    research_docs += result['content'] + '\n'
-        return research_docs
+        results = await search_engine().search(prompt, top=10)
+        return [
+            result['content']
+            for result in results
+            if result.get('@search.score', 0) > self.min_search_score
+        ]
@@ -0,0 +1,38 @@
+"""
+A package that runs agents as a dependency graph of concurrent tasks.
+"""
+
+__all__ = [
+    "NodeTiming",
+    "SharedRetrieval",
+    "SharedRetrievalMixin",
+    "SwarmNode",
+    "SwarmOneShotRAG",
+    "SwarmRun",
+    "SwarmScheduler",
+    "SwarmSimpleRAG",
+    "SynthesisAgent",
+    "TokenBudget",
+    "group_semaphore",
+    "research_swarm",
+    "token_budget",
+]
+__author__ = "Ricardo Cataldi"
+__version__ = "0.1.0"
+__status__ = "In Development"
+
+from ._abstract import NodeTiming, SharedRetrieval, SwarmNode
+from .agents import (
+    SharedRetrievalMixin,
+    SwarmOneShotRAG,
+    SwarmSimpleRAG,
+    SynthesisAgent,
+)
+from .orchestrators import (
+    SwarmRun,
+    SwarmScheduler,
+    TokenBudget,
+    group_semaphore,
+    research_swarm,
+    token_budget,
+)
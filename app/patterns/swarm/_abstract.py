@@ -0,0 +1,99 @@
+from __future__ import annotations
+
+import asyncio
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+
+from app.agents import Agent
+from app.tools.retrievers import Retriever, fan_out_passages
+
+
+Upstream = Dict[str, Dict[str, Any]]
+
+
+@dataclass
+class SwarmNode:
+    """
+    One agent run in a swarm. The prompt is either fixed or built from the
+    responses of the nodes it depends on.
+    """
+    name: str
+    agent: Callable[[], Agent]
+    prompt: Union[str, Callable[[Upstream], str]]
+    depends_on: Tuple[str, ...] = ()
+    group: Optional[str] = None
+    chat_name: str = 'researcher'
+    max_tokens: int = 1024
+    timeout: Optional[float] = None
+
+    def render(self, upstream: Upstream) -> str:
+        return (
+            self.prompt
+            if isinstance(self.prompt, str)
+            else self.prompt(upstream)
+        )
+
+
+@dataclass
+class NodeTiming:
+    name: str
+    depends_on: Tuple[str, ...]
+    ready_at: float = 0.0
+    started_at: float = 0.0
+    finished_at: float = 0.0
+    status: str = 'pending'
+    error: Optional[str] = None
+
+    @property
+    def waited(self) -> float:
+        return self.started_at - self.ready_at if self.started_at else 0.0
+
+    @property
+    def ran(self) -> float:
+        return (
+            self.finished_at - self.started_at if self.started_at else 0.0
+        )
+
+
+class SharedRetrieval:
+    """
+    Retrieved passages shared, read-only, by every agent of a swarm run.
+    Each retriever, identified by the template variable it fills, is
+    queried once per prompt however many agents ask for it.
+    """
+
+    def __init__(self, deadline: Optional[float] = None) -> None:
+        self.deadline: Optional[float] = deadline
+        self._results: Dict[Tuple[str, str], asyncio.Future] = {}
+
+    async def get(
+        self, prompt: str, retrievers: Dict[str, Retriever]
+    ) -> Dict[str, List[str]]:
+        missing = {
+            name: retriever for name, retriever in retrievers.items()
+            if (name, prompt) not in self._results
+        }
+        if missing:
+            loop = asyncio.get_running_loop()
+            futures = {name: loop.create_future() for name in missing}
+            for name, future in futures.items():
+                self._results[(name, prompt)] = future
+            try:
+                retrieved = await fan_out_passages(
+                    missing, prompt, deadline=self.deadline
+                )
+            except BaseException as error:
+                for name, future in futures.items():
+                    del self._results[(name, prompt)]
+                    future.cancel()
+                raise error
+            for name, future in futures.items():
+                future.set_result(retrieved[name])
+        names = list(retrievers)
+        values: List[List[str]] = await asyncio.gather(
+            *(
+                asyncio.shield(self._results[(name, prompt)])
+                for name in names
+            )
+        )
+        return dict(zip(names, values))
@@ -0,0 +1,66 @@
+from __future__ import annotations
+
+from typing import Dict, Optional, Type
+
+from semantic_kernel.connectors.ai.open_ai import AzureChatCompletion
+from semantic_kernel.kernel import KernelFunction
+
+from app.agents import Agent
+from app.patterns.simple.simple import OneShotRAG, SimpleRAG
+from app.schemas.agents import ChatSchema
+from ._abstract import SharedRetrieval
+
+
+class SharedRetrievalMixin:
+    """
+    Makes a MemoryAgent read its retrieval results from the swarm's shared
+    retrieval instead of querying every source itself.
+    """
+
+    shared_retrieval: Optional[SharedRetrieval] = None
+
+    async def retrieve(
+        self, prompt: str, budget: Optional[int] = None
+    ) -> Dict[str, str]:
+        if self.shared_retrieval is None:
+            return await super().retrieve(prompt, budget)
+        passages = await self.shared_retrieval.get(
+            prompt, self.retrievers()
+        )
+        return self.fill_context(passages, budget)
+
+
+class SwarmSimpleRAG(SharedRetrievalMixin, SimpleRAG):
+    pass
+
+
+class SwarmOneShotRAG(SharedRetrievalMixin, OneShotRAG):
+    pass
+
+
+class SynthesisAgent(Agent):
+    """
+    Merges the answers of upstream agents into a single response.
+    """
+
+    prompt_template: str = """
+        You are a research editor.\n
+        You will merge the following research notes, written by different
+        assistants about the same question, into one coherent answer.\n
+        Keep every relevant fact, remove repetitions and resolve
+        contradictions in favor of the best supported note.\n
+        \n------------------------------\n
+        {{$input}}
+        """
+
+    def _config_service(
+        self,
+        chat_name: str,
+        completion: Type[AzureChatCompletion] = AzureChatCompletion,
+        schema: ChatSchema = ChatSchema()
+    ) -> None:
+        self._use_services(chat_name, completion, schema)
+
+    async def prompt(self, prompt: str, **kwargs) -> KernelFunction:
+        self.context['input'] = prompt
+        return self._semantic_function(self.prompt_template, **kwargs)
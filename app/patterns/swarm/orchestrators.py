@@ -0,0 +1,324 @@
+from __future__ import annotations
+
+import os
+import time
+import uuid
+import asyncio
+import logging
+from functools import lru_cache, partial
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+from app.agents import Agent
+from app.utils.tokens import count_tokens
+from ._abstract import NodeTiming, SharedRetrieval, SwarmNode, Upstream
+from .agents import (
+    SharedRetrievalMixin,
+    SwarmOneShotRAG,
+    SwarmSimpleRAG,
+    SynthesisAgent,
+)
+
+
+logger: logging.Logger = logging.getLogger(__name__)
+
+SWARM_TOKENS_PER_MINUTE: int = int(
+    os.environ.get("SWARM_TOKENS_PER_MINUTE", "80000")
+)
+
+
+class TokenBudget:
+    """
+    Token bucket shared by every node of the swarm, refilled continuously
+    at `tokens_per_minute`.
+    """
+
+    def __init__(self, tokens_per_minute: int) -> None:
+        self.capacity: float = float(tokens_per_minute)
+        self.rate: float = tokens_per_minute / 60.0
+        self.available: float = self.capacity
+        self.updated: float = time.monotonic()
+        self._lock: asyncio.Lock = asyncio.Lock()
+
+    async def acquire(self, tokens: int) -> None:
+        tokens = min(float(tokens), self.capacity)
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.available = min(
+                    self.capacity,
+                    self.available + (now - self.updated) * self.rate,
+                )
+                self.updated = now
+                if self.available >= tokens:
+                    self.available -= tokens
+                    return
+                await asyncio.sleep((tokens - self.available) / self.rate)
+
+
+@lru_cache(maxsize=None)
+def token_budget(tokens_per_minute: int) -> TokenBudget:
+    """
+    Returns the process-wide budget of a tokens-per-minute rate, so every
+    swarm run of the process draws from the same bucket.
+    """
+    return TokenBudget(tokens_per_minute)
+
+
+@lru_cache(maxsize=None)
+def group_semaphore(group: str, limit: int) -> asyncio.Semaphore:
+    """
+    Returns the process-wide semaphore of a node group, so the group's
+    concurrency limit holds across every swarm run of the process.
+    """
+    return asyncio.Semaphore(limit)
+
+
+@dataclass
+class SwarmRun:
+    results: Dict[str, Dict[str, Any]] = field(default_factory=dict)
+    timings: Dict[str, NodeTiming] = field(default_factory=dict)
+    seconds: float = 0.0
+
+    def critical_path(self) -> List[str]:
+        """
+        The chain of dependencies that determined the run's duration: from
+        the last node to finish, repeatedly follow the dependency that
+        finished last.
+        """
+        finished = [t for t in self.timings.values() if t.status == 'done']
+        if not finished:
+            return []
+        node = max(finished, key=lambda timing: timing.finished_at)
+        path = [node.name]
+        while node.depends_on:
+            node = max(
+                (self.timings[name] for name in node.depends_on),
+                key=lambda timing: timing.finished_at,
+            )
+            path.append(node.name)
+        return path[::-1]
+
+    def report(self) -> Dict[str, Any]:
+        return {
+            'seconds': self.seconds,
+            'critical_path': self.critical_path(),
+            'nodes': {
+                name: {
+                    'status': timing.status,
+                    'waited': timing.waited,
+                    'ran': timing.ran,
+                    'error': timing.error,
+                }
+                for name, timing in self.timings.items()
+            },
+        }
+
+
+class SwarmScheduler:
+    """
+    Runs a DAG of agents on the event loop. A node starts as soon as all of
+    its dependencies are done, subject to the concurrency limit of its
+    group and to the swarm's token budget. Sibling agents share retrieval
+    results. A failed node marks everything downstream of it as skipped.
+    The budget defaults to SWARM_TOKENS_PER_MINUTE, and a
+    `tokens_per_minute` of 0 disables it.
+    """
+
+    def __init__(
+        self,
+        nodes: List[SwarmNode],
+        limits: Optional[Dict[str, int]] = None,
+        default_limit: int = 4,
+        tokens_per_minute: int = SWARM_TOKENS_PER_MINUTE,
+        retrieval_deadline: Optional[float] = 10.0,
+    ) -> None:
+        self.nodes: Dict[str, SwarmNode] = {
+            node.name: node for node in nodes
+        }
+        for node in nodes:
+            unknown = set(node.depends_on) - set(self.nodes)
+            if unknown:
+                raise ValueError(
+                    f"Node {node.name} depends on unknown nodes {unknown}"
+                )
+        self._check_acyclic()
+        self.limits: Dict[str, int] = limits or {}
+        self.default_limit: int = default_limit
+        self.budget: Optional[TokenBudget] = (
+            token_budget(tokens_per_minute) if tokens_per_minute else None
+        )
+        self.retrieval_deadline: Optional[float] = retrieval_deadline
+
+    def _check_acyclic(self) -> None:
+        visiting, visited = set(), set()
+
+        def visit(name: str) -> None:
+            if name in visited:
+                return
+            if name in visiting:
+                raise ValueError(f"The swarm has a cycle through {name}")
+            visiting.add(name)
+            for dependency in self.nodes[name].depends_on:
+                visit(dependency)
+            visiting.discard(name)
+            visited.add(name)
+
+        for name in self.nodes:
+            visit(name)
+
+    async def run(
+        self,
+        streamed: Optional[str] = None,
+        chunks: Optional[asyncio.Queue] = None,
+    ) -> SwarmRun:
+        """
+        Runs every node of the swarm.
+
+        Args:
+            streamed (Optional[str]): A node whose completion is streamed.
+            chunks (Optional[asyncio.Queue]): Receives the chunks of the
+                streamed node, then None once the run is over.
+
+        Returns:
+            SwarmRun: The responses and timings of the nodes.
+        """
+        started = time.perf_counter()
+        swarm = SwarmRun(timings={
+            name: NodeTiming(name, node.depends_on)
+            for name, node in self.nodes.items()
+        })
+        shared = SharedRetrieval(self.retrieval_deadline)
+        done: Dict[str, asyncio.Event] = {
+            name: asyncio.Event() for name in self.nodes
+        }
+
+        async def stream(
+            agent: Agent, node: SwarmNode, prompt: str
+        ) -> Dict:
+            async for chunk in agent.stream(
+                node.chat_name, prompt, max_tokens=node.max_tokens
+            ):
+                await chunks.put(chunk)
+            return agent.response
+
+        async def execute(node: SwarmNode) -> None:
+            timing = swarm.timings[node.name]
+            try:
+                for dependency in node.depends_on:
+                    await done[dependency].wait()
+                if any(
+                    swarm.timings[d].status != 'done'
+                    for d in node.depends_on
+                ):
+                    timing.status = 'skipped'
+                    return
+                timing.ready_at = time.perf_counter() - started
+                group = node.group or node.name
+                semaphore = group_semaphore(
+                    group, self.limits.get(group, self.default_limit)
+                )
+                upstream: Upstream = {
+                    d: swarm.results[d] for d in node.depends_on
+                }
+                prompt = node.render(upstream)
+                async with semaphore:
+                    if self.budget:
+                        await self.budget.acquire(
+                            count_tokens(prompt) + node.max_tokens
+                        )
+                    timing.started_at = time.perf_counter() - started
+                    agent = node.agent()
+                    if isinstance(agent, SharedRetrievalMixin):
+                        agent.shared_retrieval = shared
+                    if node.name == streamed and chunks is not None:
+                        answer = stream(agent, node, prompt)
+                    else:
+                        answer = agent(
+                            node.chat_name,
+                            prompt,
+                            max_tokens=node.max_tokens,
+                        )
+                    swarm.results[node.name] = await asyncio.wait_for(
+                        answer, node.timeout
+                    )
+                    timing.status = 'done'
+            except Exception as error:  # pylint: disable=broad-except
+                timing.status = 'failed'
+                timing.error = repr(error)
+                logger.exception("Swarm node %s failed", node.name)
+            finally:
+                timing.finished_at = time.perf_counter() - started
+                done[node.name].set()
+
+        try:
+            await asyncio.gather(
+                *(execute(node) for node in self.nodes.values())
+            )
+        finally:
+            if chunks is not None:
+                await chunks.put(None)
+        swarm.seconds = time.perf_counter() - started
+        return swarm
+
+
+def research_swarm(
+    prompt: str,
+    chat_id: Optional[uuid.UUID] = None,
+    chat_name: str = 'researcher',
+    max_tokens: int = 1024,
+    tokens_per_minute: int = SWARM_TOKENS_PER_MINUTE,
+) -> SwarmScheduler:
+    """
+    The default swarm: two research agents answer the prompt concurrently
+    from the same retrieval results, and a synthesis agent merges their
+    answers.
+
+    Args:
+        prompt (str): The user prompt.
+        chat_id (Optional[uuid.UUID]): The chat the agents answer in.
+        chat_name (str): The chat deployment used by every agent.
+        max_tokens (int): The completion budget of each agent.
+        tokens_per_minute (int): The token budget shared by the agents,
+            0 to disable it.
+
+    Returns:
+        SwarmScheduler: The scheduler, ready to run.
+    """
+    def synthesis(upstream: Upstream) -> str:
+        notes = '\n------------------------------\n'.join(
+            f"{name}:\n{result['response']}"
+            for name, result in upstream.items()
+        )
+        return f"Question: {prompt}\n{notes}"
+
+    options: Dict[str, Any] = {
+        'chat_name': chat_name,
+        'max_tokens': max_tokens,
+    }
+    return SwarmScheduler(
+        [
+            SwarmNode(
+                'research',
+                partial(SwarmSimpleRAG, chat_id=chat_id),
+                prompt,
+                group='rag',
+                **options,
+            ),
+            SwarmNode(
+                'one_shot',
+                partial(SwarmOneShotRAG, chat_id=chat_id),
+                prompt,
+                group='rag',
+                **options,
+            ),
+            SwarmNode(
+                'synthesis',
+                partial(SynthesisAgent, chat_id=chat_id),
+                synthesis,
+                depends_on=('research', 'one_shot'),
+                **options,
+            ),
+        ],
+        tokens_per_minute=tokens_per_minute,
+    )
@@ -24,6 +24,17 @@ class TextSchema(BaseModel):
     endpoint: str = os.getenv('AZURE_OPENAI_THIRD_ENDPOINT', '')
 
 
+class EmbeddingSchema(BaseModel):
+    deployment_name: str = os.getenv(
+        'AZURE_OPENAI_EMBEDDING_DEPLOYMENT_NAME', ''
+    )
+    api_key: str = os.getenv('AZURE_OPENAI_EMBEDDING_API_KEY', '')
+    endpoint: str = os.getenv('AZURE_OPENAI_EMBEDDING_ENDPOINT', '')
+    dimensions: int = int(
+        os.getenv('AZURE_OPENAI_EMBEDDING_DIMENSIONS', '1536')
+    )
+
+
 class SourceEngineSchema(BaseModel):
     origin: Dict[str, Any]
     destination: Dict[str, Any]
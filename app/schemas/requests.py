@@ -10,6 +10,7 @@ class ChatEndpoint(BaseModel):
     _id: uuid.UUID = uuid.uuid4()
     chat_name: str = 'researcher'
     max_tokens: int = 4096
+    stream: bool = False
 
 
 class ChatEndpointWithMemory(BaseModel):
@@ -18,3 +19,4 @@ class ChatEndpointWithMemory(BaseModel):
     _id: uuid.UUID = uuid.uuid4()
     chat_name: str = 'researcher'
     max_tokens: int = 4096
+    stream: bool = False
@@ -1,44 +1,581 @@
+"""
+Ingestion of paginated JSON APIs into MongoDB.
+
+Pages are fetched concurrently through one pooled HTTP session and parsed
+as they stream in, so only the records of the batch being translated are
+held in memory. Batches are translated into columns of the system's fields
+and written with unordered bulk inserts on the process-wide Motor client.
+"""
+from __future__ import annotations
+
 import json
+import time
+import asyncio
+import logging
+from dataclasses import dataclass, asdict
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+import aiohttp
+from aiohttp import web
+from motor.core import AgnosticDatabase
+from pymongo.errors import BulkWriteError
+
+from .mongo import MongoSettings
+
+
+logger: logging.Logger = logging.getLogger(__name__)
+
+_WHITESPACE = " \t\n\r"
+
+
+class _JSONStream:
+    """
+    Incremental reader of a JSON document arriving in chunks.
+    """
+
+    def __init__(self, chunks: AsyncIterator[bytes]) -> None:
+        self.chunks: AsyncIterator[bytes] = chunks
+        self.decoder: json.JSONDecoder = json.JSONDecoder()
+        self.buffer: str = ""
+        self.position: int = 0
+        self.eof: bool = False
+        self._pending: bytes = b""
+
+    async def _read(self) -> bool:
+        if self.eof:
+            return False
+        try:
+            chunk = await self.chunks.__anext__()
+        except StopAsyncIteration:
+            self.eof = True
+            chunk = b""
+        data = self._pending + chunk
+        try:
+            text, self._pending = data.decode("utf-8"), b""
+        except UnicodeDecodeError as error:
+            if self.eof:
+                raise
+            text = data[:error.start].decode("utf-8")
+            self._pending = data[error.start:]
+        self.buffer = self.buffer[self.position:] + text
+        self.position = 0
+        return True
+
+    async def peek(self) -> str:
+        """
+        Returns the next character that is not whitespace, without
+        consuming it.
+        """
+        while True:
+            while (
+                self.position < len(self.buffer)
+                and self.buffer[self.position] in _WHITESPACE
+            ):
+                self.position += 1
+            if self.position < len(self.buffer):
+                return self.buffer[self.position]
+            if not await self._read():
+                raise ValueError("Unexpected end of the JSON document")
+
+    async def expect(self, character: str) -> None:
+        if await self.peek() != character:
+            raise ValueError(
+                f"Expected {character!r} at {self.position} of the JSON "
+                "document"
+            )
+        self.position += 1
+
+    async def value(self) -> Any:
+        """
+        Decodes the next complete value. A value that ends with the buffer
+        is only accepted at the end of the document, since more digits of a
+        number may still be on their way.
+        """
+        await self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(
+                    self.buffer, self.position
+                )
+            except json.JSONDecodeError:
+                if not await self._read():
+                    raise
+                continue
+            if end < len(self.buffer) or self.eof:
+                self.position = end
+                return value
+            await self._read()
+
+
+async def stream_records(
+    chunks: AsyncIterator[bytes],
+    records_field: str,
+    meta: Dict[str, Any],
+) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Yields the records of a page as they are parsed, without holding the
+    whole page. The page is either an array of records, or an object with
+    the records under `records_field`; the other fields of the object, such
+    as the next cursor, are stored in `meta`.
+
+    Args:
+        chunks (AsyncIterator[bytes]): The body of the page.
+        records_field (str): The field of the page holding the records.
+        meta (Dict[str, Any]): Receives the other fields of the page.
+
+    Yields:
+        Dict[str, Any]: The records of the page, in order.
+    """
+    stream = _JSONStream(chunks)
+
+    async def array() -> AsyncIterator[Dict[str, Any]]:
+        await stream.expect("[")
+        if await stream.peek() == "]":
+            stream.position += 1
+            return
+        while True:
+            yield await stream.value()
+            if await stream.peek() == ",":
+                stream.position += 1
+                continue
+            await stream.expect("]")
+            return
 
-import requests
-from pymongo import MongoClient
+    if await stream.peek() == "[":
+        async for record in array():
+            yield record
+        return
+    await stream.expect("{")
+    if await stream.peek() == "}":
+        return
+    while True:
+        key = await stream.value()
+        await stream.expect(":")
+        if key == records_field and await stream.peek() == "[":
+            async for record in array():
+                yield record
+        else:
+            meta[key] = await stream.value()
+        if await stream.peek() == ",":
+            stream.position += 1
+            continue
+        await stream.expect("}")
+        return
 
 
 class APIImplementation:
-    def fetch_data(self, url: str):
-        response = requests.get(url)
-        if response.status_code == 200:
-            return json.loads(response.text)
+    """
+    A JSON API reached through one pooled HTTP session, opened on first
+    use.
+    """
+
+    def __init__(
+        self,
+        timeout: float = 60.0,
+        limit: int = 32,
+        chunk_size: int = 1 << 16,
+        headers: Optional[Dict[str, str]] = None,
+    ) -> None:
+        self.timeout: float = timeout
+        self.limit: int = limit
+        self.chunk_size: int = chunk_size
+        self.headers: Dict[str, str] = headers or {}
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    def session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                headers=self.headers,
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+                connector=aiohttp.TCPConnector(limit=self.limit),
+                raise_for_status=True,
+            )
+        return self._session
+
+    async def fetch_data(
+        self, url: str, params: Optional[Dict[str, Any]] = None
+    ) -> Any:
+        """
+        Fetches and parses a whole JSON document.
+
+        Args:
+            url (str): The URL of the document.
+            params (Optional[Dict[str, Any]]): The query string parameters.
+
+        Returns:
+            Any: The parsed document.
+        """
+        async with self.session().get(url, params=params) as response:
+            return await response.json(loads=json.loads, content_type=None)
+
+    async def stream_page(
+        self,
+        url: str,
+        params: Optional[Dict[str, Any]],
+        records_field: str,
+        meta: Dict[str, Any],
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Yields the records of a page as its body arrives. See
+        `stream_records`.
+        """
+        async with self.session().get(url, params=params) as response:
+            async for record in stream_records(
+                response.content.iter_chunked(self.chunk_size),
+                records_field,
+                meta,
+            ):
+                yield record
+
+    async def close(self) -> None:
+        if self._session is not None:
+            await self._session.close()
+
+
+@dataclass
+class IngestionReport:
+    records: int = 0
+    pages: int = 0
+    failed: int = 0
+    seconds: float = 0.0
+
+    @property
+    def records_per_second(self) -> float:
+        return self.records / self.seconds if self.seconds else 0.0
+
+    def as_dict(self) -> Dict[str, float]:
+        return {
+            **asdict(self),
+            "records_per_second": self.records_per_second,
+        }
 
 
 class DataIngestionAPIBridge:
+    """
+    Ingests the records of a paginated API into the customers, products and
+    purchases collections.
+
+    `api_to_system_map` maps the fields of an API record to the `customer`,
+    `products` and `purchase` fields of the system. Pages are addressed by
+    `pagination`:
+
+    - "cursor": each page holds the cursor of the next one in
+      `cursor_field`, so pages are fetched in sequence, overlapped with
+      the writes.
+    - "page": pages are numbered from 1, and after the first one, which
+      gives the number of pages in `total_pages_field`, they are fetched
+      `concurrency` at a time.
+    - None: a single document, either a record or a page of records.
+    """
+
     def __init__(
         self,
         api_connection_params: dict[str, str],
         api_implementation: APIImplementation,
         api_to_system_map: dict[str, str],
+        database: str = "mydatabase",
+        pagination: Optional[str] = None,
+        records_field: str = "data",
+        cursor_field: str = "next_cursor",
+        total_pages_field: str = "total_pages",
+        page_size: int = 500,
+        concurrency: int = 4,
+        batch_size: int = 1_000,
     ) -> None:
+        if pagination not in (None, "cursor", "page"):
+            raise ValueError(f"Unknown pagination {pagination}")
         self.api_connection_params: dict[str, str] = api_connection_params
         self.api_implementation: APIImplementation = api_implementation
         self.api_to_system_map: dict[str, str] = api_to_system_map
+        self.database_name: str = database
+        self.pagination: Optional[str] = pagination
+        self.records_field: str = records_field
+        self.cursor_field: str = cursor_field
+        self.total_pages_field: str = total_pages_field
+        self.page_size: int = page_size
+        self.concurrency: int = concurrency
+        self.batch_size: int = batch_size
 
-    def ingest_data(self):
+    @property
+    def database(self) -> AgnosticDatabase:
+        return MongoSettings().database(
+            self.database_name,
+            self.api_connection_params.get("mongo_connection_string"),
+        )
+
+    async def ingest_data(self) -> IngestionReport:
+        """
+        Ingests every page of the API.
+
+        Returns:
+            IngestionReport: The records ingested and the time it took.
+        """
         connection_url = self.api_connection_params.get("connection_url")
         if not connection_url:
             raise ValueError("Could not parse connection url.")
-        data = self.api_implementation.fetch_data(connection_url)
-        translated_data = self.translate_data(data)
-        self.store_data(translated_data)
-
-    def translate_data(self, data):
-        translated_data = {}
-        for key, value in self.api_to_system_map.items():
-            translated_data[value] = data.get(key, None)
-        return translated_data
-
-    def store_data(self, translated_data):
-        client = MongoClient("localhost", 27017)
-        db = client["mydatabase"]
-        db.customers.insert_one(translated_data["customer"])
-        db.products.insert_many(translated_data["products"])
-        db.purchases.insert_one(translated_data["purchase"])
+        report = IngestionReport()
+        started = time.perf_counter()
+        batches: asyncio.Queue = asyncio.Queue(self.concurrency * 2)
+
+        async def read() -> None:
+            if self.pagination == "cursor":
+                await self._by_cursor(connection_url, batches, report)
+            elif self.pagination == "page":
+                await self._by_page(connection_url, batches, report)
+            else:
+                await self._page(connection_url, None, batches, report)
+            for _ in range(self.concurrency):
+                await batches.put(None)
+
+        tasks = [asyncio.create_task(read())] + [
+            asyncio.create_task(self._write(batches, report))
+            for _ in range(self.concurrency)
+        ]
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
+        report.seconds = time.perf_counter() - started
+        logger.info("Ingested %s", report.as_dict())
+        return report
+
+    async def _page(
+        self,
+        url: str,
+        params: Optional[Dict[str, Any]],
+        batches: asyncio.Queue,
+        report: IngestionReport,
+    ) -> Dict[str, Any]:
+        """
+        Streams one page into batches of `batch_size` records.
+
+        Returns:
+            Dict[str, Any]: The fields of the page other than its records.
+        """
+        meta: Dict[str, Any] = {}
+        batch: List[Dict[str, Any]] = []
+        async for record in self.api_implementation.stream_page(
+            url, params, self.records_field, meta
+        ):
+            batch.append(record)
+            if len(batch) >= self.batch_size:
+                await batches.put(batch)
+                batch = []
+        if batch:
+            await batches.put(batch)
+        if (
+            self.pagination is None
+            and meta
+            and self.records_field not in meta
+        ):
+            await batches.put([meta])
+        report.pages += 1
+        return meta
+
+    async def _by_cursor(
+        self, url: str, batches: asyncio.Queue, report: IngestionReport
+    ) -> None:
+        cursor: Optional[str] = None
+        while True:
+            params = {
+                "limit": self.page_size,
+                **({"cursor": cursor} if cursor else {}),
+            }
+            meta = await self._page(url, params, batches, report)
+            cursor = meta.get(self.cursor_field)
+            if not cursor:
+                return
+
+    async def _by_page(
+        self, url: str, batches: asyncio.Queue, report: IngestionReport
+    ) -> None:
+        def params(page: int) -> Dict[str, Any]:
+            return {"page": page, "page_size": self.page_size}
+
+        meta = await self._page(url, params(1), batches, report)
+        total = int(meta.get(self.total_pages_field) or 1)
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def fetch(page: int) -> None:
+            async with semaphore:
+                await self._page(url, params(page), batches, report)
+
+        await asyncio.gather(
+            *(fetch(page) for page in range(2, total + 1))
+        )
+
+    async def _write(
+        self, batches: asyncio.Queue, report: IngestionReport
+    ) -> None:
+        while (batch := await batches.get()) is not None:
+            translated = self.translate_data(batch)
+            report.failed += await self.store_data(translated)
+            report.records += len(batch)
+
+    def translate_data(
+        self, data: List[Dict[str, Any]]
+    ) -> Dict[str, List[Any]]:
+        """
+        Renames the fields of a batch of API records to the system's.
+        Values are kept as the API sent them, nested documents included,
+        and fields missing from a record are left empty.
+
+        Args:
+            data (List[Dict[str, Any]]): The API records.
+
+        Returns:
+            Dict[str, List[Any]]: The values of each system field, one per
+                record.
+        """
+        return {
+            value: [record.get(key) for record in data]
+            for key, value in self.api_to_system_map.items()
+        }
+
+    async def store_data(
+        self, translated_data: Dict[str, List[Any]]
+    ) -> int:
+        """
+        Writes a translated batch with one unordered bulk insert per
+        collection.
+
+        Args:
+            translated_data (Dict[str, List[Any]]): The batch, by system
+                field.
+
+        Returns:
+            int: The number of documents that could not be written.
+        """
+        documents = {
+            "customers": [
+                customer
+                for customer in translated_data.get("customer", [])
+                if customer
+            ],
+            "products": [
+                product
+                for products in translated_data.get("products", [])
+                if products
+                for product in products
+            ],
+            "purchases": [
+                purchase
+                for purchase in translated_data.get("purchase", [])
+                if purchase
+            ],
+        }
+        database = self.database
+
+        async def insert(
+            collection: str, rows: List[Dict[str, Any]]
+        ) -> int:
+            if not rows:
+                return 0
+            try:
+                await database[collection].insert_many(rows, ordered=False)
+            except BulkWriteError as error:
+                return len(error.details.get("writeErrors", []))
+            return 0
+
+        failed = await asyncio.gather(
+            *(
+                insert(collection, rows)
+                for collection, rows in documents.items()
+            )
+        )
+        return sum(failed)
+
+
+class LocalAPIStub:
+    """
+    Serves generated purchase records on localhost, for tests and
+    benchmarks, with both cursor and page-numbered pagination on
+    `/purchases`. Each response is delayed by `latency` seconds, as a
+    remote API would be, and the bodies are encoded once and then served
+    from memory.
+
+    Usage:
+        >>> async with LocalAPIStub(records=10_000) as url:
+        >>>     params = {"connection_url": url}
+        >>>     await DataIngestionAPIBridge(params, ...).ingest_data()
+    """
+
+    def __init__(
+        self, records: int = 10_000, latency: float = 0.0, port: int = 0
+    ) -> None:
+        self.records: int = records
+        self.latency: float = latency
+        self.port: int = port
+        self.requests: int = 0
+        self._bodies: Dict[str, bytes] = {}
+        self._runner: Optional[web.AppRunner] = None
+
+    @staticmethod
+    def record(index: int) -> Dict[str, Any]:
+        order: Dict[str, Any] = {
+            "id": f"o{index}", "total": 1.5 * (index % 3 + 1)
+        }
+        if index % 5 == 0:
+            order["coupon"] = {"code": f"SAVE{index % 7}", "percent": 5}
+        return {
+            "client": {
+                "id": f"c{index % 997}",
+                "name": f"Customer {index % 997}",
+            },
+            "items": [
+                {
+                    "sku": f"p{(index + item) % 101}",
+                    "price": 1.5 * (item + 1),
+                }
+                for item in range(index % 3 + 1)
+            ],
+            "order": order,
+        }
+
+    def _page(
+        self, start: int, size: int
+    ) -> Tuple[List[Dict[str, Any]], int]:
+        stop = min(self.records, start + size)
+        return [self.record(index) for index in range(start, stop)], stop
+
+    def _body(self, query: Any) -> bytes:
+        if "page" in query:
+            size = int(query.get("page_size", 500))
+            page = int(query["page"])
+            data, _ = self._page((page - 1) * size, size)
+            body = {"data": data, "total_pages": -(-self.records // size)}
+        else:
+            size = int(query.get("limit", 500))
+            data, stop = self._page(int(query.get("cursor", 0)), size)
+            body = {
+                "data": data,
+                "next_cursor": str(stop) if stop < self.records else None,
+            }
+        return json.dumps(body).encode("utf-8")
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        self.requests += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        key = request.query_string
+        if key not in self._bodies:
+            self._bodies[key] = self._body(request.query)
+        return web.Response(
+            body=self._bodies[key], content_type="application/json"
+        )
+
+    async def __aenter__(self) -> str:
+        application = web.Application()
+        application.router.add_get("/purchases", self._handle)
+        self._runner = web.AppRunner(application)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, "127.0.0.1", self.port)
+        await site.start()
+        sockets = site._server.sockets  # pylint: disable=protected-access
+        port = sockets[0].getsockname()[1]
+        return f"http://127.0.0.1:{port}/purchases"
+
+    async def __aexit__(self, *args) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
@@ -51,6 +51,11 @@ class BaseConnection(ABC, metaclass=SettingsMeta):
             AgnosticDatabase: _description_
         """
 
+    async def close(self) -> None:
+        """
+        Releases the connections held by the settings
+        """
+
 
 class DataclassProtocol(Protocol):
     __dataclass_fields__: Dict
@@ -1,4 +1,6 @@
 import os
+from collections import OrderedDict
+from threading import Lock
 from typing import Optional
 
 from dataclasses import dataclass, field
@@ -17,31 +19,112 @@ class MongoSettings(BaseConnection, metaclass=SettingsMeta):
     """
     Database connection settings component
 
-    connects to a PostGres database using asyncpg
+    connects to a MongoDB database using motor, keeping one pooled client
+    per connection string. At most `max_clients` clients are kept, the
+    least recently used being closed beyond that.
     """
 
     engine: Optional[str] = field(default=os.environ.get("DC_ENGINE", "mongodb"))
     host: Optional[str] = field(default=os.environ.get("DC_HOST", "localhost"))
     port: Optional[str] = field(default=os.environ.get("DC_PORT", "27017"))
+    max_pool_size: int = field(
+        default=int(os.environ.get("DC_MAX_POOL_SIZE", "100"))
+    )
+    min_pool_size: int = field(
+        default=int(os.environ.get("DC_MIN_POOL_SIZE", "0"))
+    )
+    max_idle_time_ms: int = field(
+        default=int(os.environ.get("DC_MAX_IDLE_TIME_MS", "300000"))
+    )
+    server_selection_timeout_ms: int = field(
+        default=int(
+            os.environ.get("DC_SERVER_SELECTION_TIMEOUT_MS", "5000")
+        )
+    )
+    connect_timeout_ms: int = field(
+        default=int(os.environ.get("DC_CONNECT_TIMEOUT_MS", "10000"))
+    )
+    max_clients: int = field(
+        default=int(os.environ.get("DC_MAX_CLIENTS", "32"))
+    )
+    _clients: OrderedDict[str, AgnosticClient] = field(
+        default_factory=OrderedDict, init=False, repr=False
+    )
+    _clients_lock: Lock = field(
+        default_factory=Lock, init=False, repr=False
+    )
+
+    def connection_string(self) -> str:
+        return f"{self.engine}://{self.host}:{self.port}"
+
+    def client(
+        self, connection_string: Optional[str] = None
+    ) -> AgnosticClient:
+        """
+        Retrieves the shared client for a connection string, creating it on
+        first use. Callers should not hold on to the client, since it is
+        closed once evicted.
+
+        Args:
+            connection_string (Optional[str]): the connection string,
+                defaults to the settings.
+
+        Returns:
+            AgnosticClient: the pooled client
+        """
+        connection_string = connection_string or self.connection_string()
+        evicted = []
+        with self._clients_lock:
+            client = self._clients.get(connection_string)
+            if client is not None:
+                self._clients.move_to_end(connection_string)
+            else:
+                client = self._clients[connection_string] = (
+                    AsyncIOMotorClient(
+                        connection_string,
+                        maxPoolSize=self.max_pool_size,
+                        minPoolSize=self.min_pool_size,
+                        maxIdleTimeMS=self.max_idle_time_ms,
+                        serverSelectionTimeoutMS=(
+                            self.server_selection_timeout_ms
+                        ),
+                        connectTimeoutMS=self.connect_timeout_ms,
+                    )
+                )
+                while len(self._clients) > self.max_clients:
+                    evicted.append(self._clients.popitem(last=False)[1])
+        for stale in evicted:
+            stale.close()
+        return client
 
     async def connect(self, connection_string: Optional[str] = None) -> AgnosticClient:
         """
         connect to the database that is defined by the settings.
         """
-        if not connection_string:
-            connection_string = f"{self.engine}://{self.host}:{self.port}"
-        connection: AgnosticClient = AsyncIOMotorClient(connection_string)
-        return connection
+        return self.client(connection_string)
 
-    def database(self, name: str) -> AgnosticDatabase:
+    def database(
+        self, name: str, connection_string: Optional[str] = None
+    ) -> AgnosticDatabase:
         """
         Retrieves a database based on the current connection
 
         Args:
-            name (str): _description_
+            name (str): the name of the database
+            connection_string (Optional[str]): the connection string,
+                defaults to the settings.
 
         Returns:
-            AgnosticDatabase: _description_
+            AgnosticDatabase: the database on the shared client
+        """
+        return self.client(connection_string)[name]
+
+    async def close(self) -> None:
+        """
+        Closes every pooled client, to be called on application shutdown.
         """
-        client: AgnosticClient = self.connect()
-        return client[name]
+        with self._clients_lock:
+            clients = list(self._clients.values())
+            self._clients = OrderedDict()
+        for client in clients:
+            client.close()
@@ -1,5 +1,7 @@
 import os
-from typing import Optional
+import asyncio
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Optional
 from dataclasses import dataclass, field
 
 import asyncpg
@@ -15,7 +17,8 @@ class PostgresSettings(BaseConnection, metaclass=SettingsMeta):
     """
     Database connection settings component
 
-    connects to a PostGres database using asyncpg
+    connects to a PostGres database using asyncpg, sharing one connection
+    pool across the process.
     """
 
     engine: str = field(default=os.environ.get("DB_ENGINE", "postgres"))
@@ -24,45 +27,113 @@ class PostgresSettings(BaseConnection, metaclass=SettingsMeta):
     password: str = field(default=os.environ.get("DB_PASSWORD", "postgrespw"))
     port: str = field(default=os.environ.get("DB_PORT", "5432"))
     base_schema: str = field(default=os.environ.get("BASE_SCHEMA", "base_schema"))
+    name: str = field(default=os.environ.get("DB_NAME", "postgres"))
+    min_pool_size: int = field(
+        default=int(os.environ.get("DB_MIN_POOL_SIZE", "2"))
+    )
+    max_pool_size: int = field(
+        default=int(os.environ.get("DB_MAX_POOL_SIZE", "20"))
+    )
+    statement_cache_size: int = field(
+        default=int(os.environ.get("DB_STATEMENT_CACHE_SIZE", "1024"))
+    )
+    max_cached_statement_lifetime: int = field(
+        default=int(
+            os.environ.get("DB_MAX_CACHED_STATEMENT_LIFETIME", "3600")
+        )
+    )
+    max_inactive_connection_lifetime: float = field(
+        default=float(
+            os.environ.get("DB_MAX_INACTIVE_CONNECTION_LIFETIME", "300")
+        )
+    )
+    command_timeout: float = field(
+        default=float(os.environ.get("DB_COMMAND_TIMEOUT", "60"))
+    )
+    _pool: Optional[asyncpg.Pool] = field(
+        default=None, init=False, repr=False
+    )
+    _pool_lock: asyncio.Lock = field(
+        default_factory=asyncio.Lock, init=False, repr=False
+    )
 
-    def database(self, name: Optional[str]) -> str:
+    def database(self, name: Optional[str] = None) -> str:
         """
         Retrieves a database based on the current connection
 
         Args:
-            name (str): _description_
+            name (str): the name of the database, defaults to the settings.
 
         Returns:
-            AgnosticDatabase: _description_
+            str: the database name
         """
-        if not name:
-            name = 'postgres'
-        return name
+        return name or self.name or 'postgres'
 
     async def connect(self) -> asyncpg.Connection:
         """
-        connect to the database that is defined by the settings.
+        connect to the database that is defined by the settings, outside of
+        the pool.
         """
         connection: asyncpg.Connection = await asyncpg.connect(
-            user=self.user,
-            password=self.password,
-            database=self.database,
-            host=self.host,
-            port=int(self.port),
+            self.database_url(),
+            statement_cache_size=self.statement_cache_size,
+            max_cached_statement_lifetime=(
+                self.max_cached_statement_lifetime
+            ),
+            command_timeout=self.command_timeout,
         )
         return connection
 
     async def pool(self) -> asyncpg.Pool:
         """
-        pool retrieves a connection pool from asyncpg
+        pool retrieves the shared connection pool, creating it on first
+        use. Each pooled connection keeps its own prepared statement cache,
+        so repeated queries are parsed and planned once per connection.
 
         Returns:
-            asyncpg.Pool: a uninstantialized pool
+            asyncpg.Pool: the connection pool
+        """
+        if self._pool is not None:
+            return self._pool
+        async with self._pool_lock:
+            if self._pool is None:
+                self._pool = await asyncpg.create_pool(
+                    self.database_url(),
+                    min_size=self.min_pool_size,
+                    max_size=self.max_pool_size,
+                    statement_cache_size=self.statement_cache_size,
+                    max_cached_statement_lifetime=(
+                        self.max_cached_statement_lifetime
+                    ),
+                    max_inactive_connection_lifetime=(
+                        self.max_inactive_connection_lifetime
+                    ),
+                    command_timeout=self.command_timeout,
+                )
+        return self._pool
+
+    @asynccontextmanager
+    async def acquire(self) -> AsyncIterator[asyncpg.Connection]:
+        """
+        acquire borrows a connection from the shared pool.
+
+        Yields:
+            asyncpg.Connection: a pooled connection, released on exit
+        """
+        pool = await self.pool()
+        async with pool.acquire() as connection:
+            yield connection
+
+    async def close(self) -> None:
+        """
+        Closes the shared pool, to be called on application shutdown.
         """
-        pool: asyncpg.Pool = await asyncpg.create_pool(self.database_url())
-        return pool
+        async with self._pool_lock:
+            if self._pool is not None:
+                await self._pool.close()
+                self._pool = None
 
-    async def database_url(self) -> str:
+    def database_url(self) -> str:
         """
         database_url generates the url for connecting to postgres database
 
@@ -75,6 +146,6 @@ class PostgresSettings(BaseConnection, metaclass=SettingsMeta):
             f":{self.password}"
             f"@{self.host}"
             f":{self.port}"
-            f"/{self.database}"
+            f"/{self.database()}"
         )
         return database_url
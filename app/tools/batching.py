@@ -0,0 +1,132 @@
+"""
+Micro-batching of the calls concurrent requests make to the same backend.
+"""
+from __future__ import annotations
+
+import asyncio
+from dataclasses import dataclass, asdict
+from typing import (
+    Awaitable,
+    Callable,
+    Dict,
+    Generic,
+    Hashable,
+    List,
+    Tuple,
+    TypeVar,
+)
+
+
+K = TypeVar("K", bound=Hashable)
+T = TypeVar("T")
+R = TypeVar("R")
+
+
+@dataclass
+class BatcherStats:
+    items: int = 0
+    batches: int = 0
+    failures: int = 0
+
+    @property
+    def mean_batch(self) -> float:
+        return self.items / self.batches if self.batches else 0.0
+
+    def as_dict(self) -> Dict[str, float]:
+        return {**asdict(self), "mean_batch": self.mean_batch}
+
+
+class MicroBatcher(Generic[K, T, R]):
+    """
+    Collects the items submitted within `window` seconds of the first one,
+    or until `max_batch` items are waiting, and serves them all with one
+    call of `handler`. Items are batched per group, so only calls that can
+    share a backend request, such as searches of the same collection, are
+    merged.
+
+    The handler receives the group and the items, and returns one result
+    per item, in order. If it raises, or returns a different number of
+    results, every caller of the batch gets the error.
+    """
+
+    def __init__(
+        self,
+        handler: Callable[[K, List[T]], Awaitable[List[R]]],
+        window: float = 0.002,
+        max_batch: int = 64,
+    ) -> None:
+        self.handler: Callable[[K, List[T]], Awaitable[List[R]]] = handler
+        self.window: float = window
+        self.max_batch: int = max_batch
+        self.stats: BatcherStats = BatcherStats()
+        self._pending: Dict[K, List[Tuple[T, asyncio.Future]]] = {}
+        self._timers: Dict[K, asyncio.TimerHandle] = {}
+        self._tasks: set = set()
+
+    async def submit(self, group: K, item: T) -> R:
+        """
+        Queues an item for the next batch of its group.
+
+        Args:
+            group (K): The batch the item may be merged into.
+            item (T): The item to process.
+
+        Returns:
+            R: The result of the item.
+        """
+        loop = asyncio.get_running_loop()
+        future: asyncio.Future = loop.create_future()
+        pending = self._pending.setdefault(group, [])
+        pending.append((item, future))
+        if len(pending) >= self.max_batch:
+            self._flush(group)
+        elif group not in self._timers:
+            self._timers[group] = loop.call_later(
+                self.window, self._flush, group
+            )
+        return await future
+
+    def _flush(self, group: K) -> None:
+        timer = self._timers.pop(group, None)
+        if timer is not None:
+            timer.cancel()
+        batch = [
+            (item, future)
+            for item, future in self._pending.pop(group, [])
+            if not future.done()
+        ]
+        if not batch:
+            return
+        task = asyncio.get_running_loop().create_task(
+            self._run(group, batch)
+        )
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(
+        self, group: K, batch: List[Tuple[T, asyncio.Future]]
+    ) -> None:
+        self.stats.items += len(batch)
+        self.stats.batches += 1
+        try:
+            results = await self.handler(
+                group, [item for item, _ in batch]
+            )
+            if len(results) != len(batch):
+                raise ValueError(
+                    f"Batch handler returned {len(results)} results "
+                    f"for {len(batch)} items"
+                )
+        except asyncio.CancelledError:
+            for _, future in batch:
+                future.cancel()
+            raise
+        except Exception as error:  # pylint: disable=broad-except
+            self.stats.failures += 1
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(error)
+            return
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
@@ -0,0 +1,567 @@
+"""
+Caches that sit in front of the expensive model calls.
+"""
+from __future__ import annotations
+
+import os
+import json
+import asyncio
+import time
+import hashlib
+import threading
+import unicodedata
+from collections import OrderedDict
+from dataclasses import dataclass, asdict, field
+from functools import lru_cache
+from typing import (
+    Any,
+    Dict,
+    Generic,
+    Hashable,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+    TypeVar,
+)
+
+import numpy as np
+from numpy import ndarray
+
+from semantic_kernel.connectors.ai import EmbeddingGeneratorBase
+
+from app.tools.batching import MicroBatcher
+from app.tools.embeddings import GPTEmbeddingGenerator
+
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    disk_hits: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.disk_hits + self.misses
+        return (self.hits + self.disk_hits) / lookups if lookups else 0.0
+
+    def as_dict(self) -> Dict[str, float]:
+        return {**asdict(self), "hit_rate": self.hit_rate}
+
+
+class LRUCache(Generic[K, V]):
+    """
+    A size bounded mapping that evicts the least recently used entry.
+    """
+
+    def __init__(
+        self, maxsize: int, stats: Optional[CacheStats] = None
+    ) -> None:
+        self.maxsize: int = maxsize
+        self.stats: CacheStats = stats or CacheStats()
+        self._entries: OrderedDict[K, V] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: K) -> bool:
+        return key in self._entries
+
+    def get(self, key: K) -> Optional[V]:
+        if key not in self._entries:
+            return None
+        self._entries.move_to_end(key)
+        return self._entries[key]
+
+    def put(self, key: K, value: V) -> None:
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+            self.stats.evictions += 1
+
+    def pop(self, key: K) -> Optional[V]:
+        return self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+
+class EmbeddingDiskStore:
+    """
+    Append-only on-disk embedding store.
+
+    Vectors are kept in a memory-mapped float32 file and their content
+    hashes in a sidecar text file, one per row, so the store survives
+    process restarts without loading every vector into memory. A directory
+    must only be written by one process at a time. Writes are serialised
+    by a lock, so they can run off the event loop.
+    """
+
+    def __init__(self, directory: str, initial_rows: int = 4096) -> None:
+        self.directory: str = directory
+        self.initial_rows: int = initial_rows
+        os.makedirs(directory, exist_ok=True)
+        self._vectors_path: str = os.path.join(directory, "embeddings.f32")
+        self._keys_path: str = os.path.join(directory, "keys.txt")
+        self._meta_path: str = os.path.join(directory, "meta.json")
+        self._rows: Dict[str, int] = {}
+        self._matrix: Optional[np.memmap] = None
+        self.dimensions: Optional[int] = None
+        self._lock: threading.Lock = threading.Lock()
+        self._load()
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._rows
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def _load(self) -> None:
+        if not os.path.exists(self._meta_path):
+            return
+        with open(self._meta_path, encoding="utf-8") as meta_file:
+            self.dimensions = json.load(meta_file)["dimensions"]
+        with open(self._keys_path, encoding="utf-8") as keys_file:
+            for row, key in enumerate(keys_file.read().split()):
+                self._rows[key] = row
+        self._open(max(self.initial_rows, len(self._rows)))
+
+    def _open(self, rows: int) -> None:
+        size = rows * self.dimensions * np.dtype(np.float32).itemsize
+        with open(self._vectors_path, "ab") as vectors_file:
+            if vectors_file.tell() < size:
+                vectors_file.truncate(size)
+        self._matrix = np.memmap(
+            self._vectors_path, dtype=np.float32, mode="r+",
+            shape=(rows, self.dimensions),
+        )
+
+    def get(self, key: str) -> Optional[ndarray]:
+        row = self._rows.get(key)
+        if row is None:
+            return None
+        return np.array(self._matrix[row])
+
+    def put(self, key: str, vector: ndarray) -> None:
+        self.put_many([key], [vector])
+
+    def put_many(
+        self, keys: Sequence[str], vectors: Sequence[ndarray]
+    ) -> None:
+        """
+        Appends the vectors of the keys not stored yet, flushing the file
+        and appending their keys once for the whole batch.
+
+        Args:
+            keys (Sequence[str]): The content hashes of the vectors.
+            vectors (Sequence[ndarray]): The vectors, one per key.
+        """
+        with self._lock:
+            new = {
+                key: vector for key, vector in zip(keys, vectors)
+                if key not in self._rows
+            }
+            if not new:
+                return
+            if self.dimensions is None:
+                self.dimensions = len(next(iter(new.values())))
+                with open(
+                    self._meta_path, "w", encoding="utf-8"
+                ) as meta_file:
+                    json.dump({"dimensions": self.dimensions}, meta_file)
+                self._open(self.initial_rows)
+            start = len(self._rows)
+            if start + len(new) > len(self._matrix):
+                self._matrix.flush()
+                rows = len(self._matrix)
+                while start + len(new) > rows:
+                    rows *= 2
+                self._open(rows)
+            self._matrix[start:start + len(new)] = np.stack(
+                list(new.values())
+            )
+            self._matrix.flush()
+            with open(self._keys_path, "a", encoding="utf-8") as keys_file:
+                keys_file.write("".join(f"{key}\n" for key in new))
+            for row, key in enumerate(new, start):
+                self._rows[key] = row
+
+
+class CachedEmbeddingGenerator(EmbeddingGeneratorBase):
+    """
+    Content-addressed cache in front of any embedding generator.
+
+    Entries are keyed by a hash of the model id and the normalised text,
+    kept in a bounded in-memory LRU and, optionally, in an on-disk store.
+    Only the distinct texts missing from both tiers reach the wrapped
+    generator.
+
+    With a `batch_window`, the misses of small concurrent calls, such as
+    the query of every request searching the memory, are merged into one
+    call of the wrapped generator.
+    """
+
+    def __init__(
+        self,
+        generator: EmbeddingGeneratorBase,
+        maxsize: int = 50_000,
+        disk_dir: Optional[str] = None,
+        batch_window: float = 0.0,
+        max_batch: int = 256,
+    ) -> None:
+        self.generator: EmbeddingGeneratorBase = generator
+        self.model_id: str = getattr(
+            generator, "model_id", type(generator).__name__
+        )
+        self.stats: CacheStats = CacheStats()
+        self.memory: LRUCache[str, ndarray] = LRUCache(maxsize, self.stats)
+        self.disk: Optional[EmbeddingDiskStore] = (
+            EmbeddingDiskStore(disk_dir) if disk_dir else None
+        )
+        self.batcher: Optional[MicroBatcher[None, str, ndarray]] = (
+            MicroBatcher(self._generate_batch, batch_window, max_batch)
+            if batch_window > 0 else None
+        )
+
+    @staticmethod
+    def normalize(text: str) -> str:
+        return " ".join(unicodedata.normalize("NFKC", text).split())
+
+    def key(self, text: str) -> str:
+        return hashlib.sha256(
+            f"{self.model_id}\x00{self.normalize(text)}".encode()
+        ).hexdigest()
+
+    def _lookup(self, key: str) -> Optional[ndarray]:
+        vector = self.memory.get(key)
+        if vector is not None:
+            self.stats.hits += 1
+            return vector
+        vector = self.disk.get(key) if self.disk is not None else None
+        if vector is not None:
+            self.stats.disk_hits += 1
+            self.memory.put(key, vector)
+            return vector
+        self.stats.misses += 1
+        return None
+
+    async def _generate_batch(
+        self, _: None, texts: List[str]
+    ) -> List[ndarray]:
+        distinct = list(dict.fromkeys(texts))
+        generated = await self.generator.generate_embeddings(distinct)
+        vectors = dict(zip(distinct, generated))
+        return [vectors[text] for text in texts]
+
+    async def _generate(self, texts: List[str], **kwargs) -> List[ndarray]:
+        if (
+            self.batcher is None
+            or kwargs
+            or len(texts) >= self.batcher.max_batch
+        ):
+            return list(
+                await self.generator.generate_embeddings(texts, **kwargs)
+            )
+        return await asyncio.gather(
+            *(self.batcher.submit(None, text) for text in texts)
+        )
+
+    async def generate_embeddings(
+        self, texts: List[str], **kwargs
+    ) -> ndarray:
+        """
+        Generates an embedding for each of the given texts, serving
+        repeated texts from the cache.
+
+        Args:
+            texts (List[str]): The texts to generate embeddings for.
+
+        Returns:
+            ndarray: A (len(texts), dimensions) float32 matrix of
+                embeddings.
+        """
+        keys = [self.key(text) for text in texts]
+        vectors: List[Optional[ndarray]] = [
+            self._lookup(key) for key in keys
+        ]
+        missing: Dict[str, str] = {
+            key: text
+            for key, text, vector in zip(keys, texts, vectors)
+            if vector is None
+        }
+        if missing:
+            generated = await self._generate(
+                list(missing.values()), **kwargs
+            )
+            fresh: Dict[str, ndarray] = {}
+            for key, vector in zip(missing, generated):
+                fresh[key] = np.asarray(vector, dtype=np.float32)
+                self.memory.put(key, fresh[key])
+            if self.disk is not None:
+                await asyncio.to_thread(
+                    self.disk.put_many, list(fresh), list(fresh.values())
+                )
+            vectors = [
+                vector if vector is not None else fresh[key]
+                for key, vector in zip(keys, vectors)
+            ]
+        if not vectors:
+            return np.empty((0, 0), dtype=np.float32)
+        return np.stack(vectors).astype(np.float32, copy=False)
+
+
+@lru_cache(maxsize=None)
+def embedding_generator() -> CachedEmbeddingGenerator:
+    """
+    Returns the process-wide cached embedding generator used by the agents.
+    Set EMBEDDING_BATCH_WINDOW to 0 to send every call on its own.
+    """
+    return CachedEmbeddingGenerator(
+        GPTEmbeddingGenerator(),
+        maxsize=int(os.environ.get("EMBEDDING_CACHE_SIZE", "50000")),
+        disk_dir=os.environ.get("EMBEDDING_CACHE_DIR") or None,
+        batch_window=float(
+            os.environ.get("EMBEDDING_BATCH_WINDOW", "0.002")
+        ),
+    )
+
+
+Versions = Tuple[Tuple[str, int], ...]
+
+
+@dataclass
+class CompletionEntry:
+    payload: Dict[str, Any]
+    expires: float
+    versions: Versions
+
+
+@dataclass
+class CompletionProbe:
+    """
+    The outcome of a completion cache lookup. On a miss it carries what the
+    cache needs to store the completion once it is generated.
+    """
+    scope: str
+    key: str
+    versions: Versions
+    embedding: Optional[ndarray] = None
+    payload: Optional[Dict[str, Any]] = None
+    tier: Optional[str] = None
+
+
+class _SemanticTier:
+    """
+    The normalised prompt embeddings of every scope in one fixed size ring,
+    so the oldest prompts are overwritten once it is full. Each row records
+    the id of its scope, and a lookup only considers the rows of its own,
+    so the memory used does not grow with the number of scopes.
+    """
+
+    def __init__(self, capacity: int) -> None:
+        self.capacity: int = capacity
+        self.matrix: Optional[ndarray] = None
+        self.scopes: ndarray = np.full(capacity, -1, dtype=np.int64)
+        self.keys: List[Optional[str]] = [None] * capacity
+        self.next: int = 0
+
+    @staticmethod
+    def scope_id(scope: str) -> int:
+        digest = hashlib.blake2b(scope.encode(), digest_size=8).digest()
+        return int.from_bytes(digest, "big") >> 1
+
+    def add(self, scope: str, key: str, embedding: ndarray) -> None:
+        if self.matrix is None:
+            self.matrix = np.zeros(
+                (self.capacity, len(embedding)), dtype=np.float32
+            )
+        self.matrix[self.next] = embedding
+        self.scopes[self.next] = self.scope_id(scope)
+        self.keys[self.next] = key
+        self.next = (self.next + 1) % self.capacity
+
+    def nearest(
+        self, scope: str, embedding: ndarray
+    ) -> Tuple[Optional[str], float]:
+        if self.matrix is None:
+            return None, 0.0
+        rows = np.flatnonzero(self.scopes == self.scope_id(scope))
+        if not len(rows):
+            return None, 0.0
+        scores = self.matrix[rows] @ embedding
+        best = int(np.argmax(scores))
+        return self.keys[rows[best]], float(scores[best])
+
+    def clear(self) -> None:
+        self.scopes.fill(-1)
+        self.keys = [None] * self.capacity
+        self.next = 0
+
+
+@dataclass
+class CompletionCacheStats:
+    exact_hits: int = 0
+    semantic_hits: int = 0
+    misses: int = 0
+    expired: int = 0
+    invalidated: int = 0
+    stats: CacheStats = field(default_factory=CacheStats)
+
+    @property
+    def hit_rate(self) -> float:
+        hits = self.exact_hits + self.semantic_hits
+        lookups = hits + self.misses
+        return hits / lookups if lookups else 0.0
+
+    def as_dict(self) -> Dict[str, float]:
+        return {
+            "exact_hits": self.exact_hits,
+            "semantic_hits": self.semantic_hits,
+            "misses": self.misses,
+            "expired": self.expired,
+            "invalidated": self.invalidated,
+            "evictions": self.stats.evictions,
+            "hit_rate": self.hit_rate,
+        }
+
+
+class CompletionCache:
+    """
+    Two tier cache of agent completions.
+
+    The exact tier is keyed by the scope, which names the agent, template,
+    deployment and request settings, and by the normalised prompt. The
+    semantic tier reuses the answer of a cached prompt of the same scope
+    whose embedding is within `threshold` cosine similarity of the new one.
+    The prompts of every scope share one ring of `maxsize` embeddings.
+    Entries expire after `ttl` seconds, the least recently used are evicted
+    beyond `maxsize`, and an entry is discarded when the versions of the
+    memory collections it was generated from have changed.
+    """
+
+    def __init__(
+        self,
+        maxsize: int = 1_024,
+        ttl: float = 3_600.0,
+        threshold: Optional[float] = 0.95,
+        generator: Optional[EmbeddingGeneratorBase] = None,
+    ) -> None:
+        self.maxsize: int = maxsize
+        self.ttl: float = ttl
+        self.threshold: Optional[float] = threshold
+        self._generator: Optional[EmbeddingGeneratorBase] = generator
+        self.stats: CompletionCacheStats = CompletionCacheStats()
+        self._entries: LRUCache[str, CompletionEntry] = LRUCache(
+            maxsize, self.stats.stats
+        )
+        self._semantic: _SemanticTier = _SemanticTier(maxsize)
+
+    @property
+    def generator(self) -> EmbeddingGeneratorBase:
+        if self._generator is None:
+            self._generator = embedding_generator()
+        return self._generator
+
+    def _key(self, scope: str, prompt: str) -> str:
+        text = CachedEmbeddingGenerator.normalize(prompt).lower()
+        return hashlib.sha256(f"{scope}\x00{text}".encode()).hexdigest()
+
+    def _valid(
+        self, key: str, versions: Versions
+    ) -> Optional[CompletionEntry]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry.expires <= time.monotonic():
+            self.stats.expired += 1
+        elif entry.versions != versions:
+            self.stats.invalidated += 1
+        else:
+            return entry
+        self._entries.pop(key)
+        return None
+
+    async def probe(
+        self, scope: str, prompt: str, versions: Versions = ()
+    ) -> CompletionProbe:
+        """
+        Looks the prompt up in the exact tier, then in the semantic tier.
+
+        Args:
+            scope (str): The agent, template, deployment and settings of
+                the completion.
+            prompt (str): The user prompt.
+            versions (Versions): The current versions of the collections
+                the agent reads.
+
+        Returns:
+            CompletionProbe: The cached payload and the tier that served
+                it, if any.
+        """
+        probe = CompletionProbe(scope, self._key(scope, prompt), versions)
+        entry = self._valid(probe.key, versions)
+        if entry is not None:
+            self.stats.exact_hits += 1
+            probe.payload, probe.tier = entry.payload, "exact"
+            return probe
+        if self.threshold is not None:
+            embedding = await self.generator.generate_embeddings(
+                [CachedEmbeddingGenerator.normalize(prompt)]
+            )
+            vector = np.asarray(embedding[0], dtype=np.float32)
+            norm = float(np.linalg.norm(vector))
+            probe.embedding = vector / norm if norm else vector
+            key, score = self._semantic.nearest(scope, probe.embedding)
+            entry = (
+                self._valid(key, versions)
+                if key and score >= self.threshold else None
+            )
+            if entry is not None:
+                self.stats.semantic_hits += 1
+                probe.payload, probe.tier = entry.payload, "semantic"
+                return probe
+        self.stats.misses += 1
+        return probe
+
+    def put(self, probe: CompletionProbe, payload: Dict[str, Any]) -> None:
+        """
+        Caches the completion of a missed probe.
+
+        Args:
+            probe (CompletionProbe): The probe that missed.
+            payload (Dict[str, Any]): The completion to serve on later
+                hits.
+        """
+        self._entries.put(
+            probe.key,
+            CompletionEntry(
+                dict(payload), time.monotonic() + self.ttl, probe.versions
+            ),
+        )
+        if probe.embedding is not None:
+            self._semantic.add(probe.scope, probe.key, probe.embedding)
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._semantic.clear()
+
+
+@lru_cache(maxsize=None)
+def completion_cache() -> CompletionCache:
+    """
+    Returns the process-wide completion cache. Set
+    COMPLETION_CACHE_THRESHOLD to an empty value to disable the semantic
+    tier.
+    """
+    threshold = os.environ.get("COMPLETION_CACHE_THRESHOLD", "0.95")
+    return CompletionCache(
+        maxsize=int(os.environ.get("COMPLETION_CACHE_SIZE", "1024")),
+        ttl=float(os.environ.get("COMPLETION_CACHE_TTL", "3600")),
+        threshold=float(threshold) if threshold else None,
+    )
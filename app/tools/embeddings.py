@@ -1,29 +1,184 @@
-from typing import List
+from __future__ import annotations
 
+import asyncio
+import hashlib
+import re
+from abc import ABC, abstractmethod
+from typing import List, Optional, Tuple
+
+import numpy as np
 from numpy import ndarray
 
 from semantic_kernel.connectors.ai.embeddings.embedding_generator_base import (
     EmbeddingGeneratorBase,
 )
+from semantic_kernel.connectors.ai.open_ai import AzureTextEmbedding
+
+from app.schemas.agents import EmbeddingSchema
+from app.utils.tokens import PARALLEL_THRESHOLD, count_tokens_batch
+
+
+class EmbeddingBackend(ABC):
+    """
+    A model that turns a batch of texts into dense vectors.
+    """
+
+    model_id: str
+    dimensions: int
+
+    @abstractmethod
+    async def embed(self, texts: List[str]) -> ndarray:
+        """
+        Embeds a single batch of texts.
+
+        Args:
+            texts (List[str]): The texts to embed.
+
+        Returns:
+            ndarray: A (len(texts), dimensions) matrix of embeddings.
+        """
+
+
+class AzureOpenAIEmbeddingBackend(EmbeddingBackend):
+    """
+    Embeddings served by an Azure OpenAI deployment.
+    """
+
+    def __init__(
+        self, schema: EmbeddingSchema = EmbeddingSchema()
+    ) -> None:
+        self.model_id: str = f"azure:{schema.deployment_name}"
+        self.dimensions: int = schema.dimensions
+        self.service = AzureTextEmbedding(
+            deployment_name=schema.deployment_name,
+            endpoint=schema.endpoint,
+            api_key=schema.api_key,
+        )
 
-import tiktoken
+    async def embed(self, texts: List[str]) -> ndarray:
+        return await self.service.generate_embeddings(texts)
+
+
+class HashingEmbeddingBackend(EmbeddingBackend):
+    """
+    Deterministic, offline stand-in for a real embedding model.
+
+    Each word is hashed into a signed bucket of a fixed size vector, so
+    equal texts always map to equal embeddings and texts sharing words are
+    close to each other. It is meant for tests and benchmarks, not for
+    retrieval quality.
+    """
+
+    def __init__(
+        self, dimensions: int = 256, latency: float = 0.0
+    ) -> None:
+        self.model_id: str = f"hashing:{dimensions}"
+        self.dimensions: int = dimensions
+        self.latency: float = latency
+        self.calls: int = 0
+
+    async def embed(self, texts: List[str]) -> ndarray:
+        self.calls += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        embeddings = np.zeros(
+            (len(texts), self.dimensions), dtype=np.float32
+        )
+        for row, text in enumerate(texts):
+            for word in re.findall(r"\w+", text.lower()):
+                digest = hashlib.blake2b(
+                    word.encode(), digest_size=8
+                ).digest()
+                bucket = (
+                    int.from_bytes(digest[:4], "little") % self.dimensions
+                )
+                embeddings[row, bucket] += 1.0 if digest[4] & 1 else -1.0
+        norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+        return embeddings / np.where(norms == 0, 1.0, norms)
 
 
 class GPTEmbeddingGenerator(EmbeddingGeneratorBase):
     """
     Azure Embedding Generator
+
+    Splits the texts into batches bounded by a token and an item budget and
+    embeds the batches concurrently, writing every batch straight into one
+    preallocated float32 matrix.
     """
-    def __init__(self) -> None:
-        self.encoder = tiktoken.get_encoding("cl100k_base")
+    def __init__(
+        self,
+        backend: Optional[EmbeddingBackend] = None,
+        max_batch_tokens: int = 64_000,
+        max_batch_items: int = 16,
+        max_concurrency: int = 4,
+    ) -> None:
+        self.backend: EmbeddingBackend = (
+            backend or AzureOpenAIEmbeddingBackend()
+        )
+        self.max_batch_tokens: int = max_batch_tokens
+        self.max_batch_items: int = max_batch_items
+        self.max_concurrency: int = max_concurrency
+
+    @property
+    def model_id(self) -> str:
+        return self.backend.model_id
 
-    def generate_embeddings(self, texts: List[str]) -> ndarray:
+    def batches(self, texts: List[str]) -> List[Tuple[int, int]]:
         """
-        Generates an embedding for the given text.
+        Groups consecutive texts into batches that respect both budgets. A
+        text larger than the token budget is sent on its own.
 
         Args:
-            text (str): The text to generate an embedding for.
+            texts (List[str]): The texts to group.
 
         Returns:
-            List[float]: The generated embedding.
+            List[Tuple[int, int]]: The (start, stop) slice of each batch.
         """
-        return ndarray([ndarray(self.encoder.encode(text)) for text in texts])
+        token_counts = count_tokens_batch(texts)
+        batches: List[Tuple[int, int]] = []
+        start, tokens = 0, 0
+        for position, count in enumerate(token_counts):
+            items = position - start
+            if items and (
+                items >= self.max_batch_items
+                or tokens + count > self.max_batch_tokens
+            ):
+                batches.append((start, position))
+                start, tokens = position, 0
+            tokens += count
+        if start < len(texts):
+            batches.append((start, len(texts)))
+        return batches
+
+    async def generate_embeddings(
+        self, texts: List[str], **kwargs
+    ) -> ndarray:
+        """
+        Generates an embedding for each of the given texts.
+
+        Args:
+            texts (List[str]): The texts to generate embeddings for.
+
+        Returns:
+            ndarray: A (len(texts), dimensions) float32 matrix of
+                embeddings.
+        """
+        embeddings = np.empty(
+            (len(texts), self.backend.dimensions), dtype=np.float32
+        )
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        async def embed_batch(start: int, stop: int) -> None:
+            async with semaphore:
+                embeddings[start:stop] = await self.backend.embed(
+                    texts[start:stop]
+                )
+
+        if len(texts) < PARALLEL_THRESHOLD:
+            batches = self.batches(texts)
+        else:
+            batches = await asyncio.to_thread(self.batches, texts)
+        await asyncio.gather(
+            *(embed_batch(start, stop) for start, stop in batches)
+        )
+        return embeddings
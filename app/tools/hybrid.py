@@ -0,0 +1,427 @@
+"""
+In-process hybrid retrieval: BM25 over a compact inverted index, fused with
+the vector search of a memory store by reciprocal rank fusion.
+"""
+from __future__ import annotations
+
+import time
+import asyncio
+import threading
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+from nltk.stem import PorterStemmer
+from nltk.tokenize import wordpunct_tokenize
+
+from semantic_kernel.connectors.ai import EmbeddingGeneratorBase
+from semantic_kernel.memory.memory_store_base import MemoryStoreBase
+
+from semantic_kernel.memory.memory_record import MemoryRecord
+
+from app.tools.caches import embedding_generator
+from app.tools.retrievers import Retriever
+
+
+_STEMMER = PorterStemmer()
+
+
+@lru_cache(maxsize=65_536)
+def _stem(word: str) -> str:
+    return _STEMMER.stem(word)
+
+
+def analyze(text: str, stem: bool = True) -> List[str]:
+    """
+    Splits a text into lowercase, optionally stemmed, terms. Punctuation is
+    dropped.
+
+    Args:
+        text (str): The text to analyze.
+        stem (bool): Whether to reduce the terms to their Porter stem.
+
+    Returns:
+        List[str]: The terms of the text, in order.
+    """
+    words = [
+        word for word in wordpunct_tokenize(text.lower()) if word.isalnum()
+    ]
+    return [_stem(word) for word in words] if stem else words
+
+
+@dataclass
+class _Postings:
+    keys: List[str]
+    offsets: np.ndarray
+    documents: np.ndarray
+    weights: np.ndarray
+
+
+class BM25Index:
+    """
+    Inverted index scored with Okapi BM25.
+
+    Documents are kept as arrays of term ids and counts. On the first
+    search after a change the postings are compiled into three flat arrays,
+    in CSR layout: the offsets of each term, the documents of each posting
+    and the BM25 weight of each posting, precomputed so a query only adds
+    up the weights of its terms.
+    """
+
+    def __init__(
+        self,
+        k1: float = 1.2,
+        b: float = 0.75,
+        stem: bool = True,
+        stopwords: Optional[Iterable[str]] = None,
+    ) -> None:
+        self.k1: float = k1
+        self.b: float = b
+        self.stem: bool = stem
+        self.stopwords: frozenset = frozenset(stopwords or ())
+        self._vocabulary: Dict[str, int] = {}
+        self._documents: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+        self._texts: Dict[str, str] = {}
+        self._postings: Optional[_Postings] = None
+        self._lock: threading.Lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._documents)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._documents
+
+    def _terms(self, text: str) -> List[str]:
+        return [
+            term
+            for term in analyze(text, self.stem)
+            if term not in self.stopwords
+        ]
+
+    def add(self, keys: Sequence[str], texts: Sequence[str]) -> None:
+        """
+        Adds documents to the index, replacing those with the same keys.
+
+        Args:
+            keys (Sequence[str]): The keys of the documents.
+            texts (Sequence[str]): The texts of the documents.
+        """
+        with self._lock:
+            for key, text in zip(keys, texts):
+                ids = [
+                    self._vocabulary.setdefault(
+                        term, len(self._vocabulary)
+                    )
+                    for term in self._terms(text)
+                ]
+                terms, counts = np.unique(
+                    np.asarray(ids, dtype=np.int32), return_counts=True
+                )
+                self._documents[key] = (terms, counts.astype(np.float32))
+                self._texts[key] = text
+            self._postings = None
+
+    def remove(self, keys: Iterable[str]) -> None:
+        with self._lock:
+            for key in keys:
+                self._documents.pop(key, None)
+                self._texts.pop(key, None)
+            self._postings = None
+
+    def text(self, key: str) -> Optional[str]:
+        return self._texts.get(key)
+
+    def _compile(self) -> _Postings:
+        with self._lock:
+            if self._postings is not None:
+                return self._postings
+            keys = list(self._documents)
+            vocabulary = len(self._vocabulary)
+            if not keys:
+                self._postings = _Postings(
+                    [],
+                    np.zeros(vocabulary + 1, dtype=np.int64),
+                    np.empty(0, dtype=np.int32),
+                    np.empty(0, dtype=np.float32),
+                )
+                return self._postings
+            terms = [self._documents[key][0] for key in keys]
+            counts = [self._documents[key][1] for key in keys]
+            lengths = np.asarray(
+                [count.sum() for count in counts], dtype=np.float32
+            )
+            documents = np.repeat(
+                np.arange(len(keys), dtype=np.int32),
+                [len(term) for term in terms],
+            )
+            terms_flat = np.concatenate(terms)
+            counts_flat = np.concatenate(counts)
+            order = np.argsort(terms_flat, kind="stable")
+            terms_flat, documents, counts_flat = (
+                terms_flat[order], documents[order], counts_flat[order]
+            )
+            frequencies = np.bincount(terms_flat, minlength=vocabulary)
+            offsets = np.zeros(vocabulary + 1, dtype=np.int64)
+            np.cumsum(frequencies, out=offsets[1:])
+            idf = np.log1p(
+                (len(keys) - frequencies + 0.5) / (frequencies + 0.5)
+            ).astype(np.float32)
+            norms = self.k1 * (
+                1 - self.b + self.b * lengths / max(lengths.mean(), 1.0)
+            )
+            weights = (
+                idf[terms_flat] * counts_flat * (self.k1 + 1)
+                / (counts_flat + norms[documents])
+            ).astype(np.float32)
+            self._postings = _Postings(keys, offsets, documents, weights)
+            return self._postings
+
+    def search(self, query: str, limit: int) -> List[Tuple[str, float]]:
+        """
+        Ranks the documents by their BM25 score for the query.
+
+        Args:
+            query (str): The query text.
+            limit (int): The maximum number of documents to return.
+
+        Returns:
+            List[Tuple[str, float]]: The keys and scores of the best
+                documents, best first.
+        """
+        postings = self._compile()
+        terms = {
+            self._vocabulary[term]
+            for term in self._terms(query)
+            if term in self._vocabulary
+        }
+        terms = [
+            term for term in terms if term + 1 < len(postings.offsets)
+        ]
+        if not terms or limit <= 0:
+            return []
+        scores = np.zeros(len(postings.keys), dtype=np.float32)
+        for term in terms:
+            start, stop = postings.offsets[term:term + 2]
+            documents = postings.documents[start:stop]
+            scores[documents] += postings.weights[start:stop]
+        matched = np.flatnonzero(scores)
+        if len(matched) > limit:
+            matched = matched[
+                np.argpartition(-scores[matched], limit - 1)[:limit]
+            ]
+        matched = matched[np.argsort(-scores[matched], kind="stable")]
+        return [
+            (postings.keys[position], float(scores[position]))
+            for position in matched
+        ]
+
+
+def reciprocal_rank_fusion(
+    rankings: Dict[str, List[str]],
+    k: int = 60,
+    weights: Optional[Dict[str, float]] = None,
+) -> List[Tuple[str, float]]:
+    """
+    Merges several rankings of the same documents. Each document scores
+    `weight / (k + rank)` in every ranking it appears in, ranks starting
+    at 1.
+
+    Args:
+        rankings (Dict[str, List[str]]): The keys ranked by each source,
+            best first.
+        k (int): Damps the advantage of the first ranks.
+        weights (Optional[Dict[str, float]]): The weight of each source,
+            1.0 by default.
+
+    Returns:
+        List[Tuple[str, float]]: The keys and fused scores, best first.
+    """
+    weights = weights or {}
+    scores: Dict[str, float] = {}
+    for source, keys in rankings.items():
+        weight = weights.get(source, 1.0)
+        for rank, key in enumerate(keys, start=1):
+            scores[key] = scores.get(key, 0.0) + weight / (k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+
+class HybridRetriever(Retriever):
+    """
+    Retrieves passages from a memory collection by fusing a local BM25
+    ranking with the store's vector ranking, with no remote search service
+    involved.
+
+    The BM25 index is built from the collection on first use, for stores
+    that can list their records. Stores that report their writes, through
+    `watch`, then keep it up to date incrementally. Writes made by other
+    processes are not reported, so with several writers set `refresh` to
+    the seconds after which the index is rebuilt from the collection. The
+    index is also rebuilt when a write was missed, such as when the
+    collection was dropped. An index can also be given ready built.
+    """
+
+    def __init__(
+        self,
+        store: Optional[MemoryStoreBase] = None,
+        collection: str = 'ragMemory',
+        index: Optional[BM25Index] = None,
+        generator: Optional[EmbeddingGeneratorBase] = None,
+        limit: int = 10,
+        candidates: int = 50,
+        k: int = 60,
+        weights: Optional[Dict[str, float]] = None,
+        timeout: Optional[float] = None,
+        refresh: Optional[float] = None,
+    ) -> None:
+        super().__init__(timeout)
+        self.store: Optional[MemoryStoreBase] = store
+        self.collection: str = collection
+        self.index: Optional[BM25Index] = index
+        self._generator: Optional[EmbeddingGeneratorBase] = generator
+        self.limit: int = limit
+        self.candidates: int = candidates
+        self.k: int = k
+        self.weights: Optional[Dict[str, float]] = weights
+        self.refresh: Optional[float] = refresh
+        self._built: Optional[int] = (
+            self._version() if index is not None else None
+        )
+        self._built_at: float = time.monotonic()
+        self._lock: asyncio.Lock = asyncio.Lock()
+        watch = getattr(store, 'watch', None)
+        if watch:
+            watch(self)
+
+    @property
+    def generator(self) -> EmbeddingGeneratorBase:
+        if self._generator is None:
+            self._generator = embedding_generator()
+        return self._generator
+
+    def _version(self) -> int:
+        version = getattr(self.store, 'collection_version', None)
+        return version(self.collection) if version else 0
+
+    def _stale(self) -> bool:
+        return (
+            self.index is None
+            or self._built != self._version()
+            or (
+                self.refresh is not None
+                and time.monotonic() - self._built_at >= self.refresh
+            )
+        )
+
+    async def lexical_index(self) -> Optional[BM25Index]:
+        """
+        Returns the BM25 index of the collection, building it when there is
+        none yet, when it missed a write or when it is due for a refresh.
+        """
+        records = getattr(self.store, 'records', None)
+        if records is None or not self._stale():
+            return self.index
+        async with self._lock:
+            if self._stale():
+                version = self._version()
+                keys, texts = [], []
+                async for record in records(self.collection):
+                    if record._text:
+                        keys.append(record._key or record._id)
+                        texts.append(record._text)
+                index = BM25Index()
+                await asyncio.to_thread(index.add, keys, texts)
+                self.index, self._built = index, version
+                self._built_at = time.monotonic()
+        return self.index
+
+    async def collection_written(
+        self,
+        collection_name: str,
+        version: int,
+        upserted: Sequence[MemoryRecord],
+        removed: Sequence[str],
+    ) -> None:
+        """
+        Applies a write reported by the store to the BM25 index. A write
+        that does not follow the last one applied is left for a rebuild.
+        """
+        if collection_name != self.collection or self.index is None:
+            return
+        async with self._lock:
+            index = self.index
+            if index is None or self._built != version - 1:
+                return
+            texts = {
+                record._key or record._id: record._text
+                for record in upserted
+            }
+            stale = list(removed) + [
+                key for key, text in texts.items() if not text
+            ]
+            fresh = {key: text for key, text in texts.items() if text}
+            if stale:
+                await asyncio.to_thread(index.remove, stale)
+            if fresh:
+                await asyncio.to_thread(
+                    index.add, list(fresh), list(fresh.values())
+                )
+            self._built = version
+
+    async def _lexical(self, prompt: str) -> List[Tuple[str, float]]:
+        index = await self.lexical_index()
+        if index is None:
+            return []
+        return await asyncio.to_thread(
+            index.search, prompt, self.candidates
+        )
+
+    async def _vector(self, prompt: str) -> Dict[str, str]:
+        if self.store is None:
+            return {}
+        embedding = (await self.generator.generate_embeddings([prompt]))[0]
+        matches = await self.store.get_nearest_matches(
+            collection_name=self.collection,
+            embedding=embedding,
+            limit=self.candidates,
+            min_relevance_score=0.0,
+            with_embeddings=False,
+        )
+        return {
+            record._key or record._id: record._text or ''
+            for record, _ in matches
+        }
+
+    async def ranked(self, prompt: str) -> List[Tuple[str, float, str]]:
+        """
+        Ranks the collection's records for the prompt.
+
+        Args:
+            prompt (str): The user prompt.
+
+        Returns:
+            List[Tuple[str, float, str]]: The key, fused score and text of
+                the best records.
+        """
+        lexical, vector = await asyncio.gather(
+            self._lexical(prompt), self._vector(prompt)
+        )
+        fused = reciprocal_rank_fusion(
+            {
+                'lexical': [key for key, _ in lexical],
+                'vector': list(vector),
+            },
+            self.k,
+            self.weights,
+        )
+        results = []
+        for key, score in fused[:self.limit]:
+            text = vector.get(key) or (
+                self.index.text(key) if self.index else None
+            )
+            if text:
+                results.append((key, score, text))
+        return results
+
+    async def passages(self, prompt: str) -> List[str]:
+        return [text for _, _, text in await self.ranked(prompt)]
@@ -0,0 +1,481 @@
+"""
+In-process vector indexes used by the memory stores to answer similarity
+queries without scanning the whole collection on every request.
+"""
+from __future__ import annotations
+
+import os
+import logging
+import threading
+from abc import ABC, abstractmethod
+from typing import Dict, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+import faiss
+
+
+logger: logging.Logger = logging.getLogger(__name__)
+
+
+def normalize(embeddings: np.ndarray) -> np.ndarray:
+    """
+    Casts the embeddings to a contiguous float32 matrix with unit-norm
+    rows, so inner products become cosine similarities.
+
+    Args:
+        embeddings (np.ndarray): A vector or a matrix of vectors.
+
+    Returns:
+        np.ndarray: A (n, dim) float32 matrix with L2-normalised rows.
+    """
+    matrix = np.ascontiguousarray(
+        np.atleast_2d(np.asarray(embeddings, dtype=np.float32))
+    ).copy()
+    faiss.normalize_L2(matrix)
+    return matrix
+
+
+def _latest(
+    keys: Sequence[str], matrix: np.ndarray
+) -> Tuple[List[str], np.ndarray]:
+    """
+    Keeps the last row of every key repeated within a batch.
+    """
+    rows = {key: row for row, key in enumerate(keys)}
+    if len(rows) == len(keys):
+        return list(keys), matrix
+    return list(rows), matrix[list(rows.values())]
+
+
+class VectorIndex(ABC):
+    """
+    A per-collection index that maps memory record keys to their embeddings
+    and answers top-k cosine similarity queries.
+
+    Indexes are safe to share between threads: writes and searches of one
+    index are serialised by its lock.
+    """
+
+    @abstractmethod
+    def add(self, keys: Sequence[str], embeddings: np.ndarray) -> None:
+        """
+        Adds vectors to the index, replacing those of keys already in it.
+
+        Args:
+            keys (Sequence[str]): The memory record keys, one per row.
+            embeddings (np.ndarray): A (n, dim) matrix of embeddings.
+        """
+
+    @abstractmethod
+    def remove(self, keys: Sequence[str]) -> None:
+        """
+        Removes the vectors of the keys, ignoring those not in the index.
+
+        Args:
+            keys (Sequence[str]): The memory record keys.
+        """
+
+    @abstractmethod
+    def search(
+        self,
+        queries: np.ndarray,
+        limit: int
+    ) -> List[List[Tuple[str, float]]]:
+        """
+        Finds the nearest neighbours of each query vector.
+
+        Args:
+            queries (np.ndarray): A (q, dim) matrix of query embeddings.
+            limit (int): The maximum number of neighbours per query.
+
+        Returns:
+            List[List[Tuple[str, float]]]: For each query, a list of
+                (key, cosine similarity) pairs ranked by similarity.
+        """
+
+    @abstractmethod
+    def __contains__(self, key: str) -> bool:
+        ...
+
+    @abstractmethod
+    def __len__(self) -> int:
+        ...
+
+
+class ExactVectorIndex(VectorIndex):
+    """
+    Brute force cosine similarity index for collections too small to
+    benefit from an approximate index.
+
+    Embeddings live in one contiguous, L2-normalised float32 matrix that
+    grows geometrically, so a batch of queries is answered with a single
+    matrix multiply and the top-k is selected with `argpartition`.
+    Overwritten keys are updated in place, and a removed row is filled with
+    the last.
+    """
+
+    def __init__(self, dimensions: int, capacity: int = 1024) -> None:
+        self.dimensions: int = dimensions
+        self._matrix: np.ndarray = np.empty(
+            (capacity, dimensions), dtype=np.float32
+        )
+        self._keys: List[str] = []
+        self._positions: Dict[str, int] = {}
+        self._lock: threading.Lock = threading.Lock()
+
+    @property
+    def keys(self) -> List[str]:
+        return self._keys
+
+    @property
+    def matrix(self) -> np.ndarray:
+        return self._matrix[:len(self._keys)]
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._positions
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def add(self, keys: Sequence[str], embeddings: np.ndarray) -> None:
+        matrix = normalize(embeddings)
+        if matrix.shape != (len(keys), self.dimensions):
+            raise ValueError(
+                f"Expected {len(keys)} embeddings of dimension "
+                f"{self.dimensions}, got shape {matrix.shape}"
+            )
+        keys, matrix = _latest(keys, matrix)
+        with self._lock:
+            new = [
+                row for row, key in enumerate(keys)
+                if key not in self._positions
+            ]
+            for row, key in enumerate(keys):
+                if key in self._positions:
+                    self._matrix[self._positions[key]] = matrix[row]
+            size = len(self._keys)
+            if size + len(new) > len(self._matrix):
+                grown = np.empty(
+                    (
+                        max(2 * len(self._matrix), size + len(new)),
+                        self.dimensions,
+                    ),
+                    dtype=np.float32,
+                )
+                grown[:size] = self._matrix[:size]
+                self._matrix = grown
+            self._matrix[size:size + len(new)] = matrix[new]
+            for offset, row in enumerate(new):
+                self._positions[keys[row]] = size + offset
+                self._keys.append(keys[row])
+
+    def remove(self, keys: Sequence[str]) -> None:
+        with self._lock:
+            for key in keys:
+                position = self._positions.pop(key, None)
+                if position is None:
+                    continue
+                last = len(self._keys) - 1
+                if position != last:
+                    moved = self._keys[last]
+                    self._matrix[position] = self._matrix[last]
+                    self._keys[position] = moved
+                    self._positions[moved] = position
+                self._keys.pop()
+
+    def search(
+        self,
+        queries: np.ndarray,
+        limit: int
+    ) -> List[List[Tuple[str, float]]]:
+        queries = normalize(queries)
+        with self._lock:
+            return self._search(queries, limit)
+
+    def _search(
+        self,
+        queries: np.ndarray,
+        limit: int
+    ) -> List[List[Tuple[str, float]]]:
+        limit = min(limit, len(self))
+        if limit <= 0:
+            return [[] for _ in range(len(queries))]
+        scores = queries @ self.matrix.T
+        if limit < len(self):
+            top = np.argpartition(-scores, limit - 1, axis=1)[:, :limit]
+        else:
+            top = np.broadcast_to(
+                np.arange(len(self)), (len(queries), limit)
+            )
+        top_scores = np.take_along_axis(scores, top, axis=1)
+        order = np.argsort(-top_scores, axis=1)
+        top = np.take_along_axis(top, order, axis=1)
+        top_scores = np.take_along_axis(top_scores, order, axis=1)
+        return [
+            [
+                (self._keys[position], float(score))
+                for position, score in zip(row_positions, row_scores)
+            ]
+            for row_positions, row_scores in zip(top, top_scores)
+        ]
+
+
+class FaissVectorIndex(VectorIndex):
+    """
+    Cosine similarity index on top of faiss.
+
+    Small collections are kept in an exact flat index. Once the collection
+    grows past `ann_threshold` vectors the index is rebuilt as an HNSW
+    graph, which keeps query cost sub-linear in the size of the collection.
+
+    HNSW graphs cannot delete vectors, so overwritten and removed keys
+    leave a tombstone: the row stays in the graph and searches skip it
+    through an ID selector. Once tombstones exceed `max_tombstones` of the
+    rows, the index is rebuilt from the live rows.
+    """
+
+    def __init__(
+        self,
+        dimensions: int,
+        ann_threshold: int = 10_000,
+        hnsw_neighbors: int = 32,
+        ef_construction: int = 80,
+        ef_search: int = 64,
+        max_tombstones: float = 0.2,
+    ) -> None:
+        self.dimensions: int = dimensions
+        self.ann_threshold: int = ann_threshold
+        self.hnsw_neighbors: int = hnsw_neighbors
+        self.ef_construction: int = ef_construction
+        self.ef_search: int = ef_search
+        self.max_tombstones: float = max_tombstones
+        self._keys: List[Optional[str]] = []
+        self._positions: Dict[str, int] = {}
+        self._tombstones: Set[int] = set()
+        self._params: Optional[faiss.SearchParameters] = None
+        self._selectors: Tuple = ()
+        self._index: faiss.Index = faiss.IndexFlatIP(dimensions)
+        self._lock: threading.Lock = threading.Lock()
+
+    @property
+    def is_approximate(self) -> bool:
+        return isinstance(self._index, faiss.IndexHNSWFlat)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._positions
+
+    def __len__(self) -> int:
+        return len(self._positions)
+
+    def add(self, keys: Sequence[str], embeddings: np.ndarray) -> None:
+        matrix = normalize(embeddings)
+        if matrix.shape != (len(keys), self.dimensions):
+            raise ValueError(
+                f"Expected {len(keys)} embeddings of dimension "
+                f"{self.dimensions}, got shape {matrix.shape}"
+            )
+        keys, matrix = _latest(keys, matrix)
+        with self._lock:
+            self._bury(keys)
+            for key in keys:
+                self._positions[key] = len(self._keys)
+                self._keys.append(key)
+            self._index.add(matrix)
+            if not self.is_approximate and len(self) >= self.ann_threshold:
+                self._rebuild()
+            else:
+                self._compact()
+
+    def remove(self, keys: Sequence[str]) -> None:
+        with self._lock:
+            self._bury(keys)
+            self._compact()
+
+    def _bury(self, keys: Sequence[str]) -> None:
+        for key in keys:
+            position = self._positions.pop(key, None)
+            if position is not None:
+                self._keys[position] = None
+                self._tombstones.add(position)
+                self._params = None
+
+    def _compact(self) -> None:
+        if len(self._tombstones) > self.max_tombstones * len(self._keys):
+            self._rebuild()
+
+    def _search_params(self) -> Optional[faiss.SearchParameters]:
+        if not self._tombstones:
+            return None
+        if self._params is None:
+            buried = faiss.IDSelectorBatch(
+                np.fromiter(self._tombstones, dtype=np.int64)
+            )
+            params = (
+                faiss.SearchParametersHNSW()
+                if self.is_approximate else faiss.SearchParameters()
+            )
+            if self.is_approximate:
+                params.efSearch = self.ef_search
+            params.sel = faiss.IDSelectorNot(buried)
+            self._params = params
+            self._selectors = (buried, params.sel)
+        return self._params
+
+    def search(
+        self,
+        queries: np.ndarray,
+        limit: int
+    ) -> List[List[Tuple[str, float]]]:
+        queries = normalize(queries)
+        with self._lock:
+            if not self._positions or limit <= 0:
+                return [[] for _ in range(len(queries))]
+            scores, positions = self._index.search(
+                queries,
+                min(limit, len(self)),
+                params=self._search_params(),
+            )
+            return [
+                [
+                    (self._keys[position], float(score))
+                    for score, position in zip(row_scores, row_positions)
+                    if position >= 0 and self._keys[position] is not None
+                ]
+                for row_scores, row_positions in zip(scores, positions)
+            ]
+
+    @classmethod
+    def from_exact(
+        cls, exact: ExactVectorIndex, **kwargs
+    ) -> FaissVectorIndex:
+        """
+        Builds an index holding the same vectors as an exact index.
+
+        Args:
+            exact (ExactVectorIndex): The index to copy.
+            **kwargs: Arguments forwarded to the constructor.
+
+        Returns:
+            FaissVectorIndex: The new index.
+        """
+        index = cls(exact.dimensions, **kwargs)
+        with exact._lock:
+            keys, matrix = list(exact.keys), exact.matrix.copy()
+        if keys:
+            index.add(keys, matrix)
+        return index
+
+    def save(self, path: str) -> None:
+        """
+        Persists the index and its key mapping next to each other. The rows
+        of tombstones are saved with an empty key. Both files are written
+        to temporary paths first and then renamed over the saved ones, so
+        a reader never sees a half written file.
+
+        Args:
+            path (str): The file path of the faiss index.
+        """
+        keys_path = f"{path}.keys"
+        suffix = f".{os.getpid()}.{threading.get_ident()}.tmp"
+        paths = {path: path + suffix, keys_path: keys_path + suffix}
+        with self._lock:
+            try:
+                faiss.write_index(self._index, paths[path])
+                with open(
+                    paths[keys_path], "w", encoding="utf-8"
+                ) as keys_file:
+                    keys_file.write(
+                        "\n".join(key or "" for key in self._keys)
+                    )
+                for saved, temporary in paths.items():
+                    os.replace(temporary, saved)
+            finally:
+                for temporary in paths.values():
+                    if os.path.exists(temporary):
+                        os.remove(temporary)
+
+    @classmethod
+    def load(cls, path: str, **kwargs) -> Optional[FaissVectorIndex]:
+        """
+        Loads an index persisted with `save`.
+
+        Args:
+            path (str): The file path of the faiss index.
+            **kwargs: Arguments forwarded to the constructor.
+
+        Returns:
+            Optional[FaissVectorIndex]: The index, or None if nothing was
+                saved.
+        """
+        if not (os.path.exists(path) and os.path.exists(f"{path}.keys")):
+            return None
+        stored: faiss.Index = faiss.read_index(path)
+        with open(f"{path}.keys", encoding="utf-8") as keys_file:
+            keys = keys_file.read().split("\n") if stored.ntotal else []
+        if len(keys) != stored.ntotal:
+            logger.warning(
+                "Discarding inconsistent vector index at %s", path
+            )
+            return None
+        index = cls(stored.d, **kwargs)
+        index._index = stored
+        index._keys = [key or None for key in keys]
+        index._positions = {key: i for i, key in enumerate(keys) if key}
+        index._tombstones = {i for i, key in enumerate(keys) if not key}
+        if index.is_approximate:
+            stored.hnsw.efSearch = index.ef_search
+        return index
+
+    def _rebuild(self) -> None:
+        """
+        Rebuilds the index from its live rows, as an HNSW graph once it
+        holds `ann_threshold` vectors or more.
+        """
+        live = sorted(self._positions.items(), key=lambda item: item[1])
+        vectors = self._index.reconstruct_n(0, self._index.ntotal)[
+            [position for _, position in live]
+        ]
+        if len(live) >= self.ann_threshold:
+            index = faiss.IndexHNSWFlat(
+                self.dimensions,
+                self.hnsw_neighbors,
+                faiss.METRIC_INNER_PRODUCT
+            )
+            index.hnsw.efConstruction = self.ef_construction
+            index.hnsw.efSearch = self.ef_search
+        else:
+            index = faiss.IndexFlatIP(self.dimensions)
+        index.add(np.ascontiguousarray(vectors))
+        self._index = index
+        self._keys = [key for key, _ in live]
+        self._positions = {key: i for i, key in enumerate(self._keys)}
+        self._tombstones = set()
+        self._params = None
+        logger.info(
+            "Rebuilt vector index with %s vectors, approximate: %s",
+            len(self), self.is_approximate,
+        )
+
+
+def recall_at_k(
+    approximate: List[List[Tuple[str, float]]],
+    exact: List[List[Tuple[str, float]]],
+) -> float:
+    """
+    Measures which fraction of the exact top-k neighbours the approximate
+    search returned.
+
+    Args:
+        approximate (List[List[Tuple[str, float]]]): Results under test.
+        exact (List[List[Tuple[str, float]]]): Brute force results.
+
+    Returns:
+        float: The mean recall across queries.
+    """
+    recalls = [
+        len({key for key, _ in found} & {key for key, _ in truth})
+        / len(truth)
+        for found, truth in zip(approximate, exact)
+        if truth
+    ]
+    return float(np.mean(recalls)) if recalls else 1.0
@@ -0,0 +1,464 @@
+"""
+Client side rate limiting of the Azure OpenAI deployments.
+
+Azure OpenAI admits a request against the deployment's requests per minute
+and tokens per minute quotas, estimating its tokens as the prompt tokens
+plus `max_tokens`. Every caller of a deployment shares one limiter that
+does the same accounting before the request leaves the process, so requests
+queue here instead of being rejected with a 429 and retried into a storm.
+"""
+from __future__ import annotations
+
+import os
+import re
+import time
+import heapq
+import random
+import asyncio
+import itertools
+from dataclasses import dataclass, asdict, field
+from typing import (
+    Any,
+    Awaitable,
+    Callable,
+    Dict,
+    List,
+    Optional,
+    Tuple,
+    TypeVar,
+    Union,
+)
+
+from app.monitoring import registry
+from app.schemas.agents import ChatSchema, TextSchema
+
+
+T = TypeVar("T")
+
+
+class RateLimitError(RuntimeError):
+    """
+    Raised when a deployment rejects a request for exceeding its quota.
+    """
+
+    def __init__(
+        self, message: str, retry_after: Optional[float] = None
+    ) -> None:
+        super().__init__(message)
+        self.retry_after: Optional[float] = retry_after
+
+
+def _header_seconds(headers: Any) -> Optional[float]:
+    if not headers:
+        return None
+    for name, scale in (("retry-after-ms", 1e-3), ("retry-after", 1.0)):
+        value = headers.get(name)
+        if value is not None:
+            try:
+                return float(value) * scale
+            except ValueError:
+                continue
+    return None
+
+
+def throttled(error: Optional[BaseException]) -> Optional[float]:
+    """
+    Tells whether an error, or any error it was raised from, is a 429.
+
+    Args:
+        error (Optional[BaseException]): The error raised by the connector.
+
+    Returns:
+        Optional[float]: The seconds the deployment asked to wait, 0.0 when
+            it did not say, or None when the error is not a 429.
+    """
+    seen = set()
+    while error is not None and id(error) not in seen:
+        seen.add(id(error))
+        if isinstance(error, RateLimitError):
+            return error.retry_after or 0.0
+        response = getattr(error, "response", None)
+        status = getattr(error, "status_code", None)
+        status = status or getattr(response, "status_code", None)
+        if status == 429:
+            return (
+                _header_seconds(getattr(response, "headers", None)) or 0.0
+            )
+        error = error.__cause__ or error.__context__
+    return None
+
+
+@dataclass(order=True)
+class _Waiter:
+    priority: int
+    sequence: int
+    tokens: float = field(compare=False)
+    future: asyncio.Future = field(compare=False)
+
+
+@dataclass
+class LimiterStats:
+    admitted: int = 0
+    throttled: int = 0
+    retried: int = 0
+    expired: int = 0
+    tokens: int = 0
+
+    def as_dict(self) -> Dict[str, int]:
+        return asdict(self)
+
+
+class DeploymentLimiter:
+    """
+    Two token buckets, of requests and of tokens, refilled at the quotas of
+    a deployment, with a queue of the callers waiting for them.
+
+    Callers are admitted strictly by priority, lower values first, and in
+    arrival order within a priority, so a large request is never starved by
+    smaller ones behind it. A caller gives up once its deadline passes.
+
+    A 429 halves the admitted rate and pauses admissions for the
+    Retry-After the deployment sent; every admitted request that succeeds
+    wins back a small share of the quota, up to the configured one.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        rpm: int,
+        tpm: int,
+        burst: float = 10.0,
+        period: float = 60.0,
+        decrease: float = 0.5,
+        increase: float = 0.02,
+        floor: float = 0.1,
+        pause: float = 1.0,
+    ) -> None:
+        """
+        Args:
+            name (str): The deployment the limits apply to.
+            rpm (int): Requests admitted per period.
+            tpm (int): Tokens admitted per period.
+            burst (float): Seconds of quota that may be spent at once.
+            period (float): The seconds the quotas are expressed over.
+            decrease (float): Factor applied to the rate on a 429.
+            increase (float): Share of the quota won back per success.
+            floor (float): The lowest share of the quota ever admitted.
+            pause (float): Seconds to pause on a 429 without Retry-After.
+        """
+        self.name: str = name
+        self.rpm: int = rpm
+        self.tpm: int = tpm
+        self.period: float = period
+        self.decrease: float = decrease
+        self.increase: float = increase
+        self.floor: float = floor
+        self.pause: float = pause
+        self.scale: float = 1.0
+        self.stats: LimiterStats = LimiterStats()
+        self.request_capacity: float = max(1.0, rpm * burst / period)
+        self.token_capacity: float = max(1.0, tpm * burst / period)
+        self._requests: float = self.request_capacity
+        self._tokens: float = self.token_capacity
+        self._refilled: float = time.monotonic()
+        self._paused_until: float = 0.0
+        self._waiters: List[_Waiter] = []
+        self._sequence = itertools.count()
+        self._timer: Optional[asyncio.TimerHandle] = None
+
+    @property
+    def queued(self) -> int:
+        return sum(not waiter.future.done() for waiter in self._waiters)
+
+    def _refill(self, now: float) -> None:
+        elapsed = max(0.0, now - max(self._refilled, self._paused_until))
+        self._refilled = now
+        rate = self.scale / self.period
+        self._requests = min(
+            self.request_capacity,
+            self._requests + elapsed * self.rpm * rate,
+        )
+        self._tokens = min(
+            self.token_capacity, self._tokens + elapsed * self.tpm * rate
+        )
+
+    def _dispatch(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        now = time.monotonic()
+        self._refill(now)
+        while self._waiters:
+            waiter = self._waiters[0]
+            if waiter.future.done():
+                heapq.heappop(self._waiters)
+                continue
+            if now < self._paused_until:
+                delay = self._paused_until - now
+                break
+            missing_requests = 1.0 - self._requests
+            missing_tokens = waiter.tokens - self._tokens
+            if missing_requests <= 0 and missing_tokens <= 0:
+                heapq.heappop(self._waiters)
+                self._requests -= 1.0
+                self._tokens -= waiter.tokens
+                waiter.future.set_result(None)
+                continue
+            rate = self.scale / self.period
+            delay = max(
+                missing_requests / (self.rpm * rate),
+                missing_tokens / (self.tpm * rate),
+            )
+            break
+        else:
+            return
+        self._timer = asyncio.get_running_loop().call_later(
+            delay, self._dispatch
+        )
+
+    async def acquire(
+        self,
+        tokens: int,
+        priority: int = 0,
+        timeout: Optional[float] = None,
+        sequence: Optional[int] = None,
+    ) -> None:
+        """
+        Waits until the request may be sent.
+
+        Args:
+            tokens (int): The prompt tokens plus the max_tokens of the
+                request.
+            priority (int): Lower values are admitted first.
+            timeout (Optional[float]): Seconds to wait before giving up.
+            sequence (Optional[int]): The caller's place in the queue, kept
+                across retries so a retried request does not go to the
+                back.
+
+        Raises:
+            asyncio.TimeoutError: When the request was not admitted in
+                time.
+        """
+        waiter = _Waiter(
+            priority,
+            next(self._sequence) if sequence is None else sequence,
+            min(float(tokens), self.token_capacity),
+            asyncio.get_running_loop().create_future(),
+        )
+        heapq.heappush(self._waiters, waiter)
+        started = time.perf_counter_ns()
+        self._dispatch()
+        try:
+            await asyncio.wait_for(waiter.future, timeout)
+        except asyncio.TimeoutError:
+            self.stats.expired += 1
+            self._dispatch()
+            raise
+        finally:
+            registry().observe(
+                f"limiter.wait {self.name}",
+                time.perf_counter_ns() - started,
+            )
+        self.stats.admitted += 1
+        self.stats.tokens += int(waiter.tokens)
+
+    def succeeded(self) -> None:
+        """
+        Wins back a share of the quota after a successful request.
+        """
+        self.scale = min(1.0, self.scale + self.increase)
+
+    def throttle(self, retry_after: Optional[float] = None) -> None:
+        """
+        Slows down after the deployment answered with a 429.
+
+        Args:
+            retry_after (Optional[float]): The seconds the deployment asked
+                to wait.
+        """
+        now = time.monotonic()
+        self._refill(now)
+        self.stats.throttled += 1
+        self.scale = max(self.floor, self.scale * self.decrease)
+        self._requests = min(self._requests, 0.0)
+        self._tokens = min(self._tokens, 0.0)
+        self._paused_until = max(
+            self._paused_until, now + (retry_after or self.pause)
+        )
+        self._dispatch()
+
+    async def run(
+        self,
+        call: Callable[[], Awaitable[T]],
+        tokens: int,
+        priority: int = 0,
+        deadline: Optional[float] = None,
+        retries: int = 3,
+    ) -> T:
+        """
+        Sends a request once admitted, retrying it at its place in the
+        queue when the deployment answers with a 429.
+
+        Args:
+            call (Callable[[], Awaitable[T]]): Sends the request.
+            tokens (int): The prompt tokens plus the max_tokens of the
+                request.
+            priority (int): Lower values are admitted first.
+            deadline (Optional[float]): Seconds the caller may wait in
+                total.
+            retries (int): Retries after a 429.
+
+        Returns:
+            T: The result of the call.
+
+        Raises:
+            asyncio.TimeoutError: When the deadline passed before
+                admission.
+        """
+        sequence = next(self._sequence)
+        started = time.monotonic()
+        for attempt in range(retries + 1):
+            timeout = (
+                None
+                if deadline is None
+                else deadline - (time.monotonic() - started)
+            )
+            if timeout is not None and timeout <= 0:
+                self.stats.expired += 1
+                raise asyncio.TimeoutError()
+            await self.acquire(tokens, priority, timeout, sequence)
+            try:
+                result = await call()
+            except Exception as error:  # pylint: disable=broad-except
+                retry_after = throttled(error)
+                if retry_after is None:
+                    raise
+                self.throttle(retry_after)
+                if attempt == retries:
+                    raise
+                self.stats.retried += 1
+                continue
+            self.succeeded()
+            return result
+        raise AssertionError("unreachable")
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            **self.stats.as_dict(),
+            "queued": self.queued,
+            "rpm": round(self.rpm * self.scale),
+            "tpm": round(self.tpm * self.scale),
+        }
+
+
+_LIMITERS: Dict[Tuple[str, str], DeploymentLimiter] = {}
+
+
+def _limit(name: str, deployment: str, default: int) -> int:
+    suffix = re.sub(r"\W", "_", deployment).upper()
+    return int(
+        os.environ.get(f"AZURE_OPENAI_{name}_LIMIT_{suffix}")
+        or os.environ.get(f"AZURE_OPENAI_{name}_LIMIT")
+        or default
+    )
+
+
+def rate_limiter(
+    schema: Union[ChatSchema, TextSchema]
+) -> DeploymentLimiter:
+    """
+    Returns the process-wide limiter of a deployment. The quotas are read
+    from AZURE_OPENAI_TPM_LIMIT and AZURE_OPENAI_RPM_LIMIT, or their
+    variants suffixed with the deployment name, and RPM defaults to the 6
+    requests per 1000 tokens per minute Azure grants.
+
+    Args:
+        schema (Union[ChatSchema, TextSchema]): The deployment.
+
+    Returns:
+        DeploymentLimiter: The limiter shared by every caller of the
+            deployment.
+    """
+    key = (schema.endpoint, schema.deployment_name)
+    limiter = _LIMITERS.get(key)
+    if limiter is None:
+        tpm = _limit("TPM", schema.deployment_name, 80_000)
+        rpm = _limit(
+            "RPM", schema.deployment_name, max(1, tpm * 6 // 1_000)
+        )
+        limiter = _LIMITERS[key] = DeploymentLimiter(
+            schema.deployment_name or schema.endpoint or "default",
+            rpm,
+            tpm,
+        )
+    return limiter
+
+
+def limiter_stats() -> Dict[str, Dict[str, Any]]:
+    return {
+        limiter.name: limiter.snapshot() for limiter in _LIMITERS.values()
+    }
+
+
+class SimulatedDeployment:
+    """
+    Simulated deployment for tests and benchmarks that enforces its quotas
+    the way Azure does: a request whose estimated tokens do not fit the
+    buckets is rejected with a 429 and the seconds until they would, after
+    a network round trip of `rtt` seconds.
+    """
+
+    def __init__(
+        self,
+        rpm: int,
+        tpm: int,
+        burst: float = 10.0,
+        period: float = 60.0,
+        latency: float = 0.05,
+        rtt: float = 0.01,
+        seed: Optional[int] = None,
+    ) -> None:
+        self.rpm: int = rpm
+        self.tpm: int = tpm
+        self.period: float = period
+        self.latency: float = latency
+        self.rtt: float = rtt
+        self.request_capacity: float = max(1.0, rpm * burst / period)
+        self.token_capacity: float = max(1.0, tpm * burst / period)
+        self._requests: float = self.request_capacity
+        self._tokens: float = self.token_capacity
+        self._refilled: float = time.monotonic()
+        self._random: random.Random = random.Random(seed)
+        self.calls: int = 0
+        self.rejected: int = 0
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        elapsed, self._refilled = now - self._refilled, now
+        self._requests = min(
+            self.request_capacity,
+            self._requests + elapsed * self.rpm / self.period,
+        )
+        self._tokens = min(
+            self.token_capacity,
+            self._tokens + elapsed * self.tpm / self.period,
+        )
+
+    async def complete(self, tokens: int) -> str:
+        self.calls += 1
+        self._refill()
+        tokens = min(tokens, int(self.token_capacity))
+        if self._requests < 1.0 or self._tokens < tokens:
+            self.rejected += 1
+            await asyncio.sleep(self.rtt)
+            wait = max(
+                (1.0 - self._requests) * self.period / self.rpm,
+                (tokens - self._tokens) * self.period / self.tpm,
+            )
+            raise RateLimitError("429 Too Many Requests", retry_after=wait)
+        self._requests -= 1.0
+        self._tokens -= tokens
+        await asyncio.sleep(
+            self.latency * self._random.lognormvariate(0.0, 0.25)
+        )
+        return "ok"
@@ -1,21 +1,111 @@
 from __future__ import annotations
 
+import os
+import re
+import json
 import uuid
 import asyncio
+import hashlib
+import logging
+import time
+import weakref
 from abc import abstractmethod
-from typing import Any, List, Tuple, Dict
+from typing import (
+    Any,
+    AsyncIterator,
+    List,
+    Tuple,
+    Dict,
+    Optional,
+    Protocol,
+    Sequence,
+    Set,
+)
 
 import numpy as np
-from sklearn.mixture import GaussianMixture
-from sklearn.metrics.pairwise import cosine_similarity
 
 from motor.core import AgnosticDatabase
+from pymongo import ReplaceOne
+from pymongo.errors import BulkWriteError
 from pymongo.results import DeleteResult, UpdateResult, InsertOneResult
 from semantic_kernel.memory.memory_store_base import MemoryStoreBase
 from semantic_kernel.memory.memory_record import MemoryRecord
-import tiktoken
 
-from app.settings import MongoSettings
+from app.settings import MongoSettings, PostgresSettings
+from app.tools.batching import MicroBatcher
+from app.tools.indexes import (
+    ExactVectorIndex,
+    FaissVectorIndex,
+    VectorIndex,
+)
+
+
+logger: logging.Logger = logging.getLogger(__name__)
+
+
+class WriteWatcher(Protocol):
+    """
+    Keeps state derived from a collection, such as a lexical index, in step
+    with the writes made through a store.
+    """
+
+    async def collection_written(
+        self,
+        collection_name: str,
+        version: int,
+        upserted: Sequence[MemoryRecord],
+        removed: Sequence[str],
+    ) -> None:
+        ...
+
+
+class CollectionVersions:
+    """
+    Counts the writes made to each collection through this store, so caches
+    of answers derived from a collection can tell that it changed, and
+    tells the watchers added with `watch` which records each write upserted
+    or removed. Writes made by other processes are neither counted nor
+    reported.
+
+    `store_id` identifies the data behind the store, so caches shared by
+    several stores, such as one per tenant, keep their answers apart.
+    """
+
+    _versions: Dict[str, int]
+    _watchers: weakref.WeakSet
+    store_id: str = ''
+
+    @staticmethod
+    def _identify(*parts: str) -> str:
+        return hashlib.sha256('\x00'.join(parts).encode()).hexdigest()
+
+    def collection_version(self, collection_name: str) -> int:
+        return self._versions.get(collection_name, 0)
+
+    def watch(self, watcher: WriteWatcher) -> None:
+        """
+        Reports the writes of every collection to a watcher, for as long as
+        the watcher is alive.
+        """
+        self._watchers.add(watcher)
+
+    def _bump_version(self, collection_name: str) -> int:
+        self._versions[collection_name] = (
+            self._versions.get(collection_name, 0) + 1
+        )
+        return self._versions[collection_name]
+
+    async def _written(
+        self,
+        collection_name: str,
+        upserted: Sequence[MemoryRecord] = (),
+        removed: Sequence[str] = (),
+    ) -> None:
+        version = self._bump_version(collection_name)
+        for watcher in list(self._watchers):
+            await watcher.collection_written(
+                collection_name, version, upserted, removed
+            )
 
 
 class CosmosAbstractMemory(MemoryStoreBase):
@@ -72,11 +162,60 @@ class CosmosAbstractMemory(MemoryStoreBase):
         """
 
 
-class CosmosMongoMemory(CosmosAbstractMemory):
+class CosmosMongoMemory(CollectionVersions, CosmosAbstractMemory):
+
+    def __init__(
+        self,
+        database: str,
+        connection_string: Optional[str] = None,
+        index_dir: Optional[str] = None,
+        ann_threshold: int = 10_000,
+        search_mode: str = 'auto',
+        batch_size: int = 1_000,
+        search_window: float = 0.002,
+        max_search_batch: int = 64,
+        index_refresh: Optional[float] = None,
+        index_save_interval: float = 60.0,
+    ) -> None:
+        self.database_name: str = database
+        self.connection_string: str = (
+            connection_string or MongoSettings().connection_string()
+        )
+        self.store_id: str = self._identify(
+            self.connection_string, database
+        )
+        self.index_dir: Optional[str] = index_dir
+        self.ann_threshold: int = ann_threshold
+        if search_mode not in ('auto', 'exact', 'ann'):
+            raise ValueError(f"Unknown search mode {search_mode}")
+        self.search_mode: str = search_mode
+        self.batch_size: int = batch_size
+        self.index_refresh: Optional[float] = index_refresh
+        self.index_save_interval: float = index_save_interval
+        self._indexes: Dict[str, VectorIndex] = {}
+        self._index_locks: Dict[str, asyncio.Lock] = {}
+        self._indexed_at: Dict[str, float] = {}
+        self._saved_at: Dict[str, float] = {}
+        self._unsaved: Set[str] = set()
+        self._versions: Dict[str, int] = {}
+        self._watchers: weakref.WeakSet = weakref.WeakSet()
+        self.searches: Optional[MicroBatcher] = (
+            MicroBatcher(
+                self._search_batch, search_window, max_search_batch
+            )
+            if search_window > 0
+            else None
+        )
 
-    def __init__(self, database: str, *args) -> None:
-        settings = MongoSettings(*args)
-        self.database: AgnosticDatabase = settings.database(database)
+    @property
+    def database(self) -> AgnosticDatabase:
+        """
+        The database on the pooled client of the connection string, looked
+        up on every use so a client closed by the pool is reopened.
+        """
+        return MongoSettings().database(
+            self.database_name, self.connection_string
+        )
 
     async def __aenter__(self):
         return self
@@ -85,7 +224,11 @@ class CosmosMongoMemory(CosmosAbstractMemory):
         await self.close()
 
     async def close(self):
-        """Async close connection, invoked by MemoryStoreBase.__aexit__()"""
+        """Async close connection, invoked by MemoryStoreBase.__aexit__(),
+            after saving the indexes changed since their last save.
+        """
+        for collection_name in list(self._unsaved):
+            await self._save_index(collection_name, force=True)
 
     async def create(self, dataclass_instance: Dict[str, Any]) -> Any:
         document: dict[str, Any] = dataclass_instance
@@ -114,6 +257,7 @@ class CosmosMongoMemory(CosmosAbstractMemory):
     @staticmethod
     def __to_dict(memory: MemoryRecord) -> Dict[str, Any]:
         return dict(
+            _id=memory._key,
             key=memory._key,
             timestamp=memory._timestamp,
             is_reference=memory._is_reference,
@@ -122,9 +266,237 @@ class CosmosMongoMemory(CosmosAbstractMemory):
             description=memory._description,
             text=memory._text,
             additional_metadata=memory._additional_metadata,
-            embedding=memory._embedding,
+            embedding=(
+                np.asarray(memory._embedding, dtype=float).tolist()
+                if memory._embedding is not None else None
+            ),
+        )
+
+    @staticmethod
+    def __to_record(
+        document: Dict[str, Any], with_embedding: bool
+    ) -> MemoryRecord:
+        return MemoryRecord(
+            key=document['key'],
+            timestamp=document['timestamp'],
+            is_reference=document['is_reference'],
+            external_source_name=document['external_source_name'],
+            id=document['id'],
+            description=document['description'],
+            text=document['text'],
+            additional_metadata=document['additional_metadata'],
+            embedding=(
+                np.asarray(document['embedding'], dtype=np.float32)
+                if with_embedding else None
+            ),
+        )
+
+    @staticmethod
+    def _record_key(record: MemoryRecord) -> str:
+        return record._key or record._id
+
+    def _chunks(self, items: List[Any]) -> List[List[Any]]:
+        return [
+            items[start:start + self.batch_size]
+            for start in range(0, len(items), self.batch_size)
+        ]
+
+    def _index_path(self, collection_name: str) -> Optional[str]:
+        if not self.index_dir:
+            return None
+        return os.path.join(
+            self.index_dir, f"{self.database.name}.{collection_name}.faiss"
+        )
+
+    async def _vector_index(
+        self, collection_name: str
+    ) -> Optional[VectorIndex]:
+        """
+        Returns the vector index of a collection, loading it from disk or
+        building it from the stored embeddings the first time it is needed.
+        A saved index is only trusted while it holds as many vectors as the
+        collection. Writes made by other processes, such as other workers
+        or the ingestion jobs, are not seen by the index, so with several
+        writers set `index_refresh` to the seconds after which the index is
+        rebuilt from the collection.
+
+        Arguments:
+            collection_name {str} -- The name associated with a collection
+                of embeddings.
+
+        Returns:
+            Optional[VectorIndex] -- The index, or None if the collection
+                has no embeddings.
+        """
+        if not self._index_stale(collection_name):
+            return self._indexes[collection_name]
+        lock = self._index_locks.setdefault(
+            collection_name, asyncio.Lock()
+        )
+        async with lock:
+            if not self._index_stale(collection_name):
+                return self._indexes[collection_name]
+            path = self._index_path(collection_name)
+            index = None
+            if path and collection_name not in self._indexes:
+                index = await self._load_index(collection_name, path)
+            if index is None:
+                index = await self._build_index(collection_name)
+                self._unsaved.add(collection_name)
+            if index is not None:
+                self._indexes[collection_name] = index
+            else:
+                self._indexes.pop(collection_name, None)
+            self._indexed_at[collection_name] = time.monotonic()
+        await self._save_index(collection_name, force=True)
+        return index
+
+    def _index_stale(self, collection_name: str) -> bool:
+        return collection_name not in self._indexes or (
+            self.index_refresh is not None
+            and time.monotonic() - self._indexed_at[collection_name]
+            >= self.index_refresh
+        )
+
+    async def _load_index(
+        self, collection_name: str, path: str
+    ) -> Optional[VectorIndex]:
+        index = await asyncio.to_thread(
+            FaissVectorIndex.load, path, ann_threshold=self.ann_threshold
+        )
+        if index is None:
+            return None
+        count = await self.database[collection_name].count_documents(
+            {'embedding': {'$ne': None}}
+        )
+        if count != len(index):
+            logger.info(
+                "Rebuilding vector index of %s: %s vectors saved, %s "
+                "stored", collection_name, len(index), count,
+            )
+            return None
+        self._saved_at[collection_name] = time.monotonic()
+        return index
+
+    async def _build_index(
+        self, collection_name: str
+    ) -> Optional[VectorIndex]:
+        keys: List[str] = []
+        embeddings: List[List[float]] = []
+        cursor = self.database[collection_name].find(
+            {'embedding': {'$ne': None}}, {'key': 1, 'embedding': 1}
+        )
+        async for document in cursor:
+            keys.append(document['key'])
+            embeddings.append(document['embedding'])
+        if not keys:
+            return None
+        matrix = np.asarray(embeddings, dtype=np.float32)
+        index = self._new_index(matrix.shape[1], len(keys))
+        await asyncio.to_thread(index.add, keys, matrix)
+        return index
+
+    def _new_index(self, dimensions: int, size: int) -> VectorIndex:
+        if self.search_mode == 'exact' or (
+            self.search_mode == 'auto' and size < self.ann_threshold
+        ):
+            return ExactVectorIndex(dimensions, capacity=max(size, 1024))
+        return FaissVectorIndex(
+            dimensions, ann_threshold=self.ann_threshold
         )
 
+    async def _save_index(
+        self, collection_name: str, force: bool = False
+    ) -> None:
+        """
+        Saves the index of a collection changed since it was last saved,
+        at most once every `index_save_interval` seconds unless forced.
+        Writes between two saves are only persisted by the next save, at
+        the latest when the store is closed.
+        """
+        due = force or (
+            time.monotonic() - self._saved_at.get(collection_name, 0.0)
+            >= self.index_save_interval
+        )
+        if not due or collection_name not in self._unsaved:
+            return
+        self._unsaved.discard(collection_name)
+        self._saved_at[collection_name] = time.monotonic()
+        index = self._indexes.get(collection_name)
+        path = self._index_path(collection_name)
+        if path and isinstance(index, FaissVectorIndex):
+            await asyncio.to_thread(index.save, path)
+
+    async def _index_records(
+        self, collection_name: str, records: List[MemoryRecord]
+    ) -> None:
+        """
+        Keeps an already loaded index in sync with upserted records. The
+        index is updated in place, overwritten keys replacing their old
+        vectors, and writers of one collection are serialised by its index
+        lock. The index is saved outside the lock, in batches.
+        """
+        records = [
+            record for record in records if record._embedding is not None
+        ]
+        if not records or collection_name not in self._indexes:
+            return
+        lock = self._index_locks.setdefault(
+            collection_name, asyncio.Lock()
+        )
+        async with lock:
+            index = self._indexes.get(collection_name)
+            if index is None:
+                return
+            await asyncio.to_thread(
+                index.add,
+                [self._record_key(record) for record in records],
+                np.asarray(
+                    [record._embedding for record in records],
+                    dtype=np.float32,
+                ),
+            )
+            if (
+                self.search_mode == 'auto'
+                and isinstance(index, ExactVectorIndex)
+                and len(index) >= self.ann_threshold
+            ):
+                index = await asyncio.to_thread(
+                    FaissVectorIndex.from_exact,
+                    index,
+                    ann_threshold=self.ann_threshold,
+                )
+                self._indexes[collection_name] = index
+            self._unsaved.add(collection_name)
+        await self._save_index(collection_name)
+
+    async def _unindex_keys(
+        self, collection_name: str, keys: List[str]
+    ) -> None:
+        """
+        Removes deleted keys from an already loaded index.
+        """
+        if collection_name not in self._indexes:
+            return
+        lock = self._index_locks.setdefault(
+            collection_name, asyncio.Lock()
+        )
+        async with lock:
+            index = self._indexes.get(collection_name)
+            if index is None:
+                return
+            await asyncio.to_thread(index.remove, keys)
+            self._unsaved.add(collection_name)
+        await self._save_index(collection_name)
+
+    def _invalidate_index(self, collection_name: str) -> None:
+        self._indexes.pop(collection_name, None)
+        self._indexed_at.pop(collection_name, None)
+        self._unsaved.discard(collection_name)
+        path = self._index_path(collection_name)
+        if path and os.path.exists(path):
+            os.remove(path)
+
     async def create_collection(self, collection_name: str) -> None:
         """Creates a new collection in the data store.
 
@@ -154,6 +526,8 @@ class CosmosMongoMemory(CosmosAbstractMemory):
             None
         """
         await self.database.drop_collection(collection_name)
+        self._invalidate_index(collection_name)
+        self._bump_version(collection_name)
 
     async def does_collection_exist(self, collection_name: str) -> bool:
         """Determines if a collection exists in the data store.
@@ -178,19 +552,15 @@ class CosmosMongoMemory(CosmosAbstractMemory):
         Returns:
             str -- The unique identifier for the memory record.
         """
-        collection = await self.read(collection_name, uuid.UUID(record._key)) or None
-        if collection:
-            await self.update(uuid.UUID(record._key), self.__to_dict(record))
-            item = record._key
-        else:
-            instance = await self.create(self.__to_dict(record))
-            item = str(instance)
-        return item
+        keys = await self.upsert_batch(collection_name, [record])
+        return keys[0]
 
     async def upsert_batch(self, collection_name: str, records: List[MemoryRecord]) -> List[str]:
         """Upserts a group of memory records into the data store. Does not guarantee that the collection exists.
             If the record already exists, it will be updated.
             If the record does not exist, it will be created.
+            Records are written with one unordered bulk_write per chunk of
+            `batch_size` records.
 
         Arguments:
             collection_name {str} -- The name associated with a collection of embeddings.
@@ -199,7 +569,45 @@ class CosmosMongoMemory(CosmosAbstractMemory):
         Returns:
             List[str] -- The unique identifiers for the memory records.
         """
-        return await asyncio.gather(*map(lambda record: self.upsert(collection_name, record), records))
+        for record in records:
+            record._key = self._record_key(record)
+        failed: Dict[str, Any] = {}
+
+        async def write(chunk: List[MemoryRecord]) -> None:
+            operations = [
+                ReplaceOne(
+                    {'_id': record._key},
+                    self.__to_dict(record),
+                    upsert=True,
+                )
+                for record in chunk
+            ]
+            try:
+                await self.database[collection_name].bulk_write(
+                    operations, ordered=False
+                )
+            except BulkWriteError as error:
+                for write_error in error.details.get('writeErrors', []):
+                    failed[chunk[write_error['index']]._key] = (
+                        write_error.get('errmsg')
+                    )
+
+        await asyncio.gather(*map(write, self._chunks(records)))
+        written = [
+            record for record in records if record._key not in failed
+        ]
+        await self._index_records(collection_name, written)
+        await self._written(collection_name, written)
+        if failed:
+            logger.error(
+                "Failed to upsert %s records: %s", len(failed), failed
+            )
+            raise MemoryError(
+                f"Failed to upsert {len(failed)} of {len(records)} "
+                f"records into collection {collection_name}: "
+                f"{sorted(failed)}"
+            )
+        return [record._key for record in records]
 
     async def get(self, collection_name: str, key: str, with_embedding: bool) -> MemoryRecord:
         """Gets a memory record from the data store. Does not guarantee that the collection exists.
@@ -212,28 +620,17 @@ class CosmosMongoMemory(CosmosAbstractMemory):
         Returns:
             MemoryRecord -- The memory record if found
         """
-        item = await self.read(collection_name, uuid.UUID(key))
-        if item:
-            if with_embedding:
-                encoder = tiktoken.get_encoding("cl100k_base")
-                embedding = encoder.encode(item['text'])
-            response = MemoryRecord(
-                key=item['key'],
-                timestamp=item['timestamp'],
-                is_reference=item['is_reference'],
-                external_source_name=item['external_source_name'],
-                id=item['id'],
-                description=item['description'],
-                text=item['text'],
-                additional_metadata=item['additional_metadata'],
-                embedding=np.ndarray(item['embedding']) if embedding else None
-            )
-            return response
-        else:
+        records = await self.get_batch(
+            collection_name, [key], with_embedding
+        )
+        if not records:
             raise MemoryError(f"Memory record with key {key} not found in collection {collection_name}")
+        return records[0]
 
     async def get_batch(self, collection_name: str, keys: List[str], with_embeddings: bool) -> List[MemoryRecord]:
         """Gets a batch of memory records from the data store. Does not guarantee that the collection exists.
+            Records are fetched with one `$in` query per chunk of
+            `batch_size` keys.
 
         Arguments:
             collection_name {str} -- The name associated with a collection of embeddings.
@@ -243,7 +640,46 @@ class CosmosMongoMemory(CosmosAbstractMemory):
         Returns:
             List[MemoryRecord] -- The memory records associated with the unique keys provided.
         """
-        return await asyncio.gather(*map(lambda key: self.get(collection_name, key, with_embeddings), keys))
+        projection = None if with_embeddings else {'embedding': 0}
+
+        async def read(chunk: List[str]) -> List[Dict[str, Any]]:
+            return await self.database[collection_name].find(
+                {'_id': {'$in': chunk}}, projection
+            ).to_list(length=None)
+
+        documents = {
+            document['_id']: document
+            for chunk in await asyncio.gather(
+                *map(read, self._chunks(keys))
+            )
+            for document in chunk
+        }
+        return [
+            self.__to_record(documents[key], with_embeddings)
+            for key in keys if key in documents
+        ]
+
+    async def records(
+        self, collection_name: str, with_embeddings: bool = False
+    ) -> AsyncIterator[MemoryRecord]:
+        """Iterates over every memory record of a collection, streaming
+        them from a cursor.
+
+        Arguments:
+            collection_name {str} -- The name associated with a collection
+                of embeddings.
+            with_embeddings {bool} -- If true, the embeddings will be
+                returned in the memory records.
+
+        Returns:
+            AsyncIterator[MemoryRecord] -- The memory records of the
+                collection.
+        """
+        projection = None if with_embeddings else {'embedding': 0}
+        async for document in self.database[collection_name].find(
+            {}, projection
+        ):
+            yield self.__to_record(document, with_embeddings)
 
     async def remove(self, collection_name: str, key: str) -> None:
         """Removes a memory record from the data store. Does not guarantee that the collection exists.
@@ -255,10 +691,12 @@ class CosmosMongoMemory(CosmosAbstractMemory):
         Returns:
             None
         """
-        await self.delete(collection_name, uuid.UUID(key))
+        await self.remove_batch(collection_name, [key])
 
     async def remove_batch(self, collection_name: str, keys: List[str]) -> None:
         """Removes a batch of memory records from the data store. Does not guarantee that the collection exists.
+            Records are deleted with one `$in` query per chunk of
+            `batch_size` keys.
 
         Arguments:
             collection_name {str} -- The name associated with a collection of embeddings.
@@ -267,7 +705,13 @@ class CosmosMongoMemory(CosmosAbstractMemory):
         Returns:
             None
         """
-        await asyncio.gather(*map(lambda key: self.remove(collection_name, key), keys))
+        collection = self.database[collection_name]
+        await asyncio.gather(*(
+            collection.delete_many({'_id': {'$in': chunk}})
+            for chunk in self._chunks(keys)
+        ))
+        await self._unindex_keys(collection_name, keys)
+        await self._written(collection_name, removed=keys)
 
     async def get_nearest_match(
         self,
@@ -313,34 +757,494 @@ class CosmosMongoMemory(CosmosAbstractMemory):
             min_relevance_score {float} -- The minimum relevance threshold for returned results.
             with_embeddings {bool} -- If true, the embeddings will be returned in the memory records.
 
+        Concurrent searches of the same collection, arriving within
+        `search_window` seconds of each other, are answered together by one
+        `get_nearest_matches_batch` call.
+
         Returns:
             List[Tuple[MemoryRecord, float]] -- A list of tuples where item1 is a MemoryRecord and item2
                 is its similarity score as a float.
         """
-        documents = await self.database[collection_name].find({}).to_list(length=limit)
-        embeddings = np.array([doc['embedding'] + embedding for doc in documents])
-        n_components = np.arange(1, 21)
-        bics = np.array([GaussianMixture(n).fit(embeddings).bic(embeddings) for n in n_components])
-        optimal_n_components = n_components[np.argmin(bics)]
-        gmm = GaussianMixture(n_components=optimal_n_components)
-        gmm.fit(embeddings)
-        clusters = gmm.predict(embeddings)
-        embeddings_clusters = {}
-        for cluster, document in zip(clusters, documents):
-            document['cluster'] = cluster
-
-        for doc in documents:
-            # Get the cluster of the document
-            cluster = doc['cluster']
-
-            # If the cluster is not in the dictionary yet, add it
-            if cluster not in embeddings_clusters:
-                clusters[cluster] = []
-
-            # Add the document to the list of documents in its cluster
-            embeddings_clusters[cluster].append(doc)
-
-        similarities = cosine_similarity(np.array([embedding_cluster for embedding_cluster in embeddings_clusters.values()]), embeddings)[0]
-
-        ranked_documents = sorted(zip(documents, similarities), key=lambda x: x[1], reverse=True)
-        return [doc for doc, similarity in ranked_documents if similarity > min_relevance_score][:limit]
+        if self.searches is not None:
+            return await self.searches.submit(
+                (collection_name, with_embeddings),
+                (
+                    np.asarray(embedding, dtype=np.float32).ravel(),
+                    limit,
+                    min_relevance_score,
+                ),
+            )
+        response = await self.get_nearest_matches_batch(
+            collection_name=collection_name,
+            embeddings=np.atleast_2d(embedding),
+            limit=limit,
+            min_relevance_score=min_relevance_score,
+            with_embeddings=with_embeddings,
+        )
+        return response[0]
+
+    async def _search_batch(
+        self,
+        group: Tuple[str, bool],
+        queries: List[Tuple[np.ndarray, int, float]],
+    ) -> List[List[Tuple[MemoryRecord, float]]]:
+        """Answers a batch of searches with the largest limit and the
+            lowest threshold among them, then trims each answer to the
+            limit and threshold of its own search.
+
+        Arguments:
+            group {Tuple[str, bool]} -- The collection searched and whether
+                embeddings are returned.
+            queries {List[Tuple[ndarray, int, float]]} -- The embedding,
+                limit and minimum relevance score of each search.
+
+        Returns:
+            List[List[Tuple[MemoryRecord, float]]] -- The matches of each
+                search.
+        """
+        collection_name, with_embeddings = group
+        response = await self.get_nearest_matches_batch(
+            collection_name=collection_name,
+            embeddings=np.stack([embedding for embedding, *_ in queries]),
+            limit=max(limit for _, limit, _ in queries),
+            min_relevance_score=min(score for _, _, score in queries),
+            with_embeddings=with_embeddings,
+        )
+        return [
+            [match for match in matches if match[1] >= score][:limit]
+            for matches, (_, limit, score) in zip(response, queries)
+        ]
+
+    async def get_nearest_matches_batch(
+        self,
+        collection_name: str,
+        embeddings: np.ndarray,
+        limit: int,
+        min_relevance_score: float,
+        with_embeddings: bool,
+    ) -> List[List[Tuple[MemoryRecord, float]]]:
+        """Gets the nearest matches for several query embeddings with a
+        single index search.
+
+        Arguments:
+            collection_name {str} -- The name associated with a collection
+                of embeddings.
+            embeddings {ndarray} -- A (q, dim) matrix of query embeddings.
+            limit {int} -- The maximum number of similarity results to
+                return per query.
+            min_relevance_score {float} -- The minimum relevance threshold
+                for returned results.
+            with_embeddings {bool} -- If true, the embeddings will be
+                returned in the memory records.
+
+        Returns:
+            List[List[Tuple[MemoryRecord, float]]] -- For each query, a
+                list of tuples where item1 is a MemoryRecord and item2 is
+                its similarity score as a float.
+        """
+        index = await self._vector_index(collection_name)
+        if index is None:
+            return [[] for _ in range(len(embeddings))]
+        neighbours = await asyncio.to_thread(
+            index.search, embeddings, limit
+        )
+        scores = [
+            {
+                key: score
+                for key, score in row
+                if score >= min_relevance_score
+            }
+            for row in neighbours
+        ]
+        keys = set().union(*scores)
+        if not keys:
+            return [[] for _ in scores]
+        records = await self._hydrate(
+            collection_name, keys, with_embeddings
+        )
+        return [
+            sorted(
+                (
+                    (records[key], score)
+                    for key, score in row.items() if key in records
+                ),
+                key=lambda match: match[1],
+                reverse=True,
+            )
+            for row in scores
+        ]
+
+    async def _hydrate(
+        self,
+        collection_name: str,
+        keys: Set[str],
+        with_embeddings: bool,
+    ) -> Dict[str, MemoryRecord]:
+        """Loads the memory records of the keys matched by an index search.
+
+        Arguments:
+            collection_name {str} -- The name associated with a collection
+                of embeddings.
+            keys {Set[str]} -- The keys of the matched records.
+            with_embeddings {bool} -- If true, the embeddings will be
+                returned in the memory records.
+
+        Returns:
+            Dict[str, MemoryRecord] -- The records found, by key.
+        """
+        projection = None if with_embeddings else {'embedding': 0}
+        documents = await self.database[collection_name].find(
+            {'_id': {'$in': list(keys)}}, projection
+        ).to_list(length=None)
+        return {
+            document['_id']: self.__to_record(document, with_embeddings)
+            for document in documents
+        }
+
+
+class PostgresVectorMemory(CollectionVersions, MemoryStoreBase):
+    """
+    Memory store that keeps embeddings next to the relational data, using
+    the pgvector extension on the shared PostgresSettings pool.
+
+    With `dimensions` set, searches go through one HNSW index shared by
+    every collection of the table. The index scan returns `hnsw.ef_search`
+    candidates before `WHERE collection = $1` is applied, so each search
+    raises `ef_search` to at least `overfetch` times its limit, up to
+    pgvector's maximum of 1000. A higher `ef_search` costs latency and
+    memory on every search. A collection that holds a small share of the
+    table can still get fewer than `limit` matches; give such collections a
+    table of their own.
+    """
+
+    def __init__(
+        self,
+        table: str = 'memory_records',
+        dimensions: Optional[int] = None,
+        settings: Optional[PostgresSettings] = None,
+        ef_search: int = 100,
+        overfetch: int = 10,
+    ) -> None:
+        if not re.fullmatch(r'[A-Za-z_][A-Za-z0-9_]*', table):
+            raise ValueError(f"Invalid table name {table}")
+        self.table: str = table
+        self.dimensions: Optional[int] = dimensions
+        self.settings: PostgresSettings = settings or PostgresSettings()
+        self.store_id: str = self._identify(
+            self.settings.database_url(), table
+        )
+        self.ef_search: int = ef_search
+        self.overfetch: int = overfetch
+        self._ready: bool = False
+        self._versions: Dict[str, int] = {}
+        self._watchers: weakref.WeakSet = weakref.WeakSet()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        await self.close()
+
+    async def close(self):
+        """Async close, a no-op as the pool is shared by the process."""
+
+    async def _ensure_schema(self) -> None:
+        if self._ready:
+            return
+        vector = (
+            f'vector({self.dimensions})' if self.dimensions else 'vector'
+        )
+        async with self.settings.acquire() as connection:
+            await connection.execute(
+                'CREATE EXTENSION IF NOT EXISTS vector'
+            )
+            await connection.execute(
+                f"""
+                CREATE TABLE IF NOT EXISTS {self.table}_collections (
+                    name TEXT PRIMARY KEY
+                );
+                CREATE TABLE IF NOT EXISTS {self.table} (
+                    collection TEXT NOT NULL
+                        REFERENCES {self.table}_collections (name)
+                        ON DELETE CASCADE,
+                    key TEXT NOT NULL,
+                    timestamp TIMESTAMPTZ,
+                    is_reference BOOLEAN,
+                    external_source_name TEXT,
+                    id TEXT,
+                    description TEXT,
+                    text TEXT,
+                    additional_metadata TEXT,
+                    embedding {vector},
+                    PRIMARY KEY (collection, key)
+                )
+                """
+            )
+            if self.dimensions:
+                await connection.execute(
+                    f"""
+                    CREATE INDEX IF NOT EXISTS {self.table}_embedding_idx
+                    ON {self.table}
+                    USING hnsw (embedding vector_cosine_ops)
+                    """
+                )
+        self._ready = True
+
+    @staticmethod
+    def _vector(embedding: Optional[np.ndarray]) -> Optional[str]:
+        if embedding is None:
+            return None
+        return json.dumps(np.asarray(embedding, dtype=float).tolist())
+
+    @staticmethod
+    def _to_record(row: Any, with_embedding: bool) -> MemoryRecord:
+        return MemoryRecord(
+            key=row['key'],
+            timestamp=row['timestamp'],
+            is_reference=row['is_reference'],
+            external_source_name=row['external_source_name'],
+            id=row['id'],
+            description=row['description'],
+            text=row['text'],
+            additional_metadata=row['additional_metadata'],
+            embedding=(
+                np.asarray(json.loads(row['embedding']), dtype=np.float32)
+                if with_embedding and row['embedding'] else None
+            ),
+        )
+
+    def _columns(self, with_embeddings: bool) -> str:
+        embedding = (
+            'embedding::text AS embedding'
+            if with_embeddings else 'NULL AS embedding'
+        )
+        return (
+            'key, timestamp, is_reference, external_source_name, id, '
+            f'description, text, additional_metadata, {embedding}'
+        )
+
+    async def create_collection(self, collection_name: str) -> None:
+        await self._ensure_schema()
+        async with self.settings.acquire() as connection:
+            await connection.execute(
+                f'INSERT INTO {self.table}_collections (name) VALUES ($1) '
+                'ON CONFLICT DO NOTHING',
+                collection_name,
+            )
+
+    async def get_collections(self) -> List[str]:
+        await self._ensure_schema()
+        async with self.settings.acquire() as connection:
+            rows = await connection.fetch(
+                f'SELECT name FROM {self.table}_collections'
+            )
+        return [row['name'] for row in rows]
+
+    async def delete_collection(self, collection_name: str) -> None:
+        await self._ensure_schema()
+        async with self.settings.acquire() as connection:
+            await connection.execute(
+                f'DELETE FROM {self.table}_collections WHERE name = $1',
+                collection_name,
+            )
+        self._bump_version(collection_name)
+
+    async def does_collection_exist(self, collection_name: str) -> bool:
+        await self._ensure_schema()
+        async with self.settings.acquire() as connection:
+            return await connection.fetchval(
+                f'SELECT EXISTS (SELECT 1 FROM {self.table}_collections '
+                'WHERE name = $1)',
+                collection_name,
+            )
+
+    async def upsert(
+        self, collection_name: str, record: MemoryRecord
+    ) -> str:
+        keys = await self.upsert_batch(collection_name, [record])
+        return keys[0]
+
+    async def upsert_batch(
+        self, collection_name: str, records: List[MemoryRecord]
+    ) -> List[str]:
+        """Upserts a group of memory records with a single prepared
+        statement.
+
+        Arguments:
+            collection_name {str} -- The name associated with a collection
+                of embeddings.
+            records {MemoryRecord} -- The memory records to upsert.
+
+        Returns:
+            List[str] -- The unique identifiers for the memory records.
+        """
+        await self.create_collection(collection_name)
+        for record in records:
+            record._key = record._key or record._id
+        async with self.settings.acquire() as connection:
+            await connection.executemany(
+                f"""
+                INSERT INTO {self.table} (
+                    collection, key, timestamp, is_reference,
+                    external_source_name, id, description, text,
+                    additional_metadata, embedding
+                )
+                VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9, $10::vector)
+                ON CONFLICT (collection, key) DO UPDATE SET
+                    timestamp = EXCLUDED.timestamp,
+                    is_reference = EXCLUDED.is_reference,
+                    external_source_name = EXCLUDED.external_source_name,
+                    id = EXCLUDED.id,
+                    description = EXCLUDED.description,
+                    text = EXCLUDED.text,
+                    additional_metadata = EXCLUDED.additional_metadata,
+                    embedding = EXCLUDED.embedding
+                """,
+                [
+                    (
+                        collection_name, record._key, record._timestamp,
+                        record._is_reference, record._external_source_name,
+                        record._id, record._description, record._text,
+                        record._additional_metadata,
+                        self._vector(record._embedding),
+                    )
+                    for record in records
+                ],
+            )
+        await self._written(collection_name, records)
+        return [record._key for record in records]
+
+    async def get(
+        self, collection_name: str, key: str, with_embedding: bool
+    ) -> MemoryRecord:
+        records = await self.get_batch(
+            collection_name, [key], with_embedding
+        )
+        if not records:
+            raise MemoryError(
+                f"Memory record with key {key} not found in collection "
+                f"{collection_name}"
+            )
+        return records[0]
+
+    async def get_batch(
+        self, collection_name: str, keys: List[str], with_embeddings: bool
+    ) -> List[MemoryRecord]:
+        await self._ensure_schema()
+        async with self.settings.acquire() as connection:
+            rows = await connection.fetch(
+                f'SELECT {self._columns(with_embeddings)} '
+                f'FROM {self.table} '
+                'WHERE collection = $1 AND key = ANY($2::text[])',
+                collection_name, keys,
+            )
+        records = {
+            row['key']: self._to_record(row, with_embeddings)
+            for row in rows
+        }
+        return [records[key] for key in keys if key in records]
+
+    async def records(
+        self, collection_name: str, with_embeddings: bool = False
+    ) -> AsyncIterator[MemoryRecord]:
+        """Iterates over every memory record of a collection, streaming
+        them from a cursor.
+
+        Arguments:
+            collection_name {str} -- The name associated with a collection
+                of embeddings.
+            with_embeddings {bool} -- If true, the embeddings will be
+                returned in the memory records.
+
+        Returns:
+            AsyncIterator[MemoryRecord] -- The memory records of the
+                collection.
+        """
+        await self._ensure_schema()
+        async with self.settings.acquire() as connection:
+            async with connection.transaction():
+                async for row in connection.cursor(
+                    f'SELECT {self._columns(with_embeddings)} '
+                    f'FROM {self.table} WHERE collection = $1',
+                    collection_name,
+                ):
+                    yield self._to_record(row, with_embeddings)
+
+    async def remove(self, collection_name: str, key: str) -> None:
+        await self.remove_batch(collection_name, [key])
+
+    async def remove_batch(
+        self, collection_name: str, keys: List[str]
+    ) -> None:
+        await self._ensure_schema()
+        async with self.settings.acquire() as connection:
+            await connection.execute(
+                f'DELETE FROM {self.table} '
+                'WHERE collection = $1 AND key = ANY($2::text[])',
+                collection_name, keys,
+            )
+        await self._written(collection_name, removed=keys)
+
+    async def get_nearest_match(
+        self,
+        collection_name: str,
+        embedding: np.ndarray,
+        min_relevance_score: float,
+        with_embedding: bool,
+    ) -> Tuple[MemoryRecord, float]:
+        response = await self.get_nearest_matches(
+            collection_name=collection_name,
+            embedding=embedding,
+            limit=1,
+            min_relevance_score=min_relevance_score,
+            with_embeddings=with_embedding,
+        )
+        return response[0]
+
+    async def get_nearest_matches(
+        self,
+        collection_name: str,
+        embedding: np.ndarray,
+        limit: int,
+        min_relevance_score: float,
+        with_embeddings: bool,
+    ) -> List[Tuple[MemoryRecord, float]]:
+        """Gets the nearest matches by cosine distance, ranked inside
+        Postgres.
+
+        Arguments:
+            collection_name {str} -- The name associated with a collection
+                of embeddings.
+            embedding {ndarray} -- The embedding to compare the
+                collection's embeddings with.
+            limit {int} -- The maximum number of similarity results to
+                return.
+            min_relevance_score {float} -- The minimum relevance threshold
+                for returned results.
+            with_embeddings {bool} -- If true, the embeddings will be
+                returned in the memory records.
+
+        Returns:
+            List[Tuple[MemoryRecord, float]] -- A list of tuples where
+                item1 is a MemoryRecord and item2 is its similarity score
+                as a float.
+        """
+        await self._ensure_schema()
+        ef_search = min(max(self.ef_search, self.overfetch * limit), 1000)
+        async with self.settings.acquire() as connection:
+            async with connection.transaction():
+                await connection.execute(
+                    f'SET LOCAL hnsw.ef_search = {int(ef_search)}'
+                )
+                rows = await connection.fetch(
+                    f'SELECT {self._columns(with_embeddings)}, '
+                    '1 - (embedding <=> $2::vector) AS score '
+                    f'FROM {self.table} '
+                    'WHERE collection = $1 AND embedding IS NOT NULL '
+                    'ORDER BY embedding <=> $2::vector LIMIT $3',
+                    collection_name, self._vector(embedding), limit,
+                )
+        return [
+            (self._to_record(row, with_embeddings), float(row['score']))
+            for row in rows if row['score'] >= min_relevance_score
+        ]
@@ -0,0 +1,231 @@
+"""
+Assembly of the retrieved context of a prompt under a token budget.
+"""
+from __future__ import annotations
+
+import re
+import math
+import hashlib
+from dataclasses import dataclass, field
+from typing import Dict, FrozenSet, List, Optional
+
+from app.utils.tokens import count_tokens, count_tokens_batch
+
+
+def _shingles(text: str, size: int) -> FrozenSet[int]:
+    words = re.findall(r"\w+", text.lower())
+    if len(words) < size:
+        return frozenset({hash(tuple(words))})
+    return frozenset(
+        hash(tuple(words[start:start + size]))
+        for start in range(len(words) - size + 1)
+    )
+
+
+@dataclass
+class Passage:
+    section: str
+    rank: int
+    text: str
+    tokens: int
+    value: float
+    shingles: FrozenSet[int] = field(repr=False, default=frozenset())
+
+
+@dataclass
+class SectionReport:
+    tokens: int = 0
+    kept: int = 0
+    dropped: int = 0
+    duplicates: int = 0
+
+
+@dataclass
+class PackedContext:
+    sections: Dict[str, str]
+    budget: int
+    report: Dict[str, SectionReport]
+
+    @property
+    def tokens(self) -> int:
+        return sum(section.tokens for section in self.report.values())
+
+    def as_dict(self) -> Dict[str, object]:
+        return {
+            "budget": self.budget,
+            "tokens": self.tokens,
+            "sections": {
+                name: vars(section)
+                for name, section in self.report.items()
+            },
+        }
+
+
+class ContextPacker:
+    """
+    Fits the ranked passages of every retriever into a token budget.
+
+    Exact and near-identical passages, compared by the Jaccard similarity
+    of their word shingles, are kept only once, at their best rank. A
+    passage is worth `weight / (rank + 1)` of its section, and the passages
+    are chosen either greedily by value or by a 0/1 knapsack that maximises
+    the total value. The chosen passages keep their retrieval order in each
+    section.
+    """
+
+    def __init__(
+        self,
+        budget: int = 3_000,
+        strategy: str = "greedy",
+        weights: Optional[Dict[str, float]] = None,
+        similarity: float = 0.8,
+        shingle_size: int = 3,
+        separator: str = "\n",
+    ) -> None:
+        if strategy not in ("greedy", "knapsack"):
+            raise ValueError(f"Unknown packing strategy {strategy}")
+        self.budget: int = budget
+        self.strategy: str = strategy
+        self.weights: Dict[str, float] = weights or {}
+        self.similarity: float = similarity
+        self.shingle_size: int = shingle_size
+        self.separator: str = separator
+
+    def _candidates(
+        self,
+        passages: Dict[str, List[str]],
+        report: Dict[str, SectionReport],
+    ) -> List[Passage]:
+        separator_tokens = count_tokens(self.separator)
+        ranked = [
+            (section, rank, text.strip())
+            for section, texts in passages.items()
+            for rank, text in enumerate(texts)
+            if text.strip()
+        ]
+        counts = count_tokens_batch([text for _, _, text in ranked])
+        candidates: List[Passage] = [
+            Passage(
+                section=section,
+                rank=rank,
+                text=text,
+                tokens=count + separator_tokens,
+                value=self.weights.get(section, 1.0) / (rank + 1),
+            )
+            for (section, rank, text), count in zip(ranked, counts)
+        ]
+        return self._deduplicate(candidates, report)
+
+    def _deduplicate(
+        self,
+        candidates: List[Passage],
+        report: Dict[str, SectionReport],
+    ) -> List[Passage]:
+        seen = set()
+        unique: List[Passage] = []
+        for candidate in sorted(
+            candidates, key=lambda passage: -passage.value
+        ):
+            digest = hashlib.sha1(
+                " ".join(candidate.text.lower().split()).encode()
+            ).digest()
+            duplicate = digest in seen
+            if not duplicate and self.similarity < 1.0:
+                candidate.shingles = _shingles(
+                    candidate.text, self.shingle_size
+                )
+                duplicate = any(
+                    len(candidate.shingles & kept.shingles)
+                    >= self.similarity
+                    * len(candidate.shingles | kept.shingles)
+                    for kept in unique
+                )
+            if duplicate:
+                report[candidate.section].duplicates += 1
+                continue
+            seen.add(digest)
+            unique.append(candidate)
+        return unique
+
+    @staticmethod
+    def _greedy(candidates: List[Passage], budget: int) -> List[Passage]:
+        chosen, used = [], 0
+        for candidate in candidates:
+            if used + candidate.tokens <= budget:
+                chosen.append(candidate)
+                used += candidate.tokens
+        return chosen
+
+    @staticmethod
+    def _knapsack(candidates: List[Passage], budget: int) -> List[Passage]:
+        resolution = max(1, math.ceil(budget / 1_024))
+        capacity = budget // resolution
+        weights = [math.ceil(c.tokens / resolution) for c in candidates]
+        best = [0.0] * (capacity + 1)
+        taken = [[False] * (capacity + 1) for _ in candidates]
+        for item, (candidate, weight) in enumerate(
+            zip(candidates, weights)
+        ):
+            for size in range(capacity, weight - 1, -1):
+                if best[size - weight] + candidate.value > best[size]:
+                    best[size] = best[size - weight] + candidate.value
+                    taken[item][size] = True
+        chosen, size = [], capacity
+        for item in range(len(candidates) - 1, -1, -1):
+            if taken[item][size]:
+                chosen.append(candidates[item])
+                size -= weights[item]
+        return chosen
+
+    def pack(
+        self,
+        passages: Dict[str, List[str]],
+        budget: Optional[int] = None,
+    ) -> PackedContext:
+        """
+        Chooses the passages that fit the budget.
+
+        Args:
+            passages (Dict[str, List[str]]): The passages of each section,
+                best first.
+            budget (Optional[int]): The tokens available, capped by the
+                packer's own budget.
+
+        Returns:
+            PackedContext: The text of each section and the tokens it used.
+        """
+        budget = (
+            self.budget
+            if budget is None
+            else max(0, min(budget, self.budget))
+        )
+        report = {section: SectionReport() for section in passages}
+        candidates = self._candidates(passages, report)
+        if self.strategy == "knapsack":
+            chosen = self._knapsack(candidates, budget)
+        else:
+            chosen = self._greedy(candidates, budget)
+        chosen_ids = {id(passage) for passage in chosen}
+        kept: Dict[str, List[Passage]] = {
+            section: [] for section in passages
+        }
+        for candidate in candidates:
+            if id(candidate) in chosen_ids:
+                kept[candidate.section].append(candidate)
+                report[candidate.section].kept += 1
+                report[candidate.section].tokens += candidate.tokens
+            else:
+                report[candidate.section].dropped += 1
+        return PackedContext(
+            sections={
+                section: self.separator.join(
+                    passage.text
+                    for passage in sorted(
+                        texts, key=lambda passage: passage.rank
+                    )
+                )
+                for section, texts in kept.items()
+            },
+            budget=budget,
+            report=report,
+        )
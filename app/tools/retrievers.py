@@ -0,0 +1,205 @@
+"""
+Retrieval sources that feed the prompt templates of the RAG agents, and the
+concurrent fan-out that queries them.
+"""
+from __future__ import annotations
+
+import time
+import asyncio
+import logging
+from abc import ABC, abstractmethod
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Union
+
+from semantic_kernel.memory.semantic_text_memory_base import (
+    SemanticTextMemoryBase,
+)
+
+
+logger: logging.Logger = logging.getLogger(__name__)
+
+
+class Retriever(ABC):
+    """
+    A source of context for a prompt. A retriever that exceeds its timeout
+    is dropped from the answer instead of delaying it.
+    """
+
+    def __init__(self, timeout: Optional[float] = None) -> None:
+        self.timeout: Optional[float] = timeout
+
+    @abstractmethod
+    async def passages(self, prompt: str) -> List[str]:
+        """
+        Retrieves the passages relevant to the prompt.
+
+        Args:
+            prompt (str): The user prompt.
+
+        Returns:
+            List[str]: The retrieved passages, best first.
+        """
+
+    async def retrieve(self, prompt: str) -> str:
+        """
+        Retrieves the context relevant to the prompt.
+
+        Args:
+            prompt (str): The user prompt.
+
+        Returns:
+            str: The retrieved context, ready to be placed in a template.
+        """
+        return '\n'.join(await self.passages(prompt))
+
+
+class MemoryRetriever(Retriever):
+    """
+    Retrieves the closest records of a semantic memory collection.
+    """
+
+    def __init__(
+        self,
+        memory: SemanticTextMemoryBase,
+        collection: str,
+        limit: int = 10,
+        min_relevance_score: float = 0.0,
+        timeout: Optional[float] = None,
+    ) -> None:
+        super().__init__(timeout)
+        self.memory: SemanticTextMemoryBase = memory
+        self.collection: str = collection
+        self.limit: int = limit
+        self.min_relevance_score: float = min_relevance_score
+
+    async def passages(self, prompt: str) -> List[str]:
+        results = await self.memory.search(
+            self.collection,
+            prompt,
+            self.limit,
+            self.min_relevance_score,
+        )
+        return [result.text for result in results if result.text]
+
+
+class CallableRetriever(Retriever):
+    """
+    Adapts a coroutine function, such as an agent's `augmented_retrieve`,
+    into a retriever. The function returns either the passages or a single
+    text.
+    """
+
+    def __init__(
+        self,
+        function: Callable[[str], Awaitable[Union[str, List[str]]]],
+        timeout: Optional[float] = None,
+    ) -> None:
+        super().__init__(timeout)
+        self.function: Callable[
+            [str], Awaitable[Union[str, List[str]]]
+        ] = function
+
+    async def passages(self, prompt: str) -> List[str]:
+        result = await self.function(prompt)
+        return [result] if isinstance(result, str) else list(result)
+
+
+async def _fan_out(
+    retrievers: Dict[str, Retriever],
+    call: Callable[[Retriever], Awaitable[Any]],
+    deadline: Optional[float],
+    default: Any,
+) -> Dict[str, Any]:
+    started = time.perf_counter()
+
+    async def run(name: str, retriever: Retriever) -> Any:
+        try:
+            return await asyncio.wait_for(
+                call(retriever), timeout=retriever.timeout
+            )
+        except asyncio.TimeoutError:
+            logger.warning(
+                "Retriever %s timed out after %ss", name, retriever.timeout
+            )
+        except Exception:  # pylint: disable=broad-except
+            logger.exception("Retriever %s failed", name)
+        return default
+
+    tasks: Dict[str, asyncio.Task] = {
+        name: asyncio.create_task(run(name, retriever))
+        for name, retriever in retrievers.items()
+    }
+    if not tasks:
+        return {}
+    _, pending = await asyncio.wait(tasks.values(), timeout=deadline)
+    for task in pending:
+        task.cancel()
+    if pending:
+        await asyncio.gather(*pending, return_exceptions=True)
+        logger.warning(
+            "Retrieval deadline of %ss reached after %.3fs, dropped %s",
+            deadline,
+            time.perf_counter() - started,
+            [name for name, task in tasks.items() if task in pending],
+        )
+    return {
+        name: default if task in pending else task.result()
+        for name, task in tasks.items()
+    }
+
+
+async def fan_out(
+    retrievers: Dict[str, Retriever],
+    prompt: str,
+    deadline: Optional[float] = None,
+    default: str = '',
+) -> Dict[str, str]:
+    """
+    Queries every retriever concurrently, so retrieval takes as long as the
+    slowest source rather than the sum of all of them. A source that fails,
+    exceeds its own timeout or is still running when the overall deadline
+    expires is cancelled and contributes `default` instead.
+
+    Args:
+        retrievers (Dict[str, Retriever]): The retrievers, by template
+            variable.
+        prompt (str): The user prompt.
+        deadline (Optional[float]): Seconds the whole retrieval may take.
+        default (str): The value used for sources that did not answer.
+
+    Returns:
+        Dict[str, str]: The retrieved context, by template variable.
+    """
+    return await _fan_out(
+        retrievers,
+        lambda retriever: retriever.retrieve(prompt),
+        deadline,
+        default,
+    )
+
+
+async def fan_out_passages(
+    retrievers: Dict[str, Retriever],
+    prompt: str,
+    deadline: Optional[float] = None,
+) -> Dict[str, List[str]]:
+    """
+    Like `fan_out`, but keeps the ranked passages of every source apart so
+    they can be packed into a token budget. Sources that did not answer
+    contribute no passages.
+
+    Args:
+        retrievers (Dict[str, Retriever]): The retrievers, by template
+            variable.
+        prompt (str): The user prompt.
+        deadline (Optional[float]): Seconds the whole retrieval may take.
+
+    Returns:
+        Dict[str, List[str]]: The retrieved passages, best first, by
+            template variable.
+    """
+    return await _fan_out(
+        retrievers,
+        lambda retriever: retriever.passages(prompt),
+        deadline,
+        [],
+    )
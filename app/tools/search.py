@@ -0,0 +1,199 @@
+"""
+Search backends used by the agents' augmented retrieval.
+"""
+from __future__ import annotations
+
+import re
+import time
+import asyncio
+from abc import ABC, abstractmethod
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple
+
+from azure.core.credentials import AzureKeyCredential
+from azure.search.documents.aio import SearchClient
+
+from app.schemas.agents import SearchEngineSchema
+from app.tools.caches import CacheStats, LRUCache
+
+
+SearchResults = List[Dict[str, Any]]
+
+
+class SearchBackend(ABC):
+    """
+    A full text search service returning documents with a `@search.score`.
+    """
+
+    @abstractmethod
+    async def search(
+        self,
+        query: str,
+        top: int = 10,
+        filters: Optional[str] = None
+    ) -> SearchResults:
+        """
+        Searches the index.
+
+        Args:
+            query (str): The search text.
+            top (int): The maximum number of documents to return.
+            filters (Optional[str]): An OData filter expression.
+
+        Returns:
+            SearchResults: The matching documents, best first.
+        """
+
+    async def close(self) -> None:
+        """
+        Releases the connections held by the backend.
+        """
+
+
+class AzureSearchBackend(SearchBackend):
+    """
+    Azure AI Search through one long-lived client, so every query reuses
+    the same HTTP session instead of opening a new TLS connection.
+    """
+
+    def __init__(
+        self, schema: SearchEngineSchema = SearchEngineSchema()
+    ) -> None:
+        self.client: SearchClient = SearchClient(
+            endpoint=schema.endpoint,
+            index_name=schema.index_name,
+            credential=AzureKeyCredential(schema.search_key)
+        )
+
+    async def search(
+        self,
+        query: str,
+        top: int = 10,
+        filters: Optional[str] = None
+    ) -> SearchResults:
+        results = await self.client.search(
+            search_text=query, top=top, filter=filters
+        )
+        return [dict(result) async for result in results]
+
+    async def close(self) -> None:
+        await self.client.close()
+
+
+class FakeSearchBackend(SearchBackend):
+    """
+    In-memory stand-in for Azure AI Search, for tests and benchmarks.
+
+    Documents are scored by the number of query terms they contain, scaled
+    so that a good match clears the agents' relevance cutoff.
+    """
+
+    def __init__(
+        self,
+        documents: List[str],
+        latency: float = 0.0,
+        score_per_term: float = 10.0,
+    ) -> None:
+        self.documents: List[str] = documents
+        self.latency: float = latency
+        self.score_per_term: float = score_per_term
+        self.calls: int = 0
+
+    async def search(
+        self,
+        query: str,
+        top: int = 10,
+        filters: Optional[str] = None
+    ) -> SearchResults:
+        self.calls += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        terms = set(re.findall(r"\w+", query.lower()))
+        scored = [
+            {
+                "content": document,
+                "@search.score": self.score_per_term * len(
+                    terms & set(re.findall(r"\w+", document.lower()))
+                ),
+            }
+            for document in self.documents
+        ]
+        scored = [
+            result for result in scored if result["@search.score"] > 0
+        ]
+        return sorted(
+            scored, key=lambda r: r["@search.score"], reverse=True
+        )[:top]
+
+
+class CachedSearch(SearchBackend):
+    """
+    TTL and LRU bounded cache in front of a search backend.
+
+    Identical queries issued while one is already in flight wait for that
+    request instead of reaching the backend again. The request runs in its
+    own task, so a caller giving up does not cancel it for the others.
+    """
+
+    def __init__(
+        self,
+        backend: SearchBackend,
+        maxsize: int = 1_024,
+        ttl: float = 300.0,
+    ) -> None:
+        self.backend: SearchBackend = backend
+        self.ttl: float = ttl
+        self.stats: CacheStats = CacheStats()
+        self._entries: LRUCache[Tuple, Tuple[float, SearchResults]] = (
+            LRUCache(maxsize, self.stats)
+        )
+        self._in_flight: Dict[Tuple, asyncio.Task] = {}
+
+    async def search(
+        self,
+        query: str,
+        top: int = 10,
+        filters: Optional[str] = None
+    ) -> SearchResults:
+        key = (query, top, filters)
+        entry = self._entries.get(key)
+        if entry is not None:
+            expires, results = entry
+            if expires > time.monotonic():
+                self.stats.hits += 1
+                return results
+            self._entries.pop(key)
+        task = self._in_flight.get(key)
+        if task is not None:
+            self.stats.hits += 1
+        else:
+            self.stats.misses += 1
+            task = asyncio.get_running_loop().create_task(self._fetch(key))
+            self._in_flight[key] = task
+            task.add_done_callback(lambda done: self._landed(key, done))
+        return await asyncio.shield(task)
+
+    async def _fetch(self, key: Tuple) -> SearchResults:
+        results = await self.backend.search(*key)
+        self._entries.put(key, (time.monotonic() + self.ttl, results))
+        return results
+
+    def _landed(self, key: Tuple, task: asyncio.Task) -> None:
+        if self._in_flight.get(key) is task:
+            del self._in_flight[key]
+        if not task.cancelled():
+            task.exception()
+
+    async def close(self) -> None:
+        for task in list(self._in_flight.values()):
+            task.cancel()
+        self._entries.clear()
+        await self.backend.close()
+
+
+@lru_cache(maxsize=None)
+def search_engine() -> CachedSearch:
+    """
+    Returns the process-wide cached Azure AI Search backend.
+    """
+    return CachedSearch(AzureSearchBackend())
@@ -0,0 +1,588 @@
+"""
+Micro benchmarks for the retrieval and ingestion building blocks.
+
+Run with `python -m app.utils.benchmarks <name>`.
+"""
+from __future__ import annotations
+
+import os
+import sys
+import time
+import random
+import asyncio
+import resource
+import tempfile
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+import numpy as np
+import tiktoken
+from semantic_kernel.memory.memory_record import MemoryRecord
+
+from app.tools.indexes import (
+    ExactVectorIndex,
+    FaissVectorIndex,
+    normalize,
+    recall_at_k,
+)
+from app.tools.search import CachedSearch, FakeSearchBackend
+from app.tools.memories import CosmosMongoMemory
+from app.tools.caches import CachedEmbeddingGenerator
+from app.tools.embeddings import (
+    GPTEmbeddingGenerator,
+    HashingEmbeddingBackend,
+)
+from app.tools.hybrid import BM25Index, reciprocal_rank_fusion
+from app.patterns.chunker import (
+    FileSystemReader,
+    SentenceChunker,
+    TokenChunker,
+    chunk_corpus,
+)
+from app.utils.tokens import TokenCounter, encoder
+from app.tools.limits import (
+    DeploymentLimiter,
+    SimulatedDeployment,
+    throttled,
+)
+from app.settings.api import (
+    APIImplementation,
+    DataIngestionAPIBridge,
+    LocalAPIStub,
+)
+from app.patterns.simple.simple import SimpleRAG
+from app.schemas.agents import ChatSchema
+
+
+def _random_embeddings(
+    count: int, dimensions: int, seed: int = 0
+) -> np.ndarray:
+    return np.random.default_rng(seed).standard_normal(
+        (count, dimensions), dtype=np.float32
+    )
+
+
+def _brute_force(
+    keys: List[str],
+    matrix: np.ndarray,
+    queries: np.ndarray,
+    limit: int
+) -> List[List[Tuple[str, float]]]:
+    scores = normalize(queries) @ normalize(matrix).T
+    ranked = np.argsort(-scores, axis=1)[:, :limit]
+    return [
+        [(keys[position], float(row[position])) for position in positions]
+        for row, positions in zip(scores, ranked)
+    ]
+
+
+def ann_recall(
+    sizes: Tuple[int, ...] = (1_000, 10_000, 100_000),
+    dimensions: int = 1536,
+    queries: int = 100,
+    limit: int = 10,
+) -> None:
+    """
+    Compares the recall@k and latency of the HNSW index against brute
+    force.
+    """
+    for size in sizes:
+        keys = [str(i) for i in range(size)]
+        matrix = _random_embeddings(size, dimensions)
+        probes = _random_embeddings(queries, dimensions, seed=1)
+        index = FaissVectorIndex(dimensions, ann_threshold=0)
+        index.add(keys, matrix)
+
+        start = time.perf_counter()
+        approximate = index.search(probes, limit)
+        ann_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        exact = _brute_force(keys, matrix, probes, limit)
+        exact_seconds = time.perf_counter() - start
+
+        recall = recall_at_k(approximate, exact)
+        print(
+            f"n={size:>7} recall@{limit}={recall:.3f} "
+            f"hnsw={ann_seconds / queries * 1e3:.3f}ms/query "
+            f"brute={exact_seconds / queries * 1e3:.3f}ms/query"
+        )
+
+
+def _gmm_baseline(
+    matrix: np.ndarray, probe: np.ndarray, limit: int
+) -> List[Tuple[int, float]]:
+    # Mirrors the GaussianMixture model selection that get_nearest_matches
+    # used to run on every query.
+    from sklearn.mixture import GaussianMixture
+    from sklearn.metrics.pairwise import cosine_similarity
+
+    embeddings = matrix + probe
+    bics = [
+        GaussianMixture(n).fit(embeddings).bic(embeddings)
+        for n in range(1, 21)
+    ]
+    best = GaussianMixture(int(np.argmin(bics)) + 1).fit(embeddings)
+    best.predict(embeddings)
+    similarities = cosine_similarity(probe[None, :], embeddings)[0]
+    ranked = sorted(
+        enumerate(similarities), key=lambda x: x[1], reverse=True
+    )
+    return ranked[:limit]
+
+
+def exact_throughput(
+    sizes: Tuple[int, ...] = (1_000, 10_000, 100_000),
+    dimensions: int = 1536,
+    queries: int = 64,
+    limit: int = 10,
+    gmm_max_size: int = 1_000,
+) -> None:
+    """
+    Reports queries/sec of the vectorised exact search, answering the whole
+    query batch at once, against the former GaussianMixture search path.
+    """
+    for size in sizes:
+        keys = [str(i) for i in range(size)]
+        matrix = _random_embeddings(size, dimensions)
+        probes = _random_embeddings(queries, dimensions, seed=1)
+        index = ExactVectorIndex(dimensions, capacity=size)
+        index.add(keys, matrix)
+
+        start = time.perf_counter()
+        index.search(probes, limit)
+        exact_qps = queries / (time.perf_counter() - start)
+
+        gmm = "skipped"
+        if size <= gmm_max_size:
+            start = time.perf_counter()
+            _gmm_baseline(matrix, probes[0], limit)
+            gmm = f"{1 / (time.perf_counter() - start):.2f} q/s"
+        print(f"n={size:>7} exact={exact_qps:,.0f} q/s gmm={gmm}")
+
+
+def search_cache(
+    users: int = 200,
+    distinct_queries: int = 20,
+    latency: float = 0.05,
+) -> None:
+    """
+    Fires concurrent searches with repeated queries at a fake backend, with
+    and without the coalescing cache, and reports backend calls and
+    latency.
+    """
+    documents = [
+        f"document {i} about topic {i % 50}" for i in range(5_000)
+    ]
+    queries = [f"topic {i % distinct_queries}" for i in range(users)]
+
+    async def run(engine) -> float:
+        start = time.perf_counter()
+        await asyncio.gather(
+            *(engine.search(query, top=10) for query in queries)
+        )
+        return time.perf_counter() - start
+
+    for name, wrap in (("direct", lambda b: b), ("cached", CachedSearch)):
+        backend = FakeSearchBackend(documents, latency=latency)
+        seconds = asyncio.run(run(wrap(backend)))
+        print(
+            f"{name}: backend_calls={backend.calls} "
+            f"wall={seconds * 1e3:.1f}ms"
+        )
+
+
+class _IndexedMemory(CosmosMongoMemory):
+    """
+    A Mongo memory store whose matches are hydrated in memory, so searches
+    cover the micro-batcher and the index but not the database round trip.
+    """
+
+    async def _hydrate(
+        self,
+        collection_name: str,
+        keys: Set[str],
+        with_embeddings: bool,
+    ) -> Dict[str, MemoryRecord]:
+        return {
+            key: MemoryRecord.local_record(key, key, None, None, None)
+            for key in keys
+        }
+
+
+def memory_batching(
+    users: int = 200,
+    size: int = 50_000,
+    dimensions: int = 256,
+    limit: int = 10,
+    latency: float = 0.02,
+) -> None:
+    """
+    Runs the memory search of many concurrent users, each with its own
+    query: embedding the query and searching the collection per user, and
+    through the micro-batchers of the embedding generator and of
+    CosmosMongoMemory, which merge them into batched embeddings and index
+    scans.
+    """
+    index = ExactVectorIndex(dimensions, capacity=size)
+    index.add(
+        [str(i) for i in range(size)], _random_embeddings(size, dimensions)
+    )
+    queries = [f"question {i} about topic {i % 50}" for i in range(users)]
+
+    async def run(window: float) -> Tuple[int, float, float]:
+        backend = HashingEmbeddingBackend(dimensions, latency=latency)
+        generator = CachedEmbeddingGenerator(
+            GPTEmbeddingGenerator(backend), batch_window=window
+        )
+        memory = _IndexedMemory('benchmarks', search_window=window)
+        memory._indexes['documents'] = index
+
+        async def search(query: str) -> List[Tuple[MemoryRecord, float]]:
+            embedding = (await generator.generate_embeddings([query]))[0]
+            return await memory.get_nearest_matches(
+                'documents', embedding, limit, 0.0, False
+            )
+
+        cpu, wall = time.process_time(), time.perf_counter()
+        await asyncio.gather(*(search(query) for query in queries))
+        return (
+            backend.calls,
+            time.process_time() - cpu,
+            time.perf_counter() - wall,
+        )
+
+    for name, window in (("per request", 0.0), ("micro-batched", 0.002)):
+        calls, cpu, wall = asyncio.run(run(window))
+        print(
+            f"{name}: embedding_calls={calls} "
+            f"cpu={cpu / users * 1e3:.2f}ms/query wall={wall * 1e3:.0f}ms"
+        )
+
+
+def hybrid_recall(
+    documents: int = 20_000,
+    queries: int = 200,
+    dimensions: int = 256,
+    limit: int = 10,
+    candidates: int = 50,
+) -> None:
+    """
+    Reports recall@k and latency of the local BM25 index, of the vector
+    index and of their reciprocal rank fusion, on a synthetic corpus where
+    every query is drawn from one known document.
+    """
+    rng = np.random.default_rng(0)
+    vocabulary = [f"term{i}" for i in range(5_000)]
+    weights = 1.0 / np.arange(1, len(vocabulary) + 1)
+    weights /= weights.sum()
+    words = rng.choice(len(vocabulary), size=(documents, 60), p=weights)
+    texts = [" ".join(vocabulary[word] for word in row) for row in words]
+    keys = [str(i) for i in range(documents)]
+    targets = rng.choice(documents, size=queries, replace=False)
+    prompts = [
+        " ".join(vocabulary[word] for word in rng.choice(words[target], 6))
+        for target in targets
+    ]
+
+    backend = HashingEmbeddingBackend(dimensions)
+    start = time.perf_counter()
+    lexical = BM25Index(stem=False)
+    lexical.add(keys, texts)
+    lexical.search(prompts[0], 1)
+    seconds = time.perf_counter() - start
+    print(f"bm25 build: {seconds:.1f}s for {documents} documents")
+    vectors = ExactVectorIndex(dimensions, capacity=documents)
+    vectors.add(keys, asyncio.run(backend.embed(texts)))
+    probes = asyncio.run(backend.embed(prompts))
+
+    def bm25(position: int) -> List[str]:
+        return [
+            key for key, _ in lexical.search(prompts[position], candidates)
+        ]
+
+    def vector(position: int) -> List[str]:
+        found = vectors.search(probes[position][None, :], candidates)
+        return [key for key, _ in found[0]]
+
+    def hybrid(position: int) -> List[str]:
+        fused = reciprocal_rank_fusion(
+            {"lexical": bm25(position), "vector": vector(position)}
+        )
+        return [key for key, _ in fused]
+
+    for name, rank in (
+        ("bm25", bm25),
+        ("vector", vector),
+        ("hybrid", hybrid),
+    ):
+        hits, timings = 0, []
+        for position, target in enumerate(targets):
+            start = time.perf_counter()
+            ranked = rank(position)[:limit]
+            timings.append(time.perf_counter() - start)
+            hits += str(target) in ranked
+        timings.sort()
+        print(
+            f"{name}: recall@{limit}={hits / queries:.3f} "
+            f"p50={timings[len(timings) // 2] * 1e3:.2f}ms"
+        )
+
+
+def _synthetic_corpus(
+    directory: str, megabytes: int, files: int = 4
+) -> None:
+    sentence = (
+        "Retrieval augmented generation grounds the answers of a language "
+        "model on documents fetched at query time. "
+    )
+    block = sentence * ((1 << 20) // len(sentence))
+    for i in range(files):
+        with open(
+            os.path.join(directory, f"{i}.txt"), "w", encoding="utf-8"
+        ) as file:
+            for _ in range(megabytes // files):
+                file.write(block)
+
+
+def chunker_throughput(megabytes: int = 256) -> None:
+    """
+    Reports MB/s and peak RSS of the streaming chunkers. Set
+    BENCHMARK_CORPUS to a directory of .txt files to run it on a real
+    corpus instead of a synthetic one.
+    """
+    with tempfile.TemporaryDirectory() as scratch:
+        corpus = os.environ.get("BENCHMARK_CORPUS")
+        if not corpus:
+            corpus = scratch
+            _synthetic_corpus(corpus, megabytes)
+        reader = FileSystemReader(corpus)
+        total = sum(d.metadata["size"] for d in reader.documents())
+        size = total / (1 << 20)
+        for chunker in (TokenChunker(), SentenceChunker()):
+            start = time.perf_counter()
+            chunks = sum(1 for _ in chunk_corpus(reader, chunker))
+            seconds = time.perf_counter() - start
+            peak = (
+                resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+            )
+            print(
+                f"{type(chunker).__name__}: {size:.0f}MB in "
+                f"{seconds:.1f}s ({size / seconds:.1f} MB/s) "
+                f"chunks={chunks} peak_rss={peak:.0f}MB"
+            )
+
+
+def token_counting(requests: int = 2_000, passages: int = 20) -> None:
+    """
+    Counts the tokens of a request's template and retrieved passages, the
+    way the agents do, with a fresh encoder lookup per call as before and
+    with the shared cached counter.
+    """
+    template = "You are a research assistant. " * 40
+    pool = [
+        f"passage {i} about retrieval augmented generation " * 20
+        for i in range(200)
+    ]
+    workload = [
+        [template]
+        + [pool[(r * 7 + p) % len(pool)] for p in range(passages)]
+        for r in range(requests)
+    ]
+    encoder()
+
+    def uncached(texts: List[str]) -> List[int]:
+        return [
+            len(tiktoken.get_encoding("cl100k_base").encode(t))
+            for t in texts
+        ]
+
+    counter = TokenCounter()
+    for name, count in (
+        ("uncached", uncached),
+        ("cached", counter.count_batch),
+    ):
+        start = time.perf_counter()
+        for texts in workload:
+            count(texts)
+        seconds = time.perf_counter() - start
+        print(f"{name}: {requests / seconds:.0f} requests/s")
+    print(f"cache: {counter.cache_info()}")
+
+
+def agent_setup(requests: int = 500) -> None:
+    """
+    Measures the setup an agent does before its first LLM call: building
+    the kernel, registering the chat service and compiling the prompt
+    template, with a fresh kernel per request and with the warm kernel
+    pool.
+    """
+    schema = ChatSchema(
+        deployment_name="benchmark",
+        api_key="benchmark",
+        endpoint="https://benchmark.openai.azure.com/",
+    )
+    for pooled in (False, True):
+        timings: List[float] = []
+        for _ in range(requests):
+            start = time.perf_counter()
+            agent = SimpleRAG(pooled=pooled)
+            agent._config_service("benchmark", schema=schema)
+            agent._semantic_function(
+                agent.prompt_template, max_tokens=1024
+            )
+            timings.append(time.perf_counter() - start)
+        timings.sort()
+        print(
+            f"{'pooled' if pooled else 'fresh'}: "
+            f"p50={timings[len(timings) // 2] * 1e3:.2f}ms "
+            f"p95={timings[int(len(timings) * 0.95)] * 1e3:.2f}ms"
+        )
+
+
+async def _rate_limited_run(
+    limiter: Optional[DeploymentLimiter],
+    requests: int,
+    clients: int,
+    tokens: int,
+    retries: int = 6,
+) -> None:
+    deployment = SimulatedDeployment(
+        rpm=300, tpm=30_000, burst=1.0, period=6.0, seed=0
+    )
+    pending = list(range(requests))
+    succeeded = failed = 0
+
+    async def unthrottled() -> None:
+        for attempt in range(retries + 1):
+            try:
+                await deployment.complete(tokens)
+                return
+            except Exception as error:  # pylint: disable=broad-except
+                if throttled(error) is None or attempt == retries:
+                    raise
+                await asyncio.sleep(
+                    min(2.0, 0.05 * 2 ** attempt) * (1 + random.random())
+                )
+
+    async def client() -> None:
+        nonlocal succeeded, failed
+        while pending:
+            pending.pop()
+            try:
+                if limiter is None:
+                    await unthrottled()
+                else:
+                    await limiter.run(
+                        lambda: deployment.complete(tokens),
+                        tokens,
+                        retries=retries,
+                    )
+                succeeded += 1
+            except Exception:  # pylint: disable=broad-except
+                failed += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(clients)))
+    seconds = time.perf_counter() - start
+    name = (
+        "unthrottled" if limiter is None else f"limited tpm={limiter.tpm}"
+    )
+    print(
+        f"{name}: goodput={succeeded / seconds:.1f} req/s "
+        f"succeeded={succeeded} failed={failed} calls={deployment.calls} "
+        f"429s={deployment.rejected} in {seconds:.1f}s"
+    )
+
+
+def rate_limits(
+    requests: int = 300, clients: int = 64, tokens: int = 250
+) -> None:
+    """
+    Sends the same burst of requests to a simulated deployment that
+    enforces its quotas with 429s: unthrottled with jittered retries,
+    through a limiter with the deployment's quotas, and through one that
+    overstates them by half and has to learn the real rate from the 429s.
+    """
+    for limiter in (
+        None,
+        DeploymentLimiter(
+            "exact", rpm=300, tpm=30_000, burst=1.0, period=6.0
+        ),
+        DeploymentLimiter(
+            "overstated", rpm=450, tpm=45_000, burst=1.0, period=6.0
+        ),
+    ):
+        asyncio.run(_rate_limited_run(limiter, requests, clients, tokens))
+
+
+class _DiscardingBridge(DataIngestionAPIBridge):
+
+    async def store_data(self, translated_data: Dict[str, List]) -> int:
+        return 0
+
+
+async def _ingest(records: int, page_size: int, latency: float) -> None:
+    mapping = {
+        "client": "customer",
+        "items": "products",
+        "order": "purchase",
+    }
+    async with LocalAPIStub(records=records, latency=latency) as url:
+        for pagination, concurrency in (
+            ("cursor", 1),
+            ("page", 1),
+            ("page", 8),
+        ):
+            api = APIImplementation()
+            bridge = _DiscardingBridge(
+                {"connection_url": url},
+                api,
+                mapping,
+                pagination=pagination,
+                page_size=page_size,
+                concurrency=concurrency,
+            )
+            report = await bridge.ingest_data()
+            await api.close()
+            print(
+                f"{pagination} concurrency={concurrency}: "
+                f"{report.records_per_second:,.0f} records/s "
+                f"pages={report.pages} in {report.seconds:.2f}s"
+            )
+
+
+def ingestion(
+    records: int = 50_000, page_size: int = 1_000, latency: float = 0.05
+) -> None:
+    """
+    Ingests the pages of the local API stub, answering after `latency`
+    seconds, with cursor pagination and with page numbers fetched one and
+    eight at a time. The batches are translated but not written, so the
+    numbers cover fetching, parsing and mapping.
+    """
+    asyncio.run(_ingest(records, page_size, latency))
+
+
+BENCHMARKS: Dict[str, Callable[[], None]] = {
+    "ann": ann_recall,
+    "exact": exact_throughput,
+    "search": search_cache,
+    "batching": memory_batching,
+    "hybrid": hybrid_recall,
+    "chunker": chunker_throughput,
+    "tokens": token_counting,
+    "kernels": agent_setup,
+    "limits": rate_limits,
+    "ingestion": ingestion,
+}
+
+
+def main() -> None:
+    names = sys.argv[1:] or list(BENCHMARKS)
+    for name in names:
+        print(f"# {name}")
+        BENCHMARKS[name]()
+
+
+if __name__ == "__main__":
+    main()
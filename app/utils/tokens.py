@@ -0,0 +1,177 @@
+"""
+Token accounting shared by the agents, the memories and the tools.
+
+The encoder is loaded once per process, on first use, and the token counts
+of recently seen strings are kept in a bounded LRU, since the same
+templates, prompts and passages are counted again on every request.
+"""
+from __future__ import annotations
+
+import os
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Dict, List
+
+import tiktoken
+
+
+ENCODING: str = "cl100k_base"
+PARALLEL_THRESHOLD: int = 64
+WORKERS: int = min(8, os.cpu_count() or 1)
+
+
+@lru_cache(maxsize=None)
+def encoder(name: str = ENCODING) -> tiktoken.Encoding:
+    """
+    Returns the process-wide encoder for the given encoding.
+    """
+    return tiktoken.get_encoding(name)
+
+
+class TokenCounter:
+    """
+    Counts tokens with an LRU of counts in front of the encoder. Large
+    batches go through tiktoken's `encode_ordinary_batch`, which spreads
+    them over its own threads since the encoder releases the GIL.
+    """
+
+    def __init__(
+        self, name: str = ENCODING, maxsize: int = 65_536
+    ) -> None:
+        self.name: str = name
+        self.maxsize: int = maxsize
+        self.hits: int = 0
+        self.misses: int = 0
+        self._counts: OrderedDict[str, int] = OrderedDict()
+        self._lock: threading.Lock = threading.Lock()
+
+    def _get(self, text: str) -> int:
+        count = self._counts.get(text)
+        if count is None:
+            self.misses += 1
+            return -1
+        self._counts.move_to_end(text)
+        self.hits += 1
+        return count
+
+    def _put(self, text: str, count: int) -> None:
+        self._counts[text] = count
+        self._counts.move_to_end(text)
+        while len(self._counts) > self.maxsize:
+            self._counts.popitem(last=False)
+
+    def count(self, text: str) -> int:
+        """
+        Counts the tokens of a text.
+
+        Args:
+            text (str): The text to count.
+
+        Returns:
+            int: The number of tokens.
+        """
+        with self._lock:
+            count = self._get(text)
+        if count < 0:
+            count = len(encoder(self.name).encode_ordinary(text))
+            with self._lock:
+                self._put(text, count)
+        return count
+
+    def count_batch(self, texts: List[str]) -> List[int]:
+        """
+        Counts the tokens of many texts, encoding only the distinct texts
+        missing from the cache.
+
+        Args:
+            texts (List[str]): The texts to count.
+
+        Returns:
+            List[int]: The number of tokens of each text.
+        """
+        with self._lock:
+            cached: Dict[str, int] = {}
+            for text in texts:
+                if text not in cached:
+                    cached[text] = self._get(text)
+        missing = [text for text, count in cached.items() if count < 0]
+        if missing:
+            encoding = encoder(self.name)
+            if len(missing) < PARALLEL_THRESHOLD:
+                counts = [
+                    len(encoding.encode_ordinary(text)) for text in missing
+                ]
+            else:
+                counts = [
+                    len(tokens)
+                    for tokens in encoding.encode_ordinary_batch(
+                        missing, num_threads=WORKERS
+                    )
+                ]
+            with self._lock:
+                for text, count in zip(missing, counts):
+                    cached[text] = count
+                    self._put(text, count)
+        return [cached[text] for text in texts]
+
+    def cache_info(self) -> Dict[str, int]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "size": len(self._counts),
+            "maxsize": self.maxsize,
+        }
+
+
+@lru_cache(maxsize=None)
+def counter(name: str = ENCODING) -> TokenCounter:
+    """
+    Returns the process-wide token counter for the given encoding.
+    """
+    return TokenCounter(
+        name,
+        maxsize=int(os.environ.get("TOKEN_COUNT_CACHE_SIZE", "65536")),
+    )
+
+
+def encode(text: str) -> List[int]:
+    """
+    Encodes a text into tokens. Special tokens in the text are encoded as
+    ordinary text instead of raising.
+
+    Args:
+        text (str): The text to encode.
+
+    Returns:
+        List[int]: The tokens of the text.
+    """
+    return encoder().encode_ordinary(text)
+
+
+def count_tokens(text: str) -> int:
+    """
+    Counts the number of tokens in the given text.
+
+    Args:
+        text (str): The text to count tokens for.
+
+    Returns:
+        int: The number of tokens in the text.
+    """
+    return counter().count(text)
+
+
+def count_tokens_batch(texts: List[str]) -> List[int]:
+    """
+    Counts the number of tokens in each of the given texts. This encodes on
+    the calling thread, so async code counting large batches should call it
+    through `asyncio.to_thread`.
+
+    Args:
+        texts (List[str]): The texts to count tokens for.
+
+    Returns:
+        List[int]: The number of tokens in each text.
+    """
+    return counter().count_batch(texts)
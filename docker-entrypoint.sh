@@ -7,5 +7,11 @@ set -e
 
 # You can put other setup logic here
 
+# fetch the punkt models into the user's nltk_data if the image lacks them
+if ! python -c "import nltk; nltk.data.find('tokenizers/punkt')" 2>/dev/null; then
+    python -m nltk.downloader -q punkt \
+        || echo "Could not download the punkt models" >&2
+fi
+
 # Evaluating passed command:
 exec "$@"
@@ -0,0 +1,59 @@
+import asyncio
+from typing import List, Tuple
+
+import pytest
+
+from app.tools.batching import MicroBatcher
+
+
+@pytest.mark.asyncio
+async def test_concurrent_items_share_one_call_per_group() -> None:
+    calls: List[Tuple[str, List[int]]] = []
+
+    async def double(group: str, items: List[int]) -> List[int]:
+        calls.append((group, items))
+        return [2 * item for item in items]
+
+    batcher = MicroBatcher(double, window=0.01, max_batch=3)
+    results = await asyncio.gather(
+        *(batcher.submit('a', item) for item in range(4)),
+        batcher.submit('b', 10),
+    )
+
+    assert results == [0, 2, 4, 6, 20]
+    assert sorted(calls) == [('a', [0, 1, 2]), ('a', [3]), ('b', [10])]
+    assert batcher.stats.as_dict()['mean_batch'] == 5 / 3
+
+
+@pytest.mark.asyncio
+async def test_short_results_fail_every_caller() -> None:
+
+    async def truncate(group: None, items: List[int]) -> List[int]:
+        return items[:-1]
+
+    batcher = MicroBatcher(truncate, window=0.01)
+    results = await asyncio.wait_for(
+        asyncio.gather(
+            *(batcher.submit(None, item) for item in range(3)),
+            return_exceptions=True,
+        ),
+        timeout=1,
+    )
+
+    assert all(isinstance(result, ValueError) for result in results)
+    assert batcher.stats.failures == 1
+
+
+@pytest.mark.asyncio
+async def test_handler_errors_reach_every_caller() -> None:
+
+    async def fail(group: None, items: List[int]) -> List[int]:
+        raise RuntimeError('backend down')
+
+    batcher = MicroBatcher(fail, window=0.01)
+    results = await asyncio.gather(
+        batcher.submit(None, 1), batcher.submit(None, 2),
+        return_exceptions=True,
+    )
+
+    assert [str(result) for result in results] == ['backend down'] * 2
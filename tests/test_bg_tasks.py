@@ -0,0 +1,53 @@
+import gzip
+import asyncio
+import logging
+
+import pytest
+
+from app.bg_tasks import FileSystemLogSink, LogShipper, log_shipper
+
+
+def shipped(directory) -> list:
+    lines = []
+    for path in directory.rglob('*.jsonl.gz'):
+        lines += gzip.decompress(path.read_bytes()).decode().splitlines()
+    return sorted(lines)
+
+
+def test_shipper_follows_the_running_event_loop(tmp_path) -> None:
+    shipper = LogShipper(
+        FileSystemLogSink(str(tmp_path)),
+        flush_interval=60,
+        max_records=100,
+    )
+
+    async def submit(first: int) -> None:
+        for index in range(first, first + 3):
+            shipper.submit({'index': index})
+
+    asyncio.run(submit(0))
+    asyncio.run(submit(3))
+
+    async def close() -> None:
+        await shipper.close()
+
+    asyncio.run(close())
+    assert shipped(tmp_path) == sorted(
+        f'{{"index": {index}}}' for index in range(6)
+    )
+    assert shipper.stats.shipped == 6
+
+
+def test_local_fallback_is_logged(
+    monkeypatch: pytest.MonkeyPatch, caplog: pytest.LogCaptureFixture
+) -> None:
+    monkeypatch.delenv('LOG_SINK_DIR', raising=False)
+    monkeypatch.delenv('BLOB_STORAGE_CONNECTION_STRING', raising=False)
+    log_shipper.cache_clear()
+
+    with caplog.at_level(logging.WARNING, logger='app.bg_tasks'):
+        shipper = log_shipper()
+    log_shipper.cache_clear()
+
+    assert isinstance(shipper.sink, FileSystemLogSink)
+    assert 'BLOB_STORAGE_CONNECTION_STRING is not set' in caplog.text
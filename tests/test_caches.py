@@ -0,0 +1,142 @@
+import numpy as np
+import pytest
+
+from app.agents import MemoryAgent
+from app.tools.caches import (
+    CachedEmbeddingGenerator,
+    CompletionCache,
+    EmbeddingDiskStore,
+)
+from app.tools.embeddings import (
+    GPTEmbeddingGenerator,
+    HashingEmbeddingBackend,
+)
+from app.tools.memories import CosmosMongoMemory
+
+
+def completion_cache(maxsize: int = 8) -> CompletionCache:
+    return CompletionCache(
+        maxsize=maxsize,
+        threshold=0.7,
+        generator=GPTEmbeddingGenerator(HashingEmbeddingBackend(64)),
+    )
+
+
+async def cached(cache: CompletionCache, scope: str, prompt: str) -> None:
+    probe = await cache.probe(scope, prompt)
+    cache.put(probe, {'response': f"{scope}: {prompt}"})
+
+
+@pytest.mark.asyncio
+async def test_semantic_hits_stay_within_their_scope() -> None:
+    cache = completion_cache()
+    await cached(cache, 'first', 'what is the transformer architecture')
+
+    question = 'what is a transformer architecture'
+    spaced = 'What is the  transformer architecture'
+    same = await cache.probe('first', spaced)
+    similar = await cache.probe('first', question)
+    other = await cache.probe('second', question)
+
+    assert same.tier == 'exact'
+    assert similar.tier == 'semantic'
+    assert similar.payload == {
+        'response': 'first: what is the transformer architecture'
+    }
+    assert other.payload is None
+
+
+@pytest.mark.asyncio
+async def test_semantic_tier_is_bounded_across_scopes() -> None:
+    cache = completion_cache(maxsize=4)
+    for scope in range(100):
+        await cached(cache, f"max_tokens={scope}", 'explain attention')
+
+    assert cache._semantic.matrix.shape == (4, 64)
+    newest = await cache.probe('max_tokens=99', 'explain attention')
+    oldest = await cache.probe('max_tokens=0', 'explain attention')
+    assert newest.payload
+    assert not oldest.payload
+
+
+class HistoryAgent(MemoryAgent):
+
+    def _config_service(self, chat_name: str, *args, **kwargs) -> None:
+        pass
+
+    async def prompt(self, prompt: str, **kwargs):
+        raise NotImplementedError
+
+
+async def answer(
+    cache: CompletionCache, memory: CosmosMongoMemory, tenant: str
+) -> str:
+    agent = HistoryAgent()
+    agent.completions = cache
+    agent._chat_history(memory)
+    probe = await agent._probe_cache('chat', 'what did I ask before?', {})
+    if probe.payload is None:
+        agent.response.update({
+            'response': f"history of {tenant}",
+            'completion_tokens': 2,
+        })
+        agent._fill_cache(probe)
+    return agent.response['response']
+
+
+@pytest.mark.asyncio
+async def test_agents_keep_the_answers_of_each_store_apart() -> None:
+    cache = completion_cache()
+    first = CosmosMongoMemory('ragMemory', 'mongodb://tenant-a:27017')
+    second = CosmosMongoMemory('ragMemory', 'mongodb://tenant-b:27017')
+    other = CosmosMongoMemory('otherMemory', 'mongodb://tenant-a:27017')
+
+    answers = [
+        await answer(cache, first, 'a'),
+        await answer(cache, second, 'b'),
+        await answer(cache, other, 'c'),
+    ]
+    again = await answer(
+        cache,
+        CosmosMongoMemory('ragMemory', 'mongodb://tenant-a:27017'),
+        'd',
+    )
+
+    assert answers == ['history of a', 'history of b', 'history of c']
+    assert again == 'history of a'
+    assert cache.stats.misses == 3
+
+
+def test_disk_store_appends_batches_past_its_capacity(tmp_path) -> None:
+    vectors = np.arange(15, dtype=np.float32).reshape(5, 3)
+    store = EmbeddingDiskStore(str(tmp_path), initial_rows=2)
+    store.put_many(['a', 'b', 'c'], vectors[:3])
+    store.put_many(['c', 'd', 'e'], vectors[2:])
+
+    reopened = EmbeddingDiskStore(str(tmp_path), initial_rows=2)
+
+    assert len(reopened) == 5
+    assert (tmp_path / 'keys.txt').read_text() == 'a\nb\nc\nd\ne\n'
+    assert all(
+        np.array_equal(reopened.get(key), vector)
+        for key, vector in zip('abcde', vectors)
+    )
+
+
+@pytest.mark.asyncio
+async def test_generated_embeddings_are_served_from_disk(tmp_path) -> None:
+    texts = ['attention', 'recurrence', 'attention', 'convolution']
+
+    def generator() -> CachedEmbeddingGenerator:
+        return CachedEmbeddingGenerator(
+            GPTEmbeddingGenerator(HashingEmbeddingBackend(64)),
+            disk_dir=str(tmp_path),
+        )
+
+    generated = await generator().generate_embeddings(texts)
+    restarted = generator()
+    served = await restarted.generate_embeddings(texts)
+
+    assert np.array_equal(generated, served)
+    assert len(restarted.disk) == 3
+    assert restarted.stats.disk_hits == 3
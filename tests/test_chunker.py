@@ -0,0 +1,152 @@
+import time
+import asyncio
+from typing import Dict, Iterator, List, Sequence
+
+import pytest
+from semantic_kernel.memory.memory_record import MemoryRecord
+
+from app.patterns.chunker import (
+    Document,
+    FileSystemReader,
+    IngestionOrchestrator,
+    SentenceChunker,
+    TokenChunker,
+)
+from app.tools.embeddings import (
+    GPTEmbeddingGenerator,
+    HashingEmbeddingBackend,
+)
+from app.utils.tokens import encoder
+
+
+DOCUMENT = Document(id='doc', source='memory')
+
+
+def blocks(text: str, size: int) -> Iterator[str]:
+    for start in range(0, len(text), size):
+        yield text[start:start + size]
+
+
+def sentences(count: int) -> str:
+    return ' '.join(
+        f"Sentence number {i} talks about attention heads."
+        for i in range(count)
+    )
+
+
+@pytest.mark.parametrize('size', [7, 64, 1 << 20])
+def test_token_chunker_windows_do_not_depend_on_blocks(size: int) -> None:
+    text = sentences(200)
+    chunker = TokenChunker(max_tokens=50, overlap=10)
+
+    chunks = list(chunker.chunk(DOCUMENT, blocks(text, size)))
+    tokens = encoder().encode_ordinary(text)
+
+    assert [chunk.index for chunk in chunks] == list(range(len(chunks)))
+    assert all(chunk.token_count <= 50 for chunk in chunks)
+    assert chunks[0].text == encoder().decode(tokens[:50])
+    assert chunks[1].text == encoder().decode(tokens[40:90])
+    assert chunks == list(chunker.chunk(DOCUMENT, [text]))
+
+
+def test_sentence_chunker_packs_whole_sentences() -> None:
+    chunker = SentenceChunker(max_tokens=40, overlap=12)
+
+    chunks = list(chunker.chunk(DOCUMENT, blocks(sentences(30), 100)))
+
+    assert len(chunks) > 1
+    assert all(chunk.token_count <= 40 for chunk in chunks)
+    assert all(
+        chunk.text.startswith('Sentence') and chunk.text.endswith('.')
+        for chunk in chunks
+    )
+    first: List[str] = chunks[0].text.split('. ')
+    assert chunks[1].text.startswith(first[-1].rstrip('.'))
+
+
+def test_sentence_chunker_bounds_text_without_boundaries() -> None:
+    text = 'x' * 400_000
+    chunker = SentenceChunker(max_tokens=64, overlap=0)
+
+    started = time.perf_counter()
+    chunks = list(chunker.chunk(DOCUMENT, blocks(text, 1_000)))
+
+    assert time.perf_counter() - started < 10
+    assert all(chunk.token_count <= 64 for chunk in chunks)
+    assert ''.join(chunk.text.replace(' ', '') for chunk in chunks) == text
+
+
+class DictMemory:
+
+    def __init__(self) -> None:
+        self.rows: Dict[str, MemoryRecord] = {}
+        self.writes: List[int] = []
+
+    async def does_collection_exist(self, collection_name: str) -> bool:
+        return True
+
+    async def upsert_batch(
+        self, collection_name: str, records: Sequence[MemoryRecord]
+    ) -> List[str]:
+        self.rows.update({record._key: record for record in records})
+        self.writes.append(len(records))
+        return [record._key for record in records]
+
+
+@pytest.mark.asyncio
+async def test_orchestrator_streams_chunks_in_batches(tmp_path) -> None:
+    for name, count in (('big', 400), ('small', 3), ('empty', 0)):
+        (tmp_path / f"{name}.txt").write_text(sentences(count))
+    checkpoint = tmp_path / 'checkpoint'
+    memory = DictMemory()
+
+    def orchestrator() -> IngestionOrchestrator:
+        return IngestionOrchestrator(
+            FileSystemReader(str(tmp_path), block_size=256),
+            memory,
+            'docs',
+            GPTEmbeddingGenerator(HashingEmbeddingBackend(16)),
+            chunker=TokenChunker(max_tokens=32, overlap=0),
+            checkpoint_path=str(checkpoint),
+            processes=2,
+            batch_size=10,
+            queue_size=2,
+        )
+
+    report = await orchestrator().run()
+    again = await orchestrator().run()
+
+    assert (report.documents, report.chunks) == (3, len(memory.rows))
+    assert max(memory.writes) == 10
+    assert {key.split(':')[0] for key in memory.rows} == {
+        'big.txt', 'small.txt'
+    }
+    assert sorted(checkpoint.read_text().split()) == [
+        'big.txt', 'empty.txt', 'small.txt'
+    ]
+    assert (again.documents, again.skipped) == (0, 3)
+
+
+class BrokenReader(FileSystemReader):
+
+    def read(self, document: Document) -> Iterator[str]:
+        yield sentences(100)
+        raise OSError(f"cannot read {document.id}")
+
+
+@pytest.mark.asyncio
+async def test_orchestrator_fails_with_its_workers(tmp_path) -> None:
+    (tmp_path / 'broken.txt').write_text('unused')
+    orchestrator = IngestionOrchestrator(
+        BrokenReader(str(tmp_path)),
+        DictMemory(),
+        'docs',
+        GPTEmbeddingGenerator(HashingEmbeddingBackend(16)),
+        chunker=TokenChunker(max_tokens=32, overlap=0),
+        processes=1,
+        batch_size=10,
+    )
+
+    with pytest.raises(OSError, match='cannot read broken.txt'):
+        await asyncio.wait_for(orchestrator.run(), timeout=60)
+    assert orchestrator.report.documents == 0
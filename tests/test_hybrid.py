@@ -0,0 +1,126 @@
+import weakref
+from typing import AsyncIterator, Dict, List, Sequence
+
+import pytest
+from semantic_kernel.memory.memory_record import MemoryRecord
+
+from app.tools.hybrid import (
+    BM25Index,
+    HybridRetriever,
+    reciprocal_rank_fusion,
+)
+from app.tools.memories import CollectionVersions
+
+
+def test_bm25_ranks_rare_terms_first() -> None:
+    index = BM25Index()
+    index.add(
+        ['a', 'b', 'c'],
+        [
+            'the transformer uses attention',
+            'the recurrent network uses gates',
+            'the network of networks',
+        ],
+    )
+
+    ranked = index.search('attention networks', 3)
+
+    assert [key for key, _ in ranked] == ['a', 'c', 'b']
+    assert ranked[0][1] > ranked[1][1] > ranked[2][1] > 0
+
+
+def test_bm25_replaces_and_removes_documents() -> None:
+    index = BM25Index()
+    index.add(['a', 'b'], ['attention heads', 'recurrent gates'])
+    assert index.search('attention', 5)[0][0] == 'a'
+
+    index.add(['a'], ['convolution kernels'])
+    index.remove(['b'])
+
+    assert index.search('attention', 5) == []
+    assert index.search('gates', 5) == []
+    assert index.search('kernel', 5)[0][0] == 'a'
+    assert len(index) == 1
+
+
+def test_reciprocal_rank_fusion_rewards_agreement() -> None:
+    fused = reciprocal_rank_fusion(
+        {'lexical': ['a', 'b'], 'vector': ['b', 'c']}, k=1
+    )
+
+    assert [key for key, _ in fused] == ['b', 'a', 'c']
+
+
+class ListMemory(CollectionVersions):
+
+    def __init__(self) -> None:
+        self._versions: Dict[str, int] = {}
+        self._watchers: weakref.WeakSet = weakref.WeakSet()
+        self.rows: Dict[str, MemoryRecord] = {}
+        self.listed: int = 0
+
+    @staticmethod
+    def record(key: str, text: str) -> MemoryRecord:
+        return MemoryRecord.local_record(key, text, None, None, None)
+
+    async def upsert_batch(
+        self, collection_name: str, records: Sequence[MemoryRecord]
+    ) -> None:
+        self.rows.update({record._id: record for record in records})
+        await self._written(collection_name, records)
+
+    async def remove_batch(
+        self, collection_name: str, keys: List[str]
+    ) -> None:
+        for key in keys:
+            self.rows.pop(key)
+        await self._written(collection_name, removed=keys)
+
+    async def records(
+        self, collection_name: str
+    ) -> AsyncIterator[MemoryRecord]:
+        self.listed += 1
+        for record in self.rows.values():
+            yield record
+
+    async def get_nearest_matches(self, **kwargs) -> List:
+        return []
+
+
+@pytest.mark.asyncio
+async def test_retriever_follows_the_store_writes() -> None:
+    store = ListMemory()
+    await store.upsert_batch('docs', [
+        store.record('a', 'attention heads'),
+        store.record('b', 'recurrent gates'),
+    ])
+    retriever = HybridRetriever(store, 'docs', generator=object())
+
+    assert await retriever._lexical('gates')
+    await store.upsert_batch(
+        'docs', [store.record('c', 'attention masks')]
+    )
+    await store.remove_batch('docs', ['b'])
+    await store.upsert_batch('other', [store.record('d', 'attention')])
+
+    ranked = await retriever._lexical('attention')
+    assert {key for key, _ in ranked} == {'a', 'c'}
+    assert await retriever._lexical('gates') == []
+    assert store.listed == 1
+
+
+@pytest.mark.asyncio
+async def test_retriever_rebuilds_after_missed_writes() -> None:
+    store = ListMemory()
+    await store.upsert_batch(
+        'docs', [store.record('a', 'attention heads')]
+    )
+    retriever = HybridRetriever(
+        store, 'docs', generator=object(), refresh=0
+    )
+
+    await retriever._lexical('attention')
+    store.rows['b'] = store.record('b', 'recurrent gates')
+
+    assert [key for key, _ in await retriever._lexical('gates')] == ['b']
+    assert store.listed == 2
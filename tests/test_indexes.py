@@ -0,0 +1,188 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, AsyncIterator, Dict, List, Type
+
+import faiss
+import numpy as np
+import pytest
+from semantic_kernel.memory.memory_record import MemoryRecord
+
+from app.tools.indexes import (
+    ExactVectorIndex,
+    FaissVectorIndex,
+    VectorIndex,
+)
+from app.tools.memories import CosmosMongoMemory
+
+
+def embeddings(size: int, seed: int = 0) -> np.ndarray:
+    return np.random.default_rng(seed).normal(size=(size, 16))
+
+
+def approximate(dimensions: int) -> FaissVectorIndex:
+    return FaissVectorIndex(dimensions, ann_threshold=8)
+
+
+@pytest.mark.parametrize(
+    'factory', [ExactVectorIndex, FaissVectorIndex, approximate]
+)
+def test_overwrites_and_removals_update_the_index(
+    factory: Type[VectorIndex],
+) -> None:
+    index = factory(16)
+    vectors = embeddings(20)
+    index.add([str(i) for i in range(20)], vectors)
+
+    index.add(['3'], vectors[[7]])
+    index.remove(['7', 'missing'])
+
+    assert len(index) == 19
+    assert '7' not in index
+    [[(key, score)]] = index.search(vectors[[7]], 1)
+    assert (key, round(score, 4)) == ('3', 1.0)
+    hits = index.search(vectors, 20)
+    assert all(len(row) == 19 for row in hits)
+    assert all('7' not in dict(row) for row in hits)
+
+
+def test_tombstones_are_compacted_and_persisted(tmp_path) -> None:
+    index = approximate(16)
+    vectors = embeddings(40)
+    keys = [str(i) for i in range(40)]
+    index.add(keys, vectors)
+    assert index.is_approximate
+
+    index.remove(keys[:5])
+    assert index._index.ntotal == 40
+    index.remove(keys[5:10])
+    assert index._index.ntotal == 30
+
+    index.add(['10'], vectors[[0]])
+    path = str(tmp_path / 'index.faiss')
+    index.save(path)
+    loaded = FaissVectorIndex.load(path, ann_threshold=8)
+
+    assert len(loaded) == 30
+    [[(key, _)]] = loaded.search(vectors[[0]], 1)
+    assert key == '10'
+    assert dict(loaded.search(vectors[[10]], 30)[0]).get('10', 0) < 0.99
+
+
+def test_failed_saves_keep_the_saved_index(tmp_path, monkeypatch) -> None:
+    index = approximate(16)
+    index.add(['0', '1'], embeddings(2))
+    path = str(tmp_path / 'index.faiss')
+    index.save(path)
+    index.add(['2'], embeddings(1, seed=1))
+
+    def fail(*args) -> None:
+        raise OSError('disk full')
+
+    monkeypatch.setattr(faiss, 'write_index', fail)
+    with pytest.raises(OSError):
+        index.save(path)
+
+    assert sorted(file.name for file in tmp_path.iterdir()) == [
+        'index.faiss', 'index.faiss.keys'
+    ]
+    assert len(FaissVectorIndex.load(path)) == 2
+
+
+def test_concurrent_writes_and_searches() -> None:
+    index = approximate(16)
+    vectors = embeddings(400)
+
+    def write(start: int) -> None:
+        keys = [str(i % 50) for i in range(start, start + 10)]
+        index.add(keys, vectors[start:start + 10])
+
+    def read(start: int) -> None:
+        for row in index.search(vectors[start:start + 10], 5):
+            assert all(key is not None for key, _ in row)
+
+    with ThreadPoolExecutor(8) as pool:
+        list(pool.map(write, range(0, 400, 10)))
+        list(pool.map(read, range(0, 400, 10)))
+        list(pool.map(
+            lambda start: (write(start), read(start)), range(0, 400, 10)
+        ))
+
+    assert len(index) == 50
+
+
+class ListCollection:
+
+    def __init__(self, documents: List[Dict[str, Any]]) -> None:
+        self.documents: List[Dict[str, Any]] = documents
+
+    async def find(self, *args) -> AsyncIterator[Dict[str, Any]]:
+        for document in list(self.documents):
+            yield document
+
+    async def count_documents(self, *args) -> int:
+        return len(self.documents)
+
+
+class ListDatabase(dict):
+    name: str = 'ragMemory'
+
+
+def documents(vectors: np.ndarray, start: int = 0) -> List[Dict[str, Any]]:
+    return [
+        {'key': str(start + i), 'embedding': vector.tolist()}
+        for i, vector in enumerate(vectors)
+    ]
+
+
+class ListMemory(CosmosMongoMemory):
+
+    database: ListDatabase = ListDatabase()
+
+
+def indexed_memory(
+    database: ListDatabase, directory: str, **kwargs
+) -> CosmosMongoMemory:
+    memory = ListMemory(
+        'ragMemory', index_dir=directory, search_mode='ann', **kwargs
+    )
+    memory.database = database
+    return memory
+
+
+@pytest.mark.asyncio
+async def test_indexes_follow_writes_of_other_processes(tmp_path) -> None:
+    vectors = embeddings(30)
+    database = ListDatabase(docs=ListCollection(documents(vectors[:20])))
+    stale = indexed_memory(database, str(tmp_path))
+    fresh = indexed_memory(database, str(tmp_path), index_refresh=0.0)
+    assert len(await stale._vector_index('docs')) == 20
+    assert len(await fresh._vector_index('docs')) == 20
+
+    database['docs'].documents += documents(vectors[20:], 20)
+    loaded = indexed_memory(database, str(tmp_path))
+
+    assert len(await loaded._vector_index('docs')) == 30
+    assert len(await stale._vector_index('docs')) == 20
+    assert len(await fresh._vector_index('docs')) == 30
+
+
+@pytest.mark.asyncio
+async def test_index_writes_are_saved_in_batches(tmp_path) -> None:
+    vectors = embeddings(30)
+    database = ListDatabase(docs=ListCollection(documents(vectors[:20])))
+    memory = indexed_memory(database, str(tmp_path))
+    await memory._vector_index('docs')
+    path = memory._index_path('docs')
+
+    for key in range(20, 30):
+        await memory._index_records('docs', [
+            MemoryRecord.local_record(
+                str(key), '', None, None, vectors[key]
+            )
+        ])
+    await memory._unindex_keys('docs', ['0'])
+    saved = FaissVectorIndex.load(path)
+    await memory.close()
+
+    assert len(saved) == 20
+    assert len(FaissVectorIndex.load(path)) == 29
+    assert not memory._unsaved
@@ -0,0 +1,108 @@
+import json
+from typing import Any, AsyncIterator, Dict, List
+
+import pytest
+
+from app.settings.api import (
+    APIImplementation,
+    DataIngestionAPIBridge,
+    LocalAPIStub,
+    stream_records,
+)
+
+
+async def chunked(body: bytes, size: int) -> AsyncIterator[bytes]:
+    for start in range(0, len(body), size):
+        yield body[start:start + size]
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize('size', [1, 3, 1 << 16])
+async def test_stream_records_across_chunk_boundaries(size: int) -> None:
+    records = [
+        {'name': 'Zoë', 'total': 12345.5},
+        {'items': [1, {'a': None}]},
+    ]
+    body = json.dumps(
+        {'total_pages': 2, 'data': records, 'next_cursor': 'c2'},
+        ensure_ascii=False,
+    ).encode('utf-8')
+    meta: Dict[str, Any] = {}
+
+    streamed = [
+        record async for record in stream_records(
+            chunked(body, size), 'data', meta
+        )
+    ]
+
+    assert streamed == records
+    assert meta == {'total_pages': 2, 'next_cursor': 'c2'}
+
+
+@pytest.mark.asyncio
+async def test_stream_records_of_a_bare_array() -> None:
+    meta: Dict[str, Any] = {}
+    body = b' [ {"a": 1} , {"a": 2} ] '
+
+    streamed = [
+        record async for record in stream_records(
+            chunked(body, 2), 'data', meta
+        )
+    ]
+
+    assert streamed == [{'a': 1}, {'a': 2}]
+    assert not meta
+
+
+class CapturingBridge(DataIngestionAPIBridge):
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.stored: List[Dict[str, List[Any]]] = []
+
+    async def store_data(
+        self, translated_data: Dict[str, List[Any]]
+    ) -> int:
+        self.stored.append(translated_data)
+        return 0
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize('pagination', ['cursor', 'page'])
+async def test_nested_records_round_trip(pagination: str) -> None:
+    api = APIImplementation()
+    async with LocalAPIStub(records=250) as url:
+        bridge = CapturingBridge(
+            {'connection_url': url},
+            api,
+            {
+                'client': 'customer',
+                'items': 'products',
+                'order': 'purchase',
+                'coupon': 'discount',
+            },
+            pagination=pagination,
+            page_size=100,
+            batch_size=40,
+        )
+        report = await bridge.ingest_data()
+    await api.close()
+
+    purchases = sorted(
+        (
+            dict(zip(batch, row))
+            for batch in bridge.stored
+            for row in zip(*batch.values())
+        ),
+        key=lambda row: int(row['purchase']['id'][1:]),
+    )
+    assert report.records == 250
+    assert purchases == [
+        {
+            'customer': record['client'],
+            'products': record['items'],
+            'purchase': record['order'],
+            'discount': None,
+        }
+        for record in map(LocalAPIStub.record, range(250))
+    ]
@@ -0,0 +1,67 @@
+import asyncio
+from typing import List
+
+import pytest
+
+from app.tools.limits import DeploymentLimiter, SimulatedDeployment
+
+
+def limiter(rpm: int = 10, tpm: int = 1_000_000) -> DeploymentLimiter:
+    return DeploymentLimiter(
+        'test', rpm=rpm, tpm=tpm, burst=0.1, period=1.0
+    )
+
+
+@pytest.mark.asyncio
+async def test_higher_priority_callers_are_admitted_first() -> None:
+    deployment = limiter()
+    await deployment.acquire(1)
+    admitted: List[str] = []
+
+    async def call(name: str, priority: int) -> None:
+        await deployment.acquire(1, priority=priority)
+        admitted.append(name)
+
+    await asyncio.gather(
+        call('batch', 2), call('background', 1), call('chat', 0)
+    )
+
+    assert admitted == ['chat', 'background', 'batch']
+    assert deployment.stats.admitted == 4
+
+
+@pytest.mark.asyncio
+async def test_callers_give_up_at_their_deadline() -> None:
+    deployment = limiter()
+    await deployment.acquire(1)
+
+    with pytest.raises(asyncio.TimeoutError):
+        await deployment.acquire(1, timeout=0.02)
+    with pytest.raises(asyncio.TimeoutError):
+        await deployment.run(lambda: asyncio.sleep(0), 1, deadline=0.02)
+
+    assert deployment.stats.expired == 2
+    assert deployment.queued == 0
+    await deployment.acquire(1, timeout=1.0)
+
+
+@pytest.mark.asyncio
+async def test_429s_cut_the_rate_until_requests_succeed() -> None:
+    deployment = SimulatedDeployment(
+        rpm=10, tpm=1_000_000, burst=0.1, period=1.0, latency=0.0, rtt=0.0
+    )
+    client = limiter(rpm=100, tpm=10_000_000)
+
+    await client.run(lambda: deployment.complete(10), 10)
+    await client.run(lambda: deployment.complete(10), 10)
+
+    assert deployment.rejected == client.stats.throttled == 1
+    assert client.stats.retried == 1
+    assert client.scale == pytest.approx(0.52)
+
+    deployment.rpm = 1_000
+    for _ in range(30):
+        await client.run(lambda: deployment.complete(10), 10)
+
+    assert deployment.rejected == 1
+    assert client.scale == 1.0
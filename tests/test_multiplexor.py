@@ -0,0 +1,63 @@
+from typing import Any, Dict, List
+
+import pytest
+from fastapi.testclient import TestClient
+
+import app.main as main
+from app.patterns.multiplexor import (
+    FakeCompletionBackend,
+    Multiplexor,
+    orchestrators,
+)
+from app.patterns.simple import simple
+from app.tools.search import CachedSearch, FakeSearchBackend
+
+
+@pytest.fixture
+def client(monkeypatch: pytest.MonkeyPatch) -> TestClient:
+    backends = [
+        FakeCompletionBackend("fast", median=0.01, sigma=0.0, seed=1),
+        FakeCompletionBackend("slow", median=0.5, sigma=0.0, seed=2),
+    ]
+    search = CachedSearch(
+        FakeSearchBackend(["the transformer architecture uses attention"])
+    )
+    shipped: List[Dict[str, Any]] = []
+
+    async def load_data(response: Dict[str, Any]) -> None:
+        shipped.append(response)
+
+    monkeypatch.setattr(
+        orchestrators, "multiplexor", lambda: Multiplexor(backends)
+    )
+    monkeypatch.setattr(simple, "search_engine", lambda: search)
+    monkeypatch.setattr(main, "load_data", load_data)
+    test_client = TestClient(main.app)
+    test_client.shipped = shipped
+    return test_client
+
+
+def test_multiplexor_rag_answers_from_the_fastest_deployment(
+    client: TestClient,
+) -> None:
+    response = client.post(
+        "/multiplexor-rag/",
+        json={"prompt": "explain the transformer", "max_tokens": 64},
+    )
+
+    assert response.status_code == 200
+    body = response.json()
+    assert body["deployment"] == "fast"
+    assert body["response"].startswith("fast answer to:")
+    assert body["completion_tokens"] > 0
+    assert client.shipped == [body]
+
+
+def test_multiplexor_rag_streams_the_answer(client: TestClient) -> None:
+    response = client.post(
+        "/multiplexor-rag/",
+        json={"prompt": "explain the transformer", "stream": True},
+    )
+
+    assert response.status_code == 200
+    assert "fast answer to:" in response.text
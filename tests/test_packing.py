@@ -0,0 +1,89 @@
+from typing import Dict, List
+
+import pytest
+
+from app.tools.packing import ContextPacker
+from app.utils.tokens import count_tokens
+
+
+def words(prefix: str, size: int) -> str:
+    return ' '.join(f"{prefix}{i}" for i in range(size))
+
+
+def passages() -> Dict[str, List[str]]:
+    return {
+        'docs': [words('apple', 60)],
+        'web': [words('banana', 40)],
+        'notes': [words('cherry', 40)],
+    }
+
+
+def tokens(text: str) -> int:
+    return count_tokens(text) + count_tokens('\n')
+
+
+@pytest.mark.parametrize(
+    'strategy, kept',
+    [('greedy', {'docs'}), ('knapsack', {'web', 'notes'})],
+)
+def test_knapsack_beats_greedy_when_the_best_passage_is_large(
+    strategy: str, kept: set
+) -> None:
+    texts = passages()
+    budget = tokens(texts['web'][0]) + tokens(texts['notes'][0])
+    packer = ContextPacker(
+        budget, strategy, weights={'web': 0.8, 'notes': 0.8}
+    )
+
+    packed = packer.pack(texts)
+
+    assert {
+        section for section, text in packed.sections.items() if text
+    } == kept
+    assert packed.tokens <= budget
+    assert {
+        section: (report.kept, report.dropped, report.tokens)
+        for section, report in packed.report.items()
+    } == {
+        section: (
+            (1, 0, tokens(texts[section][0]))
+            if section in kept else (0, 1, 0)
+        )
+        for section in texts
+    }
+
+
+def test_duplicates_are_kept_once_at_their_best_rank() -> None:
+    passage = words('transformer', 30)
+    packer = ContextPacker(10_000, weights={'web': 0.5})
+
+    packed = packer.pack({
+        'docs': [passage, words('attention', 10)],
+        'web': [
+            f"  {passage.upper()} ",
+            passage.replace('transformer29', 'recurrent'),
+            words('convolution', 10),
+        ],
+    })
+
+    assert packed.report['docs'].duplicates == 0
+    assert packed.report['web'].duplicates == 2
+    assert packed.sections == {
+        'docs': f"{passage}\n{words('attention', 10)}",
+        'web': words('convolution', 10),
+    }
+
+
+def test_budgets_are_capped_by_the_packer() -> None:
+    texts = passages()
+    packer = ContextPacker(100)
+
+    assert packer.pack(texts, budget=1_000_000).budget == 100
+    assert packer.pack(texts, budget=-5).tokens == 0
+    report = packer.pack(texts).as_dict()
+    assert report['budget'] == 100
+    assert 0 < report['tokens'] <= 100
+    assert sum(
+        section['kept'] + section['dropped']
+        for section in report['sections'].values()
+    ) == 3
@@ -0,0 +1,61 @@
+import asyncio
+
+import pytest
+
+from app.tools.search import CachedSearch, FakeSearchBackend
+
+
+def cached_search(latency: float = 0.05) -> CachedSearch:
+    return CachedSearch(
+        FakeSearchBackend(
+            ["attention is all you need", "recurrent networks"],
+            latency=latency,
+        )
+    )
+
+
+@pytest.mark.asyncio
+async def test_identical_queries_share_one_backend_call() -> None:
+    search = cached_search()
+
+    first, second = await asyncio.gather(
+        search.search("attention"), search.search("attention")
+    )
+    third = await search.search("attention")
+
+    assert first == second == third
+    assert first[0]["content"] == "attention is all you need"
+    assert search.backend.calls == 1
+    assert (search.stats.hits, search.stats.misses) == (2, 1)
+
+
+@pytest.mark.asyncio
+async def test_cancelled_leader_does_not_cancel_followers() -> None:
+    search = cached_search()
+
+    leader = asyncio.create_task(search.search("attention"))
+    await asyncio.sleep(0)
+    follower = asyncio.create_task(search.search("attention"))
+    await asyncio.sleep(0)
+    leader.cancel()
+
+    results = await follower
+    assert results[0]["content"] == "attention is all you need"
+    assert leader.cancelled()
+    assert search.backend.calls == 1
+    assert not search._in_flight
+
+
+@pytest.mark.asyncio
+async def test_backend_errors_are_not_cached() -> None:
+    search = cached_search(latency=0.0)
+    search.backend.documents = None
+
+    with pytest.raises(TypeError):
+        await search.search("attention")
+    search.backend.documents = ["attention please"]
+
+    assert (await search.search("attention"))[0]["content"] == (
+        "attention please"
+    )
+    assert search.backend.calls == 2
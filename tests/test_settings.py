@@ -0,0 +1,37 @@
+import pytest
+
+from app.settings import MongoSettings
+from app.settings import mongo
+
+
+class RecordingClient:
+
+    def __init__(self, connection_string: str, **kwargs) -> None:
+        self.connection_string: str = connection_string
+        self.closed: bool = False
+
+    def close(self) -> None:
+        self.closed = True
+
+
+@pytest.mark.asyncio
+async def test_least_recently_used_clients_are_closed(monkeypatch) -> None:
+    settings = MongoSettings()
+    await settings.close()
+    monkeypatch.setattr(mongo, 'AsyncIOMotorClient', RecordingClient)
+    monkeypatch.setattr(settings, 'max_clients', 2)
+
+    first = settings.client('mongodb://tenant-a:27017')
+    second = settings.client('mongodb://tenant-b:27017')
+    assert settings.client('mongodb://tenant-a:27017') is first
+    third = settings.client('mongodb://tenant-c:27017')
+
+    assert [first.closed, second.closed, third.closed] == [
+        False, True, False
+    ]
+    reopened = settings.client('mongodb://tenant-b:27017')
+    assert reopened is not second and not reopened.closed
+    assert first.closed
+
+    await settings.close()
+    assert reopened.closed and third.closed
@@ -0,0 +1,107 @@
+import asyncio
+from typing import AsyncIterator, Dict, List
+
+import pytest
+
+from app.patterns.swarm import (
+    SwarmNode,
+    SwarmScheduler,
+    group_semaphore,
+    research_swarm,
+)
+from app.patterns.swarm.orchestrators import SWARM_TOKENS_PER_MINUTE
+
+
+class EchoAgent:
+
+    def __init__(self) -> None:
+        self.response: Dict = {}
+
+    async def __call__(
+        self, chat_name: str, prompt: str, **kwargs
+    ) -> Dict:
+        await asyncio.sleep(0.01)
+        self.response = {'response': prompt.upper()}
+        return self.response
+
+    async def stream(
+        self, chat_name: str, prompt: str, **kwargs
+    ) -> AsyncIterator[str]:
+        for word in prompt.split():
+            yield word
+        self.response = {'response': prompt}
+
+
+class LimitedAgent(EchoAgent):
+
+    running: int = 0
+    peak: int = 0
+
+    async def __call__(
+        self, chat_name: str, prompt: str, **kwargs
+    ) -> Dict:
+        LimitedAgent.running += 1
+        LimitedAgent.peak = max(LimitedAgent.peak, LimitedAgent.running)
+        try:
+            return await super().__call__(chat_name, prompt, **kwargs)
+        finally:
+            LimitedAgent.running -= 1
+
+
+@pytest.fixture(autouse=True)
+def reset() -> None:
+    group_semaphore.cache_clear()
+    LimitedAgent.running = LimitedAgent.peak = 0
+
+
+def scheduler(prompt: str) -> SwarmScheduler:
+    return SwarmScheduler(
+        [
+            SwarmNode('first', LimitedAgent, prompt, group='echo'),
+            SwarmNode('second', LimitedAgent, prompt, group='echo'),
+            SwarmNode(
+                'merge', EchoAgent,
+                lambda upstream: ' '.join(
+                    result['response'] for result in upstream.values()
+                ),
+                depends_on=('first', 'second'),
+            ),
+        ],
+        limits={'echo': 1},
+        tokens_per_minute=0,
+    )
+
+
+@pytest.mark.asyncio
+async def test_group_limits_hold_across_runs() -> None:
+    runs = await asyncio.gather(scheduler('a').run(), scheduler('b').run())
+
+    assert LimitedAgent.peak == 1
+    assert [run.results['merge']['response'] for run in runs] == [
+        'A A', 'B B'
+    ]
+
+
+@pytest.mark.asyncio
+async def test_streamed_node_relays_its_chunks() -> None:
+    chunks: asyncio.Queue = asyncio.Queue()
+    swarm = await scheduler('hello world').run('merge', chunks)
+
+    received: List[str] = []
+    while (chunk := chunks.get_nowait()) is not None:
+        received.append(chunk)
+    assert received == ['HELLO', 'WORLD', 'HELLO', 'WORLD']
+    assert swarm.results['merge'] == {
+        'response': 'HELLO WORLD HELLO WORLD'
+    }
+    assert swarm.critical_path()[-1] == 'merge'
+
+
+def test_swarms_share_the_default_token_budget() -> None:
+    default = research_swarm('what is attention?')
+    unlimited = research_swarm('what is attention?', tokens_per_minute=0)
+
+    assert default.budget is not None
+    assert default.budget is SwarmScheduler([]).budget
+    assert default.budget.capacity == SWARM_TOKENS_PER_MINUTE
+    assert unlimited.budget is None
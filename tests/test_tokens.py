@@ -0,0 +1,18 @@
+from app.utils.tokens import PARALLEL_THRESHOLD, TokenCounter, encoder
+
+
+def test_batches_match_the_encoder_and_fill_the_cache() -> None:
+    counter = TokenCounter(maxsize=1_024)
+    texts = [
+        f"passage {i} about <|endoftext|> retrieval " * (i % 7 + 1)
+        for i in range(2 * PARALLEL_THRESHOLD)
+    ]
+
+    counts = counter.count_batch(texts + texts[:3])
+
+    assert counts == [
+        len(encoder().encode_ordinary(text)) for text in texts + texts[:3]
+    ]
+    assert counter.cache_info()['size'] == len(texts)
+    assert counter.count(texts[0]) == counts[0]
+    assert counter.hits == 1